@@ -0,0 +1 @@
+# Benchmarks for the controller's hot paths - see `python -m benchmarks --help`
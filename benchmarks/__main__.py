@@ -0,0 +1,51 @@
+# รัน benchmark ทั้งหมด
+#
+#   python -m benchmarks --quick
+#   python -m benchmarks --save v1.2
+#   python -m benchmarks --compare v1.2
+
+import argparse
+import sys
+import tempfile
+
+from . import bench_core
+from .harness import Report, compare
+
+QUICK = {'sizes': [1_000, 10_000], 'schedules': [10, 100, 1_000]}
+DEFAULT = {'sizes': [1_000, 10_000, 100_000], 'schedules': [10, 100, 1_000, 10_000]}
+FULL = {'sizes': [1_000, 10_000, 100_000, 1_000_000], 'schedules': [10, 100, 1_000, 10_000]}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks', description='Smart Irrigation benchmarks')
+    volume = parser.add_mutually_exclusive_group()
+    volume.add_argument('--quick', action='store_true', help='small data volumes only')
+    volume.add_argument('--full', action='store_true', help='include 1M history rows')
+    parser.add_argument('--no-gui', action='store_true', help='skip the offscreen Qt benchmarks')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='NAME', help='save results to benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare with a saved baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    volume = QUICK if args.quick else FULL if args.full else DEFAULT
+
+    report = Report()
+    bench_core.run(report, volume['sizes'], volume['schedules'], args.seed)
+    if not args.no_gui:
+        from . import bench_gui
+        with tempfile.TemporaryDirectory(prefix='smartwater-bench-gui-') as workdir:
+            # The window is only reasonable up to 100k rows of seeding time
+            bench_gui.run(report, [n for n in volume['sizes'] if n <= 100_000], workdir, args.seed)
+
+    if args.save:
+        print(f"\nSaved {report.save(args.save)}")
+    if args.compare:
+        return 1 if compare(report, args.compare) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+# Benchmark ส่วน core (ไม่ใช้ Qt)
+
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from smartwater import FleetManager, IrrigationController, LineFramer, Settings, WateringHistory
+from smartwater.export import FORMAT_COLUMNAR, FORMAT_CSV, HistoryExporter
+from smartwater.framing import FRAME_EVENT, FRAME_STATUS, BinaryFramer, encode_frame, status_payload
+from smartwater.history import FILTERS, SqliteHistory, filter_range
+from smartwater.persist import ScheduleStore, decode_schedules, encode_schedules
+from smartwater.planner import ZonePlanner, random_zones
+from smartwater.scheduler import DAYS, make_schedule
+
+MODES = ['Water Only', 'Water + Fertilizer']
+TRIGGERS = ['Manual', 'Auto']
+
+# Device replies seen on a real link
+REPLIES = ['LED1:1,LED2:0,PUMP:1', 'LED1:0,LED2:0,PUMP:0', 'OK', 'Auto stop - duration reached',
+           'Water valve ON', 'All OFF']
+
+
+def seed_history(history, rows, now, rng):
+    # `rows` sessions spread back from `now`, several a day for a big fleet
+    step = timedelta(days=3 * 365) / max(rows, 1)
+    for i in range(rows):
+        when = now - step * (rows - i)
+        duration = rng.randint(1, 60)
+        history.add(rng.choice(MODES), duration, rng.choice(TRIGGERS), 'Started',
+                    when=when, litres=duration * 2.0)
+
+
+def random_schedules(count, rng):
+    return [make_schedule(f"{rng.randrange(24):02d}:{rng.randrange(60):02d}",
+                          rng.randint(1, 30), rng.sample(DAYS, rng.randint(1, 7)),
+                          rng.choice(MODES), repeat=rng.random() < 0.9)
+            for _ in range(count)]
+
+
+def bench_schedules(report, counts, rng):
+    start = datetime.now().replace(second=0, microsecond=0)
+    for count in counts:
+        settings = Settings(schedules=random_schedules(count, rng))
+        t = time.perf_counter()
+        controller = IrrigationController(FleetManager(), settings, history=WateringHistory(),
+                                          on_log=lambda message, level="info": None)
+        report.record('schedules.load', [time.perf_counter() - t], schedules=count)
+
+        # One simulated day of checks at the minute resolution a timer would use
+        latencies = []
+        now = start
+        for _ in range(24 * 60):
+            t = time.perf_counter()
+            controller.check_schedules(now)
+            controller.next_check_delay(now)
+            latencies.append(time.perf_counter() - t)
+            now += timedelta(minutes=1)
+        report.record('schedules.check', latencies, schedules=count)
+
+
+def bench_schedule_store(report, counts, rng, workdir):
+    # Startup cost of the saved schedule list, against the JSON it replaced
+    for count in counts:
+        schedules = random_schedules(count, rng)
+        data = encode_schedules(schedules)
+        text = json.dumps(schedules)
+        report.measure('schedules.decode', lambda: decode_schedules(data), repeat=5,
+                       schedules=count, format='columnar')
+        report.measure('schedules.decode', lambda: json.loads(text), repeat=5,
+                       schedules=count, format='json')
+
+        # A burst of edits comes out as one write
+        store = ScheduleStore(os.path.join(workdir, f'schedules-{count}.bin'), delay=0.05)
+        latencies = []
+        for _ in range(100):
+            t = time.perf_counter()
+            store.save(schedules)
+            latencies.append(time.perf_counter() - t)
+        store.close()
+        report.record('schedules.save', latencies, schedules=count, writes=store.writes)
+
+
+def bench_planner(report, counts=(1000, 5000), pump_flow=40):
+    windows = {'all week': None,
+               'mornings+evenings': [(DAYS, '05:00', '09:00'), (DAYS, '17:00', '20:00')]}
+    for count in counts:
+        zones = random_zones(count, pump_flow)
+        for name, window in windows.items():
+            def plan(window=window):
+                ZonePlanner(pump_flow, window).plan(zones)
+            report.measure('planner.plan', plan, repeat=3, zones=count, windows=name)
+
+        # Insert-time conflict checks against a full schedule list
+        schedules = random_schedules(count, random.Random(count))
+        settings = Settings(schedules=schedules)
+        controller = IrrigationController(FleetManager(), settings, history=WateringHistory(),
+                                          on_log=lambda message, level="info": None)
+        probe = schedules[: min(200, count)]
+        report.measure('schedules.conflicts',
+                       lambda: [controller.scheduler.conflicts(s) for s in probe],
+                       repeat=5, ops_per_call=len(probe), schedules=count)
+
+
+def bench_history(report, sizes, rng, workdir):
+    now = datetime.now()
+    for rows in sizes:
+        path = os.path.join(workdir, f'history-{rows}.db')
+
+        history = SqliteHistory(path)
+        t = time.perf_counter()
+        seed_history(history, rows, now, rng)
+        history.flush()
+        report.record('history.insert', [time.perf_counter() - t], ops=rows, rows=rows)
+        history.close()
+
+        # Reopening rebuilds the statistics rollup from the daily totals
+        t = time.perf_counter()
+        history = SqliteHistory(path)
+        report.record('history.open', [time.perf_counter() - t], rows=rows)
+
+        ranges = [(name, filter_range(name, now)) for name in FILTERS]
+        ranges.append(('90 days', (now - timedelta(days=90), now)))
+        for name, (start, end) in ranges:
+            # What a view pays to show a filter: the range plus its first screen
+            def show(start=start, end=end):
+                view = history.between(start, end)
+                for i in range(min(len(view), 40)):
+                    view[i]
+            report.measure('history.filter', show, repeat=20, rows=rows, range=name)
+
+        report.measure('history.statistics', lambda: history.statistics(now), repeat=200, rows=rows)
+
+        for fmt in (FORMAT_CSV, FORMAT_COLUMNAR):
+            target = os.path.join(workdir, f'export-{rows}.{fmt}')
+            exporter = HistoryExporter(history.between(), target, fmt)
+            t = time.perf_counter()
+            exporter.run()
+            report.record('history.export', [time.perf_counter() - t], ops=rows, rows=rows, format=fmt)
+            os.remove(target)
+
+        history.close()
+
+        memory = WateringHistory()
+        seed_history(memory, rows, now, rng)
+        start, end = filter_range('This Month', now)
+        report.measure('memory_history.filter', lambda: memory.between(start, end),
+                       repeat=200, rows=rows)
+
+
+def bursty_stream(rng, lines):
+    data = ''.join(rng.choice(REPLIES) + '\n' for _ in range(lines)).encode()
+    # Mostly small reads with the odd large burst, as a busy serial link gives
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.choice([1, 7, 32, 64, 512, 4096])
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return data, chunks
+
+
+def bench_framing(report, rng, lines=200_000):
+    data, chunks = bursty_stream(rng, lines)
+
+    def run():
+        framer = LineFramer()
+        count = 0
+        for chunk in chunks:
+            count += len(framer.feed(chunk))
+        assert count == lines
+
+    result = report.measure('framing.feed', run, repeat=5, ops_per_call=lines, lines=lines)
+    result['mb_per_s'] = len(data) * result['ops_per_s'] / lines / 1e6
+
+    # The same traffic as binary frames: status answers and event codes
+    frames = [encode_frame(FRAME_STATUS, i, status_payload(1, 0, 1, 1, 'water', 0)) if i % 2 else
+              encode_frame(FRAME_EVENT, i, bytes((1,))) for i in range(256)]
+    data = b''.join(frames[i % 256] for i in range(lines))
+    chunk_sizes = [len(c) for c in chunks]
+    binary_chunks, pos = [], 0
+    while pos < len(data):
+        size = chunk_sizes[len(binary_chunks) % len(chunk_sizes)]
+        binary_chunks.append(data[pos:pos + size])
+        pos += size
+
+    def run_binary():
+        framer = BinaryFramer()
+        count = 0
+        for chunk in binary_chunks:
+            count += len(framer.feed(chunk))
+        assert count == lines
+
+    result = report.measure('framing.binary_feed', run_binary, repeat=5, ops_per_call=lines, lines=lines)
+    result['mb_per_s'] = len(data) * result['ops_per_s'] / lines / 1e6
+
+
+def bench_fleet(report, devices=(1, 16), bursts=50, burst_lines=200):
+    # Local TCP devices send timestamped bursts; latency is send -> on_lines
+    for count in devices:
+        servers = [_BurstServer(bursts, burst_lines) for _ in range(count)]
+        latencies = []
+        received = threading.Semaphore(0)
+        lock = threading.Lock()
+
+        def on_lines(device_id, lines):
+            now = time.perf_counter_ns()
+            with lock:
+                for line in lines:
+                    if line.startswith('T'):
+                        latencies.append((now - int(line[1:])) / 1e9)
+                        received.release()
+
+        fleet = FleetManager(on_lines=on_lines)
+        fleet.start()
+        t = time.perf_counter()
+        for server in servers:
+            fleet.add_device({'type': 'wifi', 'ip': '127.0.0.1', 'port': server.port})
+        total = count * bursts * burst_lines
+        for _ in range(total):
+            if not received.acquire(timeout=30):
+                break
+        elapsed = time.perf_counter() - t
+        fleet.stop()
+        for server in servers:
+            server.close()
+
+        report.record('fleet.read', latencies, elapsed=elapsed, devices=count, lines=total)
+
+
+class _BurstServer:
+    def __init__(self, bursts, burst_lines, gap=0.01):
+        self.bursts = bursts
+        self.burst_lines = burst_lines
+        self.gap = gap
+        self._sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        try:
+            conn, _ = self._sock.accept()
+        except OSError:
+            return
+        with conn:
+            for _ in range(self.bursts):
+                stamp = time.perf_counter_ns
+                conn.sendall(''.join(f'T{stamp()}\n' for _ in range(self.burst_lines)).encode())
+                time.sleep(self.gap)
+            # Stay up until the client leaves
+            try:
+                while conn.recv(4096):
+                    pass
+            except OSError:
+                pass
+
+    def close(self):
+        self._sock.close()
+
+
+def run(report, sizes, schedule_counts, seed=1):
+    rng = random.Random(seed)
+    bench_schedules(report, schedule_counts, rng)
+    bench_planner(report)
+    with tempfile.TemporaryDirectory(prefix='smartwater-bench-') as workdir:
+        bench_schedule_store(report, schedule_counts, rng, workdir)
+        bench_history(report, sizes, rng, workdir)
+    bench_framing(report, rng)
+    bench_fleet(report)
@@ -0,0 +1,79 @@
+# Benchmark ส่วน GUI (รันแบบ offscreen)
+
+import os
+import random
+import time
+from datetime import datetime
+
+
+def run(report, sizes, workdir, seed=1):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    from PyQt6.QtCore import QSettings, QStandardPaths
+    from PyQt6.QtWidgets import QApplication
+
+    # Keep the benchmark's history and settings out of the user's own
+    QStandardPaths.setTestModeEnabled(True)
+    QSettings.setPath(QSettings.Format.NativeFormat, QSettings.Scope.UserScope, workdir)
+
+    import main
+    from .bench_core import seed_history
+
+    app = QApplication.instance() or QApplication([])
+    rng = random.Random(seed)
+
+    # Cold start to the first frame, building one tab or all of them
+    for lazy in (True, False):
+        latencies = []
+        for _ in range(5):
+            t = time.perf_counter()
+            window = main.MainWindow(lazy_tabs=lazy)
+            window.show()
+            app.processEvents()
+            latencies.append(time.perf_counter() - t)
+            close_window(app, window)
+        report.record('gui.startup', latencies, tabs='lazy' if lazy else 'eager')
+
+    for rows in sizes:
+        window = main.MainWindow(lazy_tabs=False)
+        history = window.controller.history
+        history.clear()
+        window.show()
+        app.processEvents()
+
+        seed_history(history, rows, datetime.now(), rng)
+        history.flush()
+
+        for name in ['All', 'Today', 'This Week', 'This Month']:
+            def show(name=name):
+                window.history_filter.blockSignals(True)
+                window.history_filter.setCurrentText(name)
+                window.history_filter.blockSignals(False)
+                window.update_history_table()
+                app.processEvents()
+            report.measure('gui.update_history_table', show, repeat=10, rows=rows, range=name)
+
+        report.measure('gui.update_statistics', window.update_statistics, repeat=200, rows=rows)
+        report.measure('gui.add_to_history',
+                       lambda: (window.controller.add_to_history('Water Only', 5, 'Manual', 'Started'),
+                                app.processEvents()),
+                       repeat=100, rows=rows)
+
+        def log_burst():
+            for i in range(1000):
+                window.log_message(f"Received: LED1:{i % 2},LED2:0,PUMP:1")
+            window.flush_log()
+            app.processEvents()
+        report.measure('gui.log_burst', log_burst, repeat=10, ops_per_call=1000, rows=rows)
+
+        history.clear()
+        close_window(app, window)
+
+
+def close_window(app, window):
+    window.ticks.cancel('clock')
+    window.schedule_store.close()
+    window.controller.history.close()
+    window.fleet.stop()
+    window.deleteLater()
+    app.processEvents()
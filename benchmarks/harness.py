@@ -0,0 +1,125 @@
+# ตัวช่วยจับเวลาและบันทึกผล benchmark
+#
+# Every measurement becomes one result row: a name, the parameters that
+# describe the data volume, throughput and latency percentiles. Reports are
+# saved as JSON under benchmarks/baselines/ and compared row by row
+# (matched on name + parameters) against an earlier run.
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# A p50 latency or throughput this much worse than the baseline is a regression
+REGRESSION_THRESHOLD = 0.20
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(BASELINE_DIR)).stdout.strip()
+    except OSError:
+        return ''
+
+
+class Report:
+    def __init__(self):
+        self.results = []
+
+    def record(self, name, latencies, ops=None, elapsed=None, **params):
+        # latencies in seconds, one per operation unless `ops` says how many
+        # operations they cover in total; `elapsed` is the wall time when the
+        # operations overlapped
+        values = sorted(latencies)
+        total = sum(values) if elapsed is None else elapsed
+        ops = len(values) if ops is None else ops
+        result = {
+            'name': name,
+            'params': params,
+            'ops': ops,
+            'ops_per_s': ops / total if total else 0.0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': (values[-1] if values else 0.0) * 1000
+        }
+        self.results.append(result)
+        print(format_result(result), flush=True)
+        return result
+
+    def measure(self, name, fn, repeat=20, ops_per_call=1, **params):
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+        return self.record(name, latencies, ops=repeat * ops_per_call, **params)
+
+    def as_dict(self):
+        return {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'machine': platform.machine()
+            },
+            'results': self.results
+        }
+
+    def save(self, name):
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = baseline_path(name)
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        return path
+
+
+def baseline_path(name):
+    return name if name.endswith('.json') else os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def result_key(result):
+    return result['name'], tuple(sorted(result['params'].items()))
+
+
+def format_params(params):
+    return ' '.join(f'{k}={v}' for k, v in params.items())
+
+
+def format_result(result):
+    return (f"{result['name']:<28} {format_params(result['params']):<34} "
+            f"{result['ops_per_s']:>12.1f}/s  p50 {result['p50_ms']:>9.3f} ms  "
+            f"p95 {result['p95_ms']:>9.3f}  p99 {result['p99_ms']:>9.3f}  max {result['max_ms']:>9.3f}")
+
+
+def compare(report, name, threshold=REGRESSION_THRESHOLD):
+    # Print current vs baseline; returns the number of regressions
+    with open(baseline_path(name)) as f:
+        baseline = {result_key(r): r for r in json.load(f)['results']}
+
+    regressions = 0
+    print(f"\nCompared with {name}:")
+    for result in report.results:
+        old = baseline.get(result_key(result))
+        if old is None:
+            continue
+        latency = result['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 1.0
+        throughput = old['ops_per_s'] / result['ops_per_s'] if result['ops_per_s'] else 1.0
+        worse = max(latency, throughput) > 1 + threshold
+        regressions += worse
+        print(f"{'REGRESSION' if worse else 'ok':<10} {result['name']:<28} "
+              f"{format_params(result['params']):<34} p50 x{latency:.2f}  ops/s x{1 / throughput:.2f}")
+    return regressions
@@ -1,84 +1,86 @@
 import sys
 import time
-import subprocess
-import re
-import serial
-import socket
-import threading
-import json
+
+# Everything from here on counts towards the "imports" startup phase
+STARTED = time.perf_counter()
+
+import argparse
+import math
 import os
 from datetime import datetime, timedelta
-from PyQt6 import uic
 from PyQt6.QtWidgets import (QMainWindow, QApplication, QVBoxLayout, QRadioButton, 
-                            QLabel, QTimeEdit, QListWidget, QPushButton, QWidget,
+                            QLabel, QTimeEdit, QPushButton, QWidget,
                             QGroupBox, QHBoxLayout, QComboBox, QSpinBox, QCheckBox,
                             QTextEdit, QMessageBox, QProgressBar, QGridLayout,
-                            QTabWidget, QTableWidget, QTableWidgetItem, QLineEdit,
+                            QTabWidget, QTableWidget, QTableWidgetItem, QTableView, QLineEdit,
+                            QHeaderView, QDateEdit, QProgressDialog,
                             QFileDialog, QDialog, QDialogButtonBox)
-from PyQt6.QtCore import QThread, pyqtSignal, QTime, QTimer, Qt, QDateTime, QSettings
-from PyQt6.QtGui import QPixmap, QFont, QPalette, QColor, QIcon
+from PyQt6.QtCore import (QObject, pyqtSignal, QTime, QTimer, Qt, QDate, QDateTime, QSettings,
+                          QStandardPaths, QAbstractTableModel, QModelIndex, QEvent)
+from PyQt6.QtGui import QColor, QTextCursor, QTextCharFormat
 
-# Thread สำหรับการเชื่อมต่อ WiFi
-class WiFiConnection(QThread):
-    status_update = pyqtSignal(str)
-    connection_result = pyqtSignal(bool, str)
-    
-    def __init__(self, ip, port=80):
-        super().__init__()
-        self.ip = ip
-        self.port = port
-        self.socket = None
-        
-    def run(self):
-        try:
-            self.status_update.emit("Connecting to ESP32...")
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(5)
-            self.socket.connect((self.ip, self.port))
-            self.connection_result.emit(True, f"Connected to {self.ip}:{self.port}")
-        except Exception as e:
-            self.connection_result.emit(False, f"Connection failed: {str(e)}")
+from smartwater import FleetManager, IrrigationController, fleet, make_schedule
+from smartwater import settings as core_settings
+from smartwater.controller import WATER_ONLY
+from smartwater.framing import FRAMING_AUTO, FRAMING_TEXT
+from smartwater.history import SqliteHistory, filter_range, in_range
+from smartwater.logbuffer import LogBuffer
+from smartwater.metrics import METRICS_PORT, Histogram, MetricsRegistry, MetricsServer, register_core
+from smartwater.persist import ScheduleStore
+from smartwater.status import StatusPoller
+from smartwater.ticker import TickService
+from smartwater.timing import PhaseTimer
 
-# Thread สำหรับ Monitor Serial/WiFi
-class DeviceMonitor(QThread):
-    data_received = pyqtSignal(str)
-    
-    def __init__(self, device):
-        super().__init__()
-        self.device = device
-        self.running = False
-        
-    def run(self):
-        self.running = True
-        while self.running:
-            try:
-                if isinstance(self.device, serial.Serial):
-                    if self.device.in_waiting:
-                        data = self.device.readline().decode('utf-8').strip()
-                        if data:
-                            self.data_received.emit(data)
-                elif isinstance(self.device, socket.socket):
-                    self.device.settimeout(0.1)
-                    try:
-                        data = self.device.recv(1024).decode('utf-8').strip()
-                        if data:
-                            self.data_received.emit(data)
-                    except socket.timeout:
-                        pass
-            except Exception as e:
-                print(f"Monitor error: {e}")
-            time.sleep(0.1)
-            
-    def stop(self):
-        self.running = False
+# System log: lines kept in the widget, and the fastest it is repainted
+LOG_MAX_BLOCKS = 500
+LOG_FLUSH_INTERVAL = 0.05
+# How often the GUI loop is checked for stalls and the diagnostics redrawn
+STALL_PROBE_INTERVAL = 0.25
+DIAGNOSTICS_INTERVAL = 1.0
+
+# Tabs in display order; with lazy tabs each is built when first shown
+TABS = [('manual', "🚿 Manual Control"), ('auto', "⏰ Auto Schedule"),
+        ('history', "📊 History"), ('settings', "⚙️ Settings")]
+
+def format_seconds(value):
+    if value is None:
+        return "--"
+    return f"{value * 1000:.1f} ms" if value < 1 else f"{value:.2f} s"
+
+# ส่งต่อ callback จาก FleetManager (fleet thread) เข้าสู่ GUI thread
+class FleetBridge(QObject):
+    lines_received = pyqtSignal(str, list, float)
+    state_changed = pyqtSignal(str, str, str)
+    reply_latency = pyqtSignal(str, float)
+    status_received = pyqtSignal(str, object)
+    command_failed = pyqtSignal(str, str, str)
+
+# ส่งต่อความคืบหน้าการ export (worker thread) เข้าสู่ GUI thread
+class ExportBridge(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, str)
+
+# ส่งข้อความ log จาก thread เบื้องหลัง (ตัวเขียนไฟล์) เข้าสู่ GUI thread
+class LogBridge(QObject):
+    message = pyqtSignal(str, str)
 
 # Dialog สำหรับตั้งค่าการเชื่อมต่อ
 class ConnectionDialog(QDialog):
-    def __init__(self, parent=None):
+    ports_changed = pyqtSignal(list, list)
+    port_probed = pyqtSignal(str, bool)
+    
+    def __init__(self, parent=None, in_use=(), on_error=None):
         super().__init__(parent)
         self.setWindowTitle("Connection Settings")
         self.setModal(True)
         
+        # pyserial's port listing is only needed once the dialog opens
+        from smartwater.ports import PortWatcher, default_scanner
+        self.scanner = default_scanner
+        # Serial ports the app already has (or is connecting to) are never
+        # opened by a probe
+        self.in_use = set(in_use)
+        
         layout = QVBoxLayout()
         
         # Connection Type
@@ -97,11 +99,12 @@ class ConnectionDialog(QDialog):
         serial_layout = QGridLayout()
         serial_layout.addWidget(QLabel("Port:"), 0, 0)
         self.port_combo = QComboBox()
+        self.port_combo.setMinimumWidth(220)
         self.refresh_ports()
         serial_layout.addWidget(self.port_combo, 0, 1)
         
         self.refresh_btn = QPushButton("Refresh")
-        self.refresh_btn.clicked.connect(self.refresh_ports)
+        self.refresh_btn.clicked.connect(lambda: self.refresh_ports(probe=True))
         serial_layout.addWidget(self.refresh_btn, 0, 2)
         
         serial_layout.addWidget(QLabel("Baudrate:"), 1, 0)
@@ -130,6 +133,11 @@ class ConnectionDialog(QDialog):
         self.wifi_group.setEnabled(False)
         layout.addWidget(self.wifi_group)
         
+        # Older firmware ignores the offer and the link stays on text lines
+        self.binary_checkbox = QCheckBox("Use binary framing if the firmware supports it")
+        self.binary_checkbox.setChecked(True)
+        layout.addWidget(self.binary_checkbox)
+        
         # Connect radio buttons
         self.serial_radio.toggled.connect(self.on_type_changed)
         self.wifi_radio.toggled.connect(self.on_type_changed)
@@ -143,45 +151,158 @@ class ConnectionDialog(QDialog):
         
         self.setLayout(layout)
         
+        # Follow adapters being plugged in / pulled out while the dialog is open
+        self.ports_changed.connect(self.on_ports_changed)
+        self.port_probed.connect(self.on_port_probed)
+        self.port_watcher = PortWatcher(self.ports_changed.emit, scanner=self.scanner,
+                                        on_error=on_error)
+        self.port_watcher.start(initial=self.ports)
+        
+    def done(self, result):
+        self.port_watcher.stop()
+        super().done(result)
+        
     def on_type_changed(self):
         self.serial_group.setEnabled(self.serial_radio.isChecked())
         self.wifi_group.setEnabled(self.wifi_radio.isChecked())
         
-    def refresh_ports(self):
+    def refresh_ports(self, probe=False):
+        # Listing never opens a port; probing (Refresh) runs on the worker pool
+        self.ports = self.scanner.ports(refresh=probe)
         self.port_combo.clear()
-        if sys.platform.startswith('win'):
-            ports = ['COM%s' % (i + 1) for i in range(256)]
-        else:
-            ports = ['/dev/ttyUSB%s' % i for i in range(10)]
-            ports += ['/dev/ttyACM%s' % i for i in range(10)]
+        for port in self.ports:
+            self.add_port_item(port)
             
-        for port in ports:
-            try:
-                s = serial.Serial(port)
-                s.close()
-                self.port_combo.addItem(port)
-            except:
-                pass
-                
         if self.port_combo.count() == 0:
             self.port_combo.addItem("No ports found")
+        elif probe:
+            self.scanner.probe([p.device for p in self.ports], self.port_probed.emit,
+                               refresh=True, in_use=self.in_use)
+            
+    def port_label(self, port, available=None):
+        label = f"{port.device} - {port.description}" if port.description else port.device
+        if available is False:
+            label += " (busy)"
+        return label
+        
+    def add_port_item(self, port):
+        available = self.scanner.cached_probe(port.device)
+        self.port_combo.addItem(self.port_label(port, available), port.device)
+        
+    def on_ports_changed(self, added, removed):
+        for port in removed:
+            index = self.port_combo.findData(port.device)
+            if index >= 0:
+                self.port_combo.removeItem(index)
+            self.ports = [p for p in self.ports if p.device != port.device]
+            
+        if added and not self.ports:
+            self.port_combo.clear()  # drop the "No ports found" placeholder
+        for port in added:
+            self.ports.append(port)
+            self.add_port_item(port)
+            
+        if self.port_combo.count() == 0:
+            self.port_combo.addItem("No ports found")
+            
+    def on_port_probed(self, device, available):
+        index = self.port_combo.findData(device)
+        port = next((p for p in self.ports if p.device == device), None)
+        if index >= 0 and port is not None:
+            self.port_combo.setItemText(index, self.port_label(port, available))
             
     def get_connection_info(self):
+        framing = FRAMING_AUTO if self.binary_checkbox.isChecked() else FRAMING_TEXT
         if self.serial_radio.isChecked():
             return {
                 'type': 'serial',
-                'port': self.port_combo.currentText(),
-                'baudrate': int(self.baudrate_combo.currentText())
+                'port': self.port_combo.currentData() or self.port_combo.currentText(),
+                'baudrate': int(self.baudrate_combo.currentText()),
+                'framing': framing
             }
         else:
             return {
                 'type': 'wifi',
                 'ip': self.ip_input.text(),
-                'port': int(self.port_input.text())
+                'port': int(self.port_input.text()),
+                'framing': framing
             }
 
+# Model ของตารางประวัติ - QTableView จะขอเฉพาะแถวที่มองเห็น
+class HistoryTableModel(QAbstractTableModel):
+    HEADERS = ['Date & Time', 'Mode', 'Duration', 'Status', 'Notes']
+    CACHE_LIMIT = 4096
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # A view from the history plus rows added since it was taken
+        self.entries = []
+        self._appended = []
+        self._rows = {}
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries) + len(self._appended)
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+        
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+        
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        return self.format_row(index.row())[index.column()]
+        
+    def format_row(self, row):
+        # Cells are formatted the first time a row is painted
+        cells = self._rows.get(row)
+        if cells is None:
+            if len(self._rows) >= self.CACHE_LIMIT:
+                self._rows.clear()
+            if row < len(self.entries):
+                entry = self.entries[row]
+            else:
+                entry = self._appended[row - len(self.entries)]
+            cells = (
+                entry['datetime'].strftime("%Y-%m-%d %H:%M"),
+                entry['mode'],
+                f"{entry['duration']} min",
+                entry['status'],
+                entry['notes']
+            )
+            self._rows[row] = cells
+        return cells
+        
+    def set_entries(self, entries):
+        self.beginResetModel()
+        # Kept as given (no copy); appends go to our own list
+        self.entries = entries
+        self._appended = []
+        self._rows.clear()
+        self.endResetModel()
+        
+    def append_entry(self, entry):
+        row = self.rowCount()
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._appended.append(entry)
+        self.endInsertRows()
+        
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, lazy_tabs=True, startup_timing=False, startup=None, profile_seconds=None):
+        # Phases of the start, reported once the first frame is up
+        self.startup = startup or PhaseTimer()
+        self.startup_timing = startup_timing
+        self.startup_reported = False
+        self.lazy_tabs = lazy_tabs
+        
+        # Running profile capture and the last one's results
+        self.profiler = None
+        self.profile_report = None
+        self.print_profile = False
+        
         super().__init__()
         self.setWindowTitle('Smart Irrigation Control System')
         self.setGeometry(100, 100, 1000, 700)
@@ -189,35 +310,109 @@ class MainWindow(QMainWindow):
         # Settings
         self.settings = QSettings('SmartIrrigation', 'Settings')
         
-        # Device connection
-        self.device = None
-        self.device_monitor = None
-        self.connection_type = None
+        # One timer drives the clock, watering progress, schedule checks and
+        # log flushes; it stops when none of them needs a tick
+        self.tick_timer = QTimer()
+        self.tick_timer.setSingleShot(True)
+        self.tick_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.tick_timer.timeout.connect(self.run_ticks)
+        self.ticks = TickService(on_change=self.arm_tick_timer)
+        
+        # System log - messages land in a ring buffer and reach the widget
+        # in one batch per flush interval
+        self.log_buffer = LogBuffer()
+        self.log_seq = 0
+        self.log_formats = {}
+        for level, color in (("warning", "orange"), ("error", "red")):
+            self.log_formats[level] = QTextCharFormat()
+            self.log_formats[level].setForeground(QColor(color))
+        
+        # Device connections - every controller lives in one asyncio fleet,
+        # commands go to the device selected in the toolbar
+        self.fleet_bridge = FleetBridge()
+        self.fleet_bridge.lines_received.connect(self.on_device_lines)
+        self.fleet_bridge.state_changed.connect(self.on_device_state)
+        self.fleet_bridge.reply_latency.connect(self.on_reply_latency)
+        self.fleet_bridge.command_failed.connect(self.on_command_failed)
+        self.fleet = FleetManager(
+            on_lines=lambda device_id, lines: self.fleet_bridge.lines_received.emit(
+                device_id, lines, time.monotonic()),
+            on_state=self.fleet_bridge.state_changed.emit,
+            on_latency=self.fleet_bridge.reply_latency.emit,
+            on_command_failed=self.fleet_bridge.command_failed.emit
+        )
+        self.fleet.start()
+        
+        # WiFi devices' /status, polled on the fleet loop and cached for
+        # every view and schedule check
+        self.fleet_bridge.status_received.connect(self.on_device_status)
+        self.status_poller = StatusPoller(self.fleet, on_status=self.fleet_bridge.status_received.emit)
+        self.status_poller.start()
+        self.startup.mark('fleet')
+        
+        # Schedules are saved behind the UI's back, a moment after each change
+        self.log_bridge = LogBridge()
+        self.log_bridge.message.connect(self.log_message)
+        self.schedule_store = ScheduleStore(self.data_path('schedules.bin'),
+                                            on_error=self.log_error)
+        
+        # Core engine - watering sessions, schedules and history
+        self.controller = IrrigationController(
+            self.fleet,
+            history=SqliteHistory(self.data_path('history.db'), on_error=self.log_error),
+            status=self.status_poller,
+            schedule_store=self.schedule_store,
+            on_log=self.log_message,
+            on_watering_started=self.on_watering_started,
+            on_watering_stopped=self.on_watering_stopped,
+            on_history_changed=self.on_history_changed,
+            on_schedules_changed=self.on_schedules_changed,
+            on_hardware_changed=self.on_hardware_changed
+        )
         
-        # System state
-        self.is_running = False
-        self.auto_mode_enabled = True
-        self.schedules = []
-        self.watering_log = []
+        # Running history export, if any
+        self.exporter = None
+        self.export_progress = None
+        
+        # Latency and lag histograms, served to Prometheus on request and
+        # summarised in the Settings tab
+        self.metrics = register_core(MetricsRegistry(), self.controller)
+        self.gui_stall = Histogram()
+        self.metrics.histogram('smartwater_gui_stall_seconds',
+                               'How late the GUI event loop ran a timer', self.gui_stall)
+        self.metrics_server = None
+        self.stall_due = 0.0
+        self.startup.mark('controller')
         
         # Create main UI
         self.setup_ui()
-        
-        # Timers
-        self.clock_timer = QTimer()
-        self.clock_timer.timeout.connect(self.update_clock)
-        self.clock_timer.start(1000)
-        
-        self.auto_timer = QTimer()
-        self.auto_timer.timeout.connect(self.check_schedules)
-        self.auto_timer.start(1000)
-        
-        # Progress timer for manual watering
-        self.progress_timer = QTimer()
-        self.progress_timer.timeout.connect(self.update_progress)
+        self.startup.mark('window')
         
         # Load saved settings
         self.load_settings()
+        self.apply_metrics_server()
+        self.startup.mark('settings')
+        
+        # Only the visible tab is built now, unless lazy tabs are off
+        if self.lazy_tabs:
+            self.build_tab(self.tab_widget.currentIndex())
+        else:
+            for index in range(self.tab_widget.count()):
+                self.build_tab(index)
+        self.startup.mark('tabs')
+        
+        # A capture asked for on the command line starts with the window
+        if profile_seconds:
+            self.print_profile = True
+            self.start_profiling(profile_seconds)
+            
+    def data_path(self, name):
+        data_dir = os.path.join(
+            QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericDataLocation),
+            'SmartIrrigation'
+        )
+        os.makedirs(data_dir, exist_ok=True)
+        return os.path.join(data_dir, name)
         
     def setup_ui(self):
         # Central widget
@@ -245,11 +440,30 @@ class MainWindow(QMainWindow):
         self.connect_btn.clicked.connect(self.show_connection_dialog)
         toolbar_layout.addWidget(self.connect_btn)
         
+        # Active device selection
+        self.device_combo = QComboBox()
+        self.device_combo.setMinimumWidth(160)
+        self.device_combo.currentTextChanged.connect(self.set_active_device)
+        toolbar_layout.addWidget(self.device_combo)
+        
+        self.disconnect_btn = QPushButton("Disconnect")
+        self.disconnect_btn.clicked.connect(self.disconnect_device)
+        self.disconnect_btn.setEnabled(False)
+        toolbar_layout.addWidget(self.disconnect_btn)
+        
         # Current time
         self.time_label = QLabel()
         self.time_label.setStyleSheet("font-size: 14px; font-weight: bold;")
         toolbar_layout.addWidget(self.time_label)
         
+        # Device reply latency
+        self.latency_label = QLabel("Latency: -- ms")
+        toolbar_layout.addWidget(self.latency_label)
+        
+        # Valves and pump as the device reports them (WiFi only)
+        self.hardware_label = QLabel("")
+        toolbar_layout.addWidget(self.hardware_label)
+        
         toolbar_layout.addStretch()
         
         # System status
@@ -283,21 +497,22 @@ class MainWindow(QMainWindow):
             }
         """)
         
-        # Manual Control Tab
-        manual_tab = self.create_manual_tab()
-        self.tab_widget.addTab(manual_tab, "🚿 Manual Control")
-        
-        # Auto Schedule Tab
-        auto_tab = self.create_auto_tab()
-        self.tab_widget.addTab(auto_tab, "⏰ Auto Schedule")
-        
-        # History Tab
-        history_tab = self.create_history_tab()
-        self.tab_widget.addTab(history_tab, "📊 History")
-        
-        # Settings Tab
-        settings_tab = self.create_settings_tab()
-        self.tab_widget.addTab(settings_tab, "⚙️ Settings")
+        # Every tab starts as an empty page; build_tab() fills it in and
+        # brings it up to date with the controller
+        self.tab_builders = {
+            'manual': (self.create_manual_tab, self.update_manual_controls),
+            'auto': (self.create_auto_tab, self.update_schedule_table),
+            'history': (self.create_history_tab, self.on_history_changed),
+            'settings': (self.create_settings_tab, self.update_settings_fields)
+        }
+        self.built_tabs = set()
+        for name, title in TABS:
+            page = QWidget()
+            page_layout = QVBoxLayout(page)
+            page_layout.setContentsMargins(0, 0, 0, 0)
+            self.tab_widget.addTab(page, title)
+        self.tab_widget.currentChanged.connect(self.build_tab)
+        self.tab_widget.currentChanged.connect(self.update_diagnostics_ticks)
         
         main_layout.addWidget(self.tab_widget)
         
@@ -306,8 +521,21 @@ class MainWindow(QMainWindow):
         self.log_display = QTextEdit()
         self.log_display.setReadOnly(True)
         self.log_display.setMaximumHeight(100)
+        self.log_display.document().setMaximumBlockCount(LOG_MAX_BLOCKS)
         self.status_bar.addPermanentWidget(self.log_display, 1)
         
+    def build_tab(self, index):
+        if not 0 <= index < len(TABS) or TABS[index][0] in self.built_tabs:
+            return
+        name = TABS[index][0]
+        started = time.perf_counter()
+        create, refresh = self.tab_builders[name]
+        self.tab_widget.widget(index).layout().addWidget(create())
+        self.built_tabs.add(name)
+        refresh()
+        if self.startup_timing:
+            self.log_message(f"Built {name} tab in {(time.perf_counter() - started) * 1000:.0f} ms")
+            
     def create_manual_tab(self):
         widget = QWidget()
         layout = QVBoxLayout()
@@ -332,12 +560,12 @@ class MainWindow(QMainWindow):
         duration_layout.addWidget(QLabel("Duration (minutes):"), 0, 0)
         self.duration_spin = QSpinBox()
         self.duration_spin.setRange(1, 120)
-        self.duration_spin.setValue(10)
+        self.duration_spin.setValue(self.controller.settings.default_duration)
         self.duration_spin.setSuffix(" min")
         duration_layout.addWidget(self.duration_spin, 0, 1)
         
         duration_layout.addWidget(QLabel("Water Amount:"), 1, 0)
-        self.water_amount_label = QLabel("~10 Liters")
+        self.water_amount_label = QLabel(f"~{self.duration_spin.value()} Liters")
         duration_layout.addWidget(self.water_amount_label, 1, 1)
         
         # Update water amount when duration changes
@@ -539,14 +767,28 @@ class MainWindow(QMainWindow):
         control_layout = QHBoxLayout()
         
         self.history_filter = QComboBox()
-        self.history_filter.addItems(['All', 'Today', 'This Week', 'This Month'])
+        self.history_filter.addItems(['All', 'Today', 'This Week', 'This Month', 'Custom Range'])
         self.history_filter.currentTextChanged.connect(self.filter_history)
         control_layout.addWidget(QLabel("Filter:"))
         control_layout.addWidget(self.history_filter)
         
+        # Date range for 'Custom Range' (inclusive of both days)
+        self.history_from_date = QDateEdit(QDate.currentDate().addDays(-30))
+        self.history_to_date = QDateEdit(QDate.currentDate())
+        for date_edit in (self.history_from_date, self.history_to_date):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("yyyy-MM-dd")
+            date_edit.dateChanged.connect(self.filter_history)
+            date_edit.setVisible(False)
+        self.history_range_label = QLabel("to")
+        self.history_range_label.setVisible(False)
+        control_layout.addWidget(self.history_from_date)
+        control_layout.addWidget(self.history_range_label)
+        control_layout.addWidget(self.history_to_date)
+        
         control_layout.addStretch()
         
-        self.export_btn = QPushButton("📥 Export to CSV")
+        self.export_btn = QPushButton("📥 Export")
         self.export_btn.clicked.connect(self.export_history)
         control_layout.addWidget(self.export_btn)
         
@@ -557,10 +799,12 @@ class MainWindow(QMainWindow):
         layout.addLayout(control_layout)
         
         # History table
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(5)
-        self.history_table.setHorizontalHeaderLabels(['Date & Time', 'Mode', 'Duration', 'Status', 'Notes'])
+        self.history_model = HistoryTableModel(self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
         self.history_table.horizontalHeader().setStretchLastSection(True)
+        # Uniform row heights let the view skip measuring every row
+        self.history_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         layout.addWidget(self.history_table)
         
         # Statistics
@@ -575,6 +819,14 @@ class MainWindow(QMainWindow):
         stats_layout.addWidget(self.total_sessions_label, 0, 1)
         stats_layout.addWidget(self.avg_duration_label, 0, 2)
         
+        # Per-period totals come straight from the history's rollups
+        self.period_stats_labels = {}
+        for row, (key, title) in enumerate([('today', "Today"), ('week', "This Week"),
+                                            ('month', "This Month")], start=1):
+            label = QLabel(f"{title}: 0 sessions, 0 min, 0 L")
+            self.period_stats_labels[key] = (title, label)
+            stats_layout.addWidget(label, row, 0, 1, 3)
+        
         stats_group.setLayout(stats_layout)
         layout.addWidget(stats_group)
         
@@ -593,6 +845,7 @@ class MainWindow(QMainWindow):
         self.flow_rate_spin = QSpinBox()
         self.flow_rate_spin.setRange(1, 20)
         self.flow_rate_spin.setValue(1)
+        self.flow_rate_spin.valueChanged.connect(self.set_flow_rate)
         general_layout.addWidget(self.flow_rate_spin, 0, 1)
         
         general_layout.addWidget(QLabel("Default Duration:"), 1, 0)
@@ -627,6 +880,70 @@ class MainWindow(QMainWindow):
         safety_group.setLayout(safety_layout)
         layout.addWidget(safety_group)
         
+        # Diagnostics - the histograms behind the metrics endpoint
+        diagnostics_group = QGroupBox("Diagnostics")
+        diagnostics_layout = QVBoxLayout()
+        
+        endpoint_layout = QHBoxLayout()
+        self.metrics_checkbox = QCheckBox("Serve Prometheus metrics on port")
+        self.metrics_checkbox.toggled.connect(self.set_metrics_enabled)
+        endpoint_layout.addWidget(self.metrics_checkbox)
+        self.metrics_port_spin = QSpinBox()
+        self.metrics_port_spin.setRange(1024, 65535)
+        self.metrics_port_spin.setValue(METRICS_PORT)
+        self.metrics_port_spin.editingFinished.connect(self.set_metrics_port)
+        endpoint_layout.addWidget(self.metrics_port_spin)
+        self.metrics_url_label = QLabel("")
+        self.metrics_url_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        endpoint_layout.addWidget(self.metrics_url_label)
+        endpoint_layout.addStretch()
+        diagnostics_layout.addLayout(endpoint_layout)
+        
+        self.diagnostics_table = QTableWidget(0, 5)
+        self.diagnostics_table.setHorizontalHeaderLabels(['Metric', 'Count / Value', 'p50', 'p95', 'Max'])
+        self.diagnostics_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.diagnostics_table.verticalHeader().setVisible(False)
+        self.diagnostics_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        diagnostics_layout.addWidget(self.diagnostics_table)
+        
+        diagnostics_group.setLayout(diagnostics_layout)
+        layout.addWidget(diagnostics_group)
+        
+        # Profiling - cProfile, stack samples and tracemalloc for a while
+        profile_group = QGroupBox("Profiling")
+        profile_layout = QVBoxLayout()
+        
+        capture_layout = QHBoxLayout()
+        capture_layout.addWidget(QLabel("Capture for:"))
+        self.profile_seconds_spin = QSpinBox()
+        self.profile_seconds_spin.setRange(5, 600)
+        self.profile_seconds_spin.setValue(30)
+        self.profile_seconds_spin.setSuffix(" s")
+        self.profile_seconds_spin.valueChanged.connect(self.set_profile_seconds)
+        capture_layout.addWidget(self.profile_seconds_spin)
+        self.profile_btn = QPushButton("Start Profiling")
+        self.profile_btn.clicked.connect(self.toggle_profiling)
+        capture_layout.addWidget(self.profile_btn)
+        self.profile_status_label = QLabel("")
+        capture_layout.addWidget(self.profile_status_label)
+        capture_layout.addStretch()
+        profile_layout.addLayout(capture_layout)
+        
+        self.profile_table = QTableWidget(0, 4)
+        self.profile_table.setHorizontalHeaderLabels(['Function', 'Calls', 'Own (ms)', 'Total (ms)'])
+        self.profile_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.profile_table.verticalHeader().setVisible(False)
+        self.profile_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        profile_layout.addWidget(self.profile_table)
+        
+        self.profile_details_label = QLabel("")
+        self.profile_details_label.setWordWrap(True)
+        self.profile_details_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        profile_layout.addWidget(self.profile_details_label)
+        
+        profile_group.setLayout(profile_layout)
+        layout.addWidget(profile_group)
+        
         # Save button
         self.save_settings_btn = QPushButton("💾 Save Settings")
         self.save_settings_btn.setStyleSheet("""
@@ -646,180 +963,187 @@ class MainWindow(QMainWindow):
         return widget
         
     def show_connection_dialog(self):
-        dialog = ConnectionDialog(self)
+        in_use = [device.conn_info['port'] for device in self.fleet.devices.values()
+                  if device.conn_info['type'] == 'serial']
+        dialog = ConnectionDialog(self, in_use=in_use, on_error=self.log_error)
         if dialog.exec():
             conn_info = dialog.get_connection_info()
             self.connect_device(conn_info)
             
     def connect_device(self, conn_info):
-        # Disconnect if already connected
-        if self.device:
-            self.disconnect_device()
+        device_id = self.controller.connect_device(conn_info)
+        if self.device_combo.findText(device_id) < 0:
+            self.device_combo.addItem(device_id)
+        self.device_combo.setCurrentText(device_id)
+        
+    def on_device_state(self, device_id, state, message):
+        if state == fleet.CONNECTING:
+            self.log_message(f"{device_id}: Connecting...")
+        elif state == fleet.CONNECTED:
+            self.log_message(f"Connected: {message}")
+            self.arm_schedule_timer()
+        elif state == fleet.RECONNECTING:
+            self.log_message(f"{device_id}: {message or 'Reconnecting'}...", "warning")
+        elif state == fleet.FAILED:
+            self.remove_device_item(device_id)
+            QMessageBox.critical(self, "Connection Error", message)
+        elif state == fleet.DISCONNECTED:
+            self.log_message(f"{device_id}: Disconnected")
             
-        try:
-            if conn_info['type'] == 'serial':
-                self.device = serial.Serial(
-                    port=conn_info['port'],
-                    baudrate=conn_info['baudrate'],
-                    timeout=1
-                )
-                self.connection_type = 'serial'
-                self.on_connection_success(f"Serial: {conn_info['port']}")
-                
-            else:  # WiFi
-                self.wifi_thread = WiFiConnection(conn_info['ip'], conn_info['port'])
-                self.wifi_thread.status_update.connect(self.log_message)
-                self.wifi_thread.connection_result.connect(self.on_wifi_connection_result)
-                self.wifi_thread.start()
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Connection Error", str(e))
+        if device_id == self.controller.active_device:
+            self.update_connection_label()
             
-    def on_wifi_connection_result(self, success, message):
-        if success:
-            self.device = self.wifi_thread.socket
-            self.connection_type = 'wifi'
-            self.on_connection_success(message)
+    def set_active_device(self, device_id):
+        self.controller.active_device = device_id or None
+        self.disconnect_btn.setEnabled(self.controller.active_device is not None)
+        self.latency_label.setText("Latency: -- ms")
+        self.update_connection_label()
+        self.update_hardware_label()
+        
+    def update_connection_label(self):
+        active_device = self.controller.active_device
+        device = self.fleet.devices.get(active_device) if active_device else None
+        if device is None:
+            text, color = "⚡ Disconnected", "#ffcccc"
+        elif device.state == fleet.CONNECTED:
+            text, color = f"⚡ {fleet.describe(device.conn_info)}", "#ccffcc"
         else:
-            QMessageBox.critical(self, "Connection Error", message)
+            text, color = f"⚡ {active_device}: {device.state.capitalize()}", "#fff3cd"
             
-    def on_connection_success(self, info):
-        self.connection_label.setText(f"⚡ {info}")
-        self.connection_label.setStyleSheet("""
-            QLabel {
+        self.connection_label.setText(text)
+        self.connection_label.setStyleSheet(f"""
+            QLabel {{
                 padding: 5px;
                 border-radius: 5px;
-                background-color: #ccffcc;
+                background-color: {color};
                 font-weight: bold;
-            }
+            }}
         """)
-        self.connect_btn.setText("🔌 Disconnect")
-        self.log_message(f"Connected: {info}")
         
-        # Start device monitor
-        self.device_monitor = DeviceMonitor(self.device)
-        self.device_monitor.data_received.connect(self.on_device_data)
-        self.device_monitor.start()
-        
-    def disconnect_device(self):
-        if self.device_monitor:
-            self.device_monitor.stop()
-            self.device_monitor.wait()
-            self.device_monitor = None
+    def remove_device_item(self, device_id):
+        index = self.device_combo.findText(device_id)
+        if index >= 0:
+            self.device_combo.removeItem(index)
             
-        if self.device:
-            if isinstance(self.device, serial.Serial):
-                self.device.close()
-            elif isinstance(self.device, socket.socket):
-                self.device.close()
-            self.device = None
+    def disconnect_device(self):
+        device_id = self.controller.active_device
+        if not device_id:
+            return
             
-        self.connection_label.setText("⚡ Disconnected")
-        self.connection_label.setStyleSheet("""
-            QLabel {
-                padding: 5px;
-                border-radius: 5px;
-                background-color: #ffcccc;
-                font-weight: bold;
-            }
-        """)
-        self.connect_btn.setText("🔌 Connect")
-        self.log_message("Disconnected")
+        self.controller.disconnect_device(device_id)
+        self.remove_device_item(device_id)
         
     def send_command(self, command):
-        if not self.device:
-            self.log_message("Error: Not connected to device", "error")
-            return False
+        return self.controller.send_command(command)
+        
+    def on_device_lines(self, device_id, lines, read_at):
+        self.controller.handle_device_lines(device_id, lines, read_at)
+        
+    def on_command_failed(self, device_id, command, error):
+        self.controller.handle_command_failed(device_id, command, error)
+        
+    def on_reply_latency(self, device_id, latency_ms):
+        if device_id != self.controller.active_device:
+            return
+        device = self.fleet.devices.get(device_id)
+        latencies = device.latencies if device and device.latencies else [latency_ms]
+        avg_ms = sum(latencies) / len(latencies)
+        self.latency_label.setText(f"Latency: {latency_ms:.0f} ms (avg {avg_ms:.0f})")
+        
+    def on_device_status(self, device_id, status):
+        self.controller.handle_device_status(device_id, status)
+        
+    def on_hardware_changed(self, device_id, state, changes):
+        # Only called when a valve, the pump or the mode actually changed
+        if device_id == self.controller.active_device:
+            self.update_hardware_label()
             
-        try:
-            if isinstance(self.device, serial.Serial):
-                self.device.write((command + '\n').encode('utf-8'))
-            else:  # Socket
-                self.device.send((command + '\n').encode('utf-8'))
-            self.log_message(f"Sent: {command}")
-            return True
-        except Exception as e:
-            self.log_message(f"Send error: {e}", "error")
-            return False
+    def update_hardware_label(self):
+        state = self.controller.hardware_state()
+        if state.pump is None and state.led1 is None:
+            self.set_text(self.hardware_label, "")
+            return
             
-    def on_device_data(self, data):
-        self.log_message(f"Received: {data}")
+        def on_off(value):
+            return "--" if value is None else "ON" if value else "OFF"
+        self.set_text(self.hardware_label,
+                      f"💧 {on_off(state.led1)}  🌱 {on_off(state.led2)}  Pump {on_off(state.pump)}")
         
     def start_manual_watering(self):
-        if not self.device:
+        if not self.controller.is_connected():
             QMessageBox.warning(self, "Warning", "Please connect to device first")
             return
             
         mode = "Water Only" if self.water_radio.isChecked() else "Water + Fertilizer"
         duration = self.duration_spin.value()
+        self.controller.start_watering(mode, duration)
+        
+    def on_watering_started(self, mode, duration, trigger):
+        # Reflect the session in the manual controls (auto starts included)
+        self.update_manual_controls()
+        
+        # Update UI
+        self.system_status.setText(f"System: {mode}")
+        self.system_status.setStyleSheet("""
+            QLabel {
+                padding: 5px;
+                border-radius: 5px;
+                background-color: #ccffcc;
+                font-weight: bold;
+                color: green;
+            }
+        """)
+        
+        # Tick once per elapsed second of the session
+        phase = time.monotonic() - (time.time() - self.controller.watering_start_time)
+        self.ticks.every('progress', 1.0, self.update_progress, phase)
+        self.update_progress()
         
-        # Send appropriate command
-        if self.water_radio.isChecked():
-            success = self.send_command("LED1_ON")
-        else:
-            success = self.send_command("LED2_ON")
-            
-        if success:
-            self.is_running = True
-            self.watering_start_time = time.time()
-            self.watering_duration = duration * 60  # Convert to seconds
-            
-            # Update UI
-            self.start_btn.setEnabled(False)
-            self.stop_btn.setEnabled(True)
-            self.test_btn.setEnabled(False)
-            self.system_status.setText(f"System: {mode}")
-            self.system_status.setStyleSheet("""
-                QLabel {
-                    padding: 5px;
-                    border-radius: 5px;
-                    background-color: #ccffcc;
-                    font-weight: bold;
-                    color: green;
-                }
-            """)
-            
-            # Start progress timer
-            self.progress_timer.start(100)  # Update every 100ms
-            
-            # Add to history
-            self.add_to_history(mode, duration, "Manual", "Started")
-            
-            self.log_message(f"Started {mode} for {duration} minutes")
-            
     def stop_watering(self):
-        success = self.send_command("STOP")
+        self.controller.stop_watering()
         
-        if success:
-            self.is_running = False
-            
-            # Calculate actual duration
-            if hasattr(self, 'watering_start_time'):
-                actual_duration = int((time.time() - self.watering_start_time) / 60)
-                self.log_message(f"Stopped after {actual_duration} minutes")
-            
-            # Update UI
-            self.start_btn.setEnabled(True)
-            self.stop_btn.setEnabled(False)
-            self.test_btn.setEnabled(True)
-            self.system_status.setText("System: Idle")
-            self.system_status.setStyleSheet("""
-                QLabel {
-                    padding: 5px;
-                    border-radius: 5px;
-                    background-color: #e0e0e0;
-                    font-weight: bold;
-                }
-            """)
+    def on_watering_stopped(self):
+        # Update UI
+        self.system_status.setText("System: Idle")
+        self.system_status.setStyleSheet("""
+            QLabel {
+                padding: 5px;
+                border-radius: 5px;
+                background-color: #e0e0e0;
+                font-weight: bold;
+            }
+        """)
+        
+        # Stop progress ticks
+        self.ticks.cancel('progress')
+        self.update_manual_controls()
+        
+        # Start anything that came due while this session was running
+        self.arm_schedule_timer()
+        
+    def update_manual_controls(self):
+        if 'manual' not in self.built_tabs:
+            return
             
-            # Stop progress timer
-            self.progress_timer.stop()
+        running = self.controller.is_running
+        self.start_btn.setEnabled(not running)
+        self.stop_btn.setEnabled(running)
+        self.test_btn.setEnabled(not running)
+        if not running:
             self.progress_bar.setValue(0)
             self.progress_label.setText("Ready")
             self.time_remaining_label.setText("")
+            return
             
+        if self.controller.watering_mode == WATER_ONLY:
+            self.water_radio.setChecked(True)
+        else:
+            self.fertilizer_radio.setChecked(True)
+        self.duration_spin.setValue(self.controller.watering_duration // 60)
+        self.update_progress()
+        
     def test_system(self):
-        if not self.device:
+        if not self.controller.is_connected():
             QMessageBox.warning(self, "Warning", "Please connect to device first")
             return
             
@@ -839,28 +1163,30 @@ class MainWindow(QMainWindow):
             QTimer.singleShot(6000, lambda: self.log_message("Test complete"))
             
     def update_progress(self):
-        if not self.is_running:
+        if not self.controller.is_running:
+            return
+            
+        # The session ends on time even if the Manual tab was never opened
+        if 'manual' not in self.built_tabs:
+            self.controller.check_completion()
             return
             
-        elapsed = time.time() - self.watering_start_time
-        progress = min(100, int((elapsed / self.watering_duration) * 100))
+        elapsed, remaining, progress = self.controller.progress()
         
-        self.progress_bar.setValue(progress)
+        if self.progress_bar.value() != progress:
+            self.progress_bar.setValue(progress)
         
         # Update labels
         elapsed_min = int(elapsed / 60)
         elapsed_sec = int(elapsed % 60)
-        self.progress_label.setText(f"Elapsed: {elapsed_min:02d}:{elapsed_sec:02d}")
+        self.set_text(self.progress_label, f"Elapsed: {elapsed_min:02d}:{elapsed_sec:02d}")
         
-        remaining = max(0, self.watering_duration - elapsed)
         remaining_min = int(remaining / 60)
         remaining_sec = int(remaining % 60)
-        self.time_remaining_label.setText(f"Remaining: {remaining_min:02d}:{remaining_sec:02d}")
+        self.set_text(self.time_remaining_label, f"Remaining: {remaining_min:02d}:{remaining_sec:02d}")
         
         # Auto stop when complete
-        if progress >= 100:
-            self.stop_watering()
-            self.log_message("Watering completed")
+        self.controller.check_completion()
             
     def add_schedule(self):
         # Get selected days
@@ -870,17 +1196,20 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Warning", "Please select at least one day")
             return
             
-        schedule = {
-            'time': self.start_time.time().toString("HH:mm"),
-            'duration': self.schedule_duration.value(),
-            'days': selected_days,
-            'mode': self.schedule_mode.currentText(),
-            'repeat': self.repeat_checkbox.isChecked(),
-            'active': True
-        }
+        schedule = make_schedule(
+            self.start_time.time().toString("HH:mm"),
+            self.schedule_duration.value(),
+            selected_days,
+            self.schedule_mode.currentText(),
+            repeat=self.repeat_checkbox.isChecked()
+        )
         
-        self.schedules.append(schedule)
-        self.update_schedule_table()
+        conflicts = self.controller.add_schedule(schedule)
+        if conflicts:
+            times = ', '.join(f"{other['time']} ({', '.join(other['days'])})" for other in conflicts)
+            QMessageBox.warning(self, "Overlapping Schedules",
+                                f"This schedule overlaps {times}.\n"
+                                "Overlapping sessions will run one after another.")
         
         # Clear selections
         for cb in self.day_checkboxes.values():
@@ -889,14 +1218,27 @@ class MainWindow(QMainWindow):
         self.log_message(f"Added schedule: {schedule['time']} on {', '.join(selected_days)}")
         
     def update_schedule_table(self):
-        self.schedule_table.setRowCount(len(self.schedules))
+        if 'auto' not in self.built_tabs:
+            return
+            
+        schedules = self.controller.scheduler.schedules
+        self.schedule_table.setRowCount(len(schedules))
         
-        for i, schedule in enumerate(self.schedules):
+        for i, schedule in enumerate(schedules):
             self.schedule_table.setItem(i, 0, QTableWidgetItem(schedule['time']))
             self.schedule_table.setItem(i, 1, QTableWidgetItem(f"{schedule['duration']} min"))
             self.schedule_table.setItem(i, 2, QTableWidgetItem(', '.join(schedule['days'])))
             self.schedule_table.setItem(i, 3, QTableWidgetItem(schedule['mode']))
             
+            # Mark active schedules that overlap another one
+            conflicts = self.controller.scheduler.conflicts(schedule) if schedule['active'] else []
+            if conflicts:
+                tooltip = "Overlaps " + ', '.join(other['time'] for other in conflicts)
+                for column in range(4):
+                    item = self.schedule_table.item(i, column)
+                    item.setBackground(QColor("#fff3cd"))
+                    item.setToolTip(tooltip)
+            
             # Action buttons
             action_widget = QWidget()
             action_layout = QHBoxLayout()
@@ -915,12 +1257,10 @@ class MainWindow(QMainWindow):
             self.schedule_table.setCellWidget(i, 4, action_widget)
             
     def toggle_schedule(self, index):
-        self.schedules[index]['active'] = not self.schedules[index]['active']
-        self.update_schedule_table()
+        self.controller.toggle_schedule(index)
         
     def delete_schedule(self, index):
-        del self.schedules[index]
-        self.update_schedule_table()
+        self.controller.delete_schedule(index)
         
     def clear_all_schedules(self):
         reply = QMessageBox.question(self, "Clear All", 
@@ -928,148 +1268,124 @@ class MainWindow(QMainWindow):
                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         
         if reply == QMessageBox.StandardButton.Yes:
-            self.schedules.clear()
-            self.update_schedule_table()
+            self.controller.clear_schedules()
             
     def toggle_auto_mode(self, state):
-        self.auto_mode_enabled = state == 2  # Qt.CheckState.Checked = 2
-        status = "enabled" if self.auto_mode_enabled else "disabled"
-        self.log_message(f"Auto mode {status}")
+        self.controller.toggle_auto_mode(state == 2)  # Qt.CheckState.Checked = 2
         
-    def check_schedules(self):
-        if not self.auto_mode_enabled or self.is_running or not self.device:
-            return
-            
-        current_time = QTime.currentTime()
-        current_day = datetime.now().strftime('%a')
+    def on_schedules_changed(self):
+        self.update_schedule_table()
+        self.arm_schedule_timer()
         
-        for schedule in self.schedules:
-            if not schedule['active']:
-                continue
-                
-            if current_day not in schedule['days']:
-                continue
-                
-            schedule_time = QTime.fromString(schedule['time'], "HH:mm")
-            
-            # Check if it's time to start (within 1 minute window)
-            if (schedule_time.secsTo(current_time) >= 0 and 
-                schedule_time.secsTo(current_time) < 60):
-                
-                # Check if not already started
-                if not hasattr(self, 'last_auto_start') or \
-                   time.time() - self.last_auto_start > 120:
-                    
-                    self.last_auto_start = time.time()
-                    self.start_auto_watering(schedule)
-                    
-    def start_auto_watering(self, schedule):
-        self.log_message(f"Auto schedule triggered: {schedule['time']}")
+    def check_schedules(self):
+        self.controller.check_schedules()
+        self.arm_schedule_timer()
         
-        # Set mode
-        if "Water Only" in schedule['mode']:
-            self.water_radio.setChecked(True)
+    def arm_schedule_timer(self):
+        delay = self.controller.next_check_delay()
+        if delay is None:
+            self.ticks.cancel('schedule')
         else:
-            self.fertilizer_radio.setChecked(True)
-            
-        # Set duration
-        self.duration_spin.setValue(schedule['duration'])
-        
-        # Start watering
-        self.start_manual_watering()
+            self.ticks.after('schedule', delay, self.check_schedules)
         
-        # Update history to show it was auto-triggered
-        if self.watering_log:
-            self.watering_log[-1]['notes'] = "Auto Schedule"
-            
-    def add_to_history(self, mode, duration, trigger, status):
-        entry = {
-            'datetime': datetime.now(),
-            'mode': mode,
-            'duration': duration,
-            'trigger': trigger,
-            'status': status,
-            'notes': trigger
-        }
-        
-        self.watering_log.append(entry)
-        self.update_history_table()
+    def on_history_changed(self, entry=None):
+        if 'history' not in self.built_tabs:
+            return
+        if entry is not None and in_range(entry, *self.history_range()):
+            self.history_model.append_entry(entry)
+        elif entry is None:
+            self.update_history_table()
         self.update_statistics()
         
-    def update_history_table(self):
-        # Filter history based on selection
+    def history_range(self):
         filter_text = self.history_filter.currentText()
-        filtered_log = self.filter_watering_log(filter_text)
+        if filter_text != 'Custom Range':
+            return filter_range(filter_text)
         
-        self.history_table.setRowCount(len(filtered_log))
+        start = datetime.combine(self.history_from_date.date().toPyDate(), datetime.min.time())
+        end = datetime.combine(self.history_to_date.date().toPyDate(), datetime.min.time())
+        return start, end + timedelta(days=1)
         
-        for i, entry in enumerate(filtered_log):
-            dt_item = QTableWidgetItem(entry['datetime'].strftime("%Y-%m-%d %H:%M"))
-            self.history_table.setItem(i, 0, dt_item)
-            self.history_table.setItem(i, 1, QTableWidgetItem(entry['mode']))
-            self.history_table.setItem(i, 2, QTableWidgetItem(f"{entry['duration']} min"))
-            self.history_table.setItem(i, 3, QTableWidgetItem(entry['status']))
-            self.history_table.setItem(i, 4, QTableWidgetItem(entry['notes']))
-            
-    def filter_watering_log(self, filter_text):
-        if filter_text == 'All':
-            return self.watering_log
+    def update_history_table(self):
+        # Filter history based on selection
+        self.history_model.set_entries(self.controller.history.between(*self.history_range()))
             
-        now = datetime.now()
-        
-        if filter_text == 'Today':
-            return [e for e in self.watering_log 
-                   if e['datetime'].date() == now.date()]
-        elif filter_text == 'This Week':
-            week_start = now - timedelta(days=now.weekday())
-            return [e for e in self.watering_log 
-                   if e['datetime'].date() >= week_start.date()]
-        elif filter_text == 'This Month':
-            return [e for e in self.watering_log 
-                   if e['datetime'].month == now.month and 
-                      e['datetime'].year == now.year]
-                      
-        return self.watering_log
-        
     def filter_history(self):
+        custom = self.history_filter.currentText() == 'Custom Range'
+        for widget in (self.history_from_date, self.history_range_label, self.history_to_date):
+            widget.setVisible(custom)
         self.update_history_table()
         
     def update_statistics(self):
-        if not self.watering_log:
-            return
-            
-        total_sessions = len(self.watering_log)
-        total_duration = sum(e['duration'] for e in self.watering_log)
-        total_water = total_duration * self.flow_rate_spin.value()
-        avg_duration = total_duration / total_sessions if total_sessions > 0 else 0
+        stats = self.controller.statistics()
         
-        self.total_water_label.setText(f"Total Water Used: {total_water} L")
-        self.total_sessions_label.setText(f"Total Sessions: {total_sessions}")
-        self.avg_duration_label.setText(f"Average Duration: {avg_duration:.1f} min")
+        total = stats['all']
+        self.total_water_label.setText(f"Total Water Used: {total['litres']:g} L")
+        self.total_sessions_label.setText(f"Total Sessions: {total['sessions']}")
+        self.avg_duration_label.setText(f"Average Duration: {total['avg_minutes']:.1f} min")
+        
+        for key, (title, label) in self.period_stats_labels.items():
+            period = stats[key]
+            label.setText(f"{title}: {period['sessions']} sessions, "
+                          f"{period['minutes']} min, {period['litres']:g} L")
+        
+    def set_flow_rate(self, value):
+        # Only affects sessions recorded from now on
+        self.controller.settings.flow_rate = value
         
     def export_history(self):
-        filename, _ = QFileDialog.getSaveFileName(
+        filename, selected = QFileDialog.getSaveFileName(
             self, "Export History", 
             f"irrigation_history_{datetime.now().strftime('%Y%m%d')}.csv",
-            "CSV Files (*.csv)"
+            "CSV Files (*.csv);;Compressed CSV (*.csv.gz);;Columnar (*.swcol)"
         )
         
-        if filename:
-            try:
-                with open(filename, 'w') as f:
-                    f.write("Date,Time,Mode,Duration,Status,Notes\n")
-                    for entry in self.watering_log:
-                        f.write(f"{entry['datetime'].strftime('%Y-%m-%d')},"
-                               f"{entry['datetime'].strftime('%H:%M')},"
-                               f"{entry['mode']},"
-                               f"{entry['duration']},"
-                               f"{entry['status']},"
-                               f"{entry['notes']}\n")
-                               
-                QMessageBox.information(self, "Success", f"History exported to {filename}")
-                self.log_message(f"History exported to {filename}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Export failed: {e}")
+        if not filename:
+            return
+        for extension in ('.csv.gz', '.swcol'):
+            if extension in selected and not filename.endswith(extension):
+                filename = os.path.splitext(filename)[0] + extension
+                
+        # Whatever the History tab is showing, streamed from a worker thread
+        from smartwater.export import HistoryExporter
+        entries = self.controller.history.between(*self.history_range())
+        
+        self.export_progress = QProgressDialog("Exporting history...", "Cancel", 0, max(len(entries), 1), self)
+        self.export_progress.setWindowTitle("Export History")
+        self.export_progress.setMinimumDuration(500)
+        self.export_progress.setValue(0)
+        
+        self.export_bridge = ExportBridge()
+        self.export_bridge.progress.connect(self.on_export_progress)
+        self.export_bridge.finished.connect(
+            lambda rows, error, filename=filename: self.on_export_finished(filename, rows, error))
+        
+        self.exporter = HistoryExporter(
+            entries, filename,
+            on_progress=self.export_bridge.progress.emit,
+            on_finished=lambda rows, error: self.export_bridge.finished.emit(rows, error or '')
+        )
+        self.export_progress.canceled.connect(self.exporter.cancel)
+        self.export_btn.setEnabled(False)
+        self.exporter.start()
+        
+    def on_export_progress(self, done, total):
+        if self.export_progress is not None:
+            self.export_progress.setValue(done)
+            
+    def on_export_finished(self, filename, rows, error):
+        self.export_progress.close()
+        self.export_progress = None
+        self.exporter = None
+        self.export_btn.setEnabled(True)
+        
+        if error == 'cancelled':
+            self.log_message("History export cancelled", "warning")
+        elif error:
+            QMessageBox.critical(self, "Error", f"Export failed: {error}")
+        else:
+            QMessageBox.information(self, "Success", f"{rows} records exported to {filename}")
+            self.log_message(f"History exported to {filename} ({rows} records)")
                 
     def clear_history(self):
         reply = QMessageBox.question(self, "Clear History", 
@@ -1077,88 +1393,400 @@ class MainWindow(QMainWindow):
                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         
         if reply == QMessageBox.StandardButton.Yes:
-            self.watering_log.clear()
-            self.update_history_table()
-            self.update_statistics()
+            self.controller.clear_history()
+            
+    def run_ticks(self):
+        self.ticks.run_due()
+        self.arm_tick_timer()
+        
+    def arm_tick_timer(self):
+        delay = self.ticks.next_delay()
+        if delay is None:
+            self.tick_timer.stop()
+        else:
+            self.tick_timer.start(math.ceil(delay * 1000))
+            
+    def set_text(self, widget, text):
+        # Skip the relayout when nothing visible would change
+        if widget.text() != text:
+            widget.setText(text)
+            
+    def set_clock_running(self, running):
+        # The clock only ticks while someone can see it
+        if running and 'clock' not in self.ticks:
+            self.ticks.every('clock', 1.0, self.update_clock, self.ticks.wall_phase())
+            self.update_clock()
+        elif not running:
+            self.ticks.cancel('clock')
+            
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.set_clock_running(not self.isMinimized())
+        self.update_diagnostics_ticks()
+        if not self.startup_reported:
+            # Runs once the event loop has painted the first frame
+            self.startup_reported = True
+            QTimer.singleShot(0, self.report_startup)
+            
+    def report_startup(self):
+        self.startup.mark('first frame')
+        summary = f"Startup {self.startup.summary()}"
+        self.log_message(summary)
+        if self.startup_timing:
+            print(summary)
+        
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.set_clock_running(False)
+        self.update_diagnostics_ticks()
+        
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            self.set_clock_running(self.isVisible() and not self.isMinimized())
+            self.update_diagnostics_ticks()
+            
+    # Metrics
+    def set_stall_probe(self, running):
+        # A timer that fires late means the GUI thread was busy elsewhere
+        if running and 'stall' not in self.ticks:
+            self.arm_stall_probe()
+        elif not running:
+            self.ticks.cancel('stall')
+            
+    def arm_stall_probe(self):
+        self.stall_due = time.monotonic() + STALL_PROBE_INTERVAL
+        self.ticks.after('stall', STALL_PROBE_INTERVAL, self.probe_stall)
+        
+    def probe_stall(self):
+        self.gui_stall.observe(max(0.0, time.monotonic() - self.stall_due))
+        self.arm_stall_probe()
+        
+    def diagnostics_visible(self):
+        return (self.isVisible() and not self.isMinimized() and
+                TABS[self.tab_widget.currentIndex()][0] == 'settings')
+        
+    def update_diagnostics_ticks(self, *_):
+        # The table is redrawn only while it is on screen; stalls are also
+        # measured while the endpoint is serving them
+        showing = self.diagnostics_visible()
+        if showing and 'diagnostics' not in self.ticks:
+            self.ticks.every('diagnostics', DIAGNOSTICS_INTERVAL, self.update_diagnostics)
+            self.update_diagnostics()
+        elif not showing:
+            self.ticks.cancel('diagnostics')
+        self.set_stall_probe(showing or self.metrics_server is not None)
+        
+    def update_diagnostics(self):
+        if 'settings' not in self.built_tabs:
+            return
+            
+        rows = []
+        for name, kind, _, samples in self.metrics.collect():
+            name = name.removeprefix('smartwater_')
+            for pairs, value in samples:
+                label = name + ''.join(f" [{item}]" for _, item in pairs)
+                if kind == 'histogram':
+                    summary = value.summary()
+                    rows.append((label, str(summary['count']), format_seconds(summary['p50']),
+                                 format_seconds(summary['p95']),
+                                 format_seconds(summary['max'] if summary['count'] else None)))
+                else:
+                    rows.append((label, f"{value:,}", "", "", ""))
+                    
+        table = self.diagnostics_table
+        table.setUpdatesEnabled(False)
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, text in enumerate(row):
+                item = table.item(i, j)
+                if item is None:
+                    table.setItem(i, j, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+        table.setUpdatesEnabled(True)
+        
+    def set_metrics_enabled(self, enabled):
+        self.controller.settings.metrics_enabled = enabled
+        self.controller.settings.metrics_port = self.metrics_port_spin.value()
+        self.apply_metrics_server()
+        
+    def set_metrics_port(self):
+        port = self.metrics_port_spin.value()
+        if port != self.controller.settings.metrics_port:
+            self.controller.settings.metrics_port = port
+            self.apply_metrics_server()
+            
+    # Profiling
+    def set_profile_seconds(self, seconds):
+        self.controller.settings.profile_seconds = seconds
+        
+    def toggle_profiling(self):
+        if self.profiler is None:
+            self.start_profiling(self.controller.settings.profile_seconds)
+        else:
+            self.stop_profiling()
+            
+    def start_profiling(self, seconds):
+        if self.profiler is not None:
+            return
+        from smartwater.profiling import ProfileSession
+        self.profiler = ProfileSession(self.data_path('profiles'), seconds)
+        self.profiler.start()
+        # The GUI thread started cProfile, so it also has to stop it
+        self.ticks.after('profile', seconds, self.stop_profiling)
+        self.log_message(f"Profiling for {seconds:g} s")
+        self.update_profile_view()
+        
+    def stop_profiling(self):
+        if self.profiler is None:
+            return
+        self.ticks.cancel('profile')
+        profiler, self.profiler = self.profiler, None
+        try:
+            report = profiler.stop()
+        except OSError as e:
+            self.log_message(f"Profile not saved: {e}", "error")
+        else:
+            self.profile_report = report
+            self.log_message(f"Profile saved to {report.paths['summary']}")
+            if self.print_profile:
+                print(report.summary())
+        self.update_profile_view()
+        
+    def update_profile_view(self):
+        if 'settings' not in self.built_tabs:
+            return
             
+        if self.profiler is not None:
+            self.profile_btn.setText("Stop Profiling")
+            self.profile_status_label.setText(f"Capturing {self.profiler.duration:g} s...")
+            return
+        self.profile_btn.setText("Start Profiling")
+        
+        report = self.profile_report
+        if report is None:
+            self.profile_status_label.setText("")
+            return
+        self.profile_status_label.setText(f"Last capture: {report.duration:.1f} s")
+        
+        table = self.profile_table
+        table.setUpdatesEnabled(False)
+        table.setRowCount(len(report.functions))
+        for i, stat in enumerate(report.functions):
+            table.setItem(i, 0, QTableWidgetItem(stat.function))
+            table.setItem(i, 1, QTableWidgetItem(str(stat.calls)))
+            table.setItem(i, 2, QTableWidgetItem(f"{stat.own * 1000:.1f}"))
+            table.setItem(i, 3, QTableWidgetItem(f"{stat.total * 1000:.1f}"))
+        table.setUpdatesEnabled(True)
+        
+        # The busiest spot of each other thread, and the largest allocation
+        details = []
+        threads = set()
+        for hotspot in report.hotspots:
+            if hotspot.thread not in threads:
+                threads.add(hotspot.thread)
+                details.append(f"{hotspot.thread}: {hotspot.function} ({hotspot.share:.0%})")
+        if report.allocations:
+            stat = report.allocations[0]
+            details.append(f"Most memory kept: {stat.location} (+{stat.size / 1024:.0f} KiB)")
+        details.append(f"Files: {os.path.dirname(report.paths['summary'])}")
+        self.profile_details_label.setText("\n".join(details))
+        
+    def apply_metrics_server(self):
+        # Start, stop or move the endpoint to match the settings
+        settings = self.controller.settings
+        port = settings.metrics_port if settings.metrics_enabled else None
+        if self.metrics_server is not None and self.metrics_server.port != port:
+            self.metrics_server.stop()
+            self.metrics_server = None
+            self.log_message("Metrics endpoint stopped")
+        if port is not None and self.metrics_server is None:
+            server = MetricsServer(self.metrics, port)
+            try:
+                server.start()
+            except OSError as e:
+                self.log_message(f"Metrics endpoint not started: {e}", "error")
+                settings.metrics_enabled = False
+                if 'settings' in self.built_tabs:
+                    self.metrics_checkbox.setChecked(False)
+            else:
+                self.metrics_server = server
+                self.log_message(f"Metrics at {server.url()}")
+                
+        if 'settings' in self.built_tabs:
+            self.set_text(self.metrics_url_label,
+                          self.metrics_server.url() if self.metrics_server else "")
+        self.update_diagnostics_ticks()
+        
     def update_clock(self):
         current = QDateTime.currentDateTime()
-        self.time_label.setText(current.toString("yyyy-MM-dd HH:mm:ss"))
+        self.set_text(self.time_label, current.toString("yyyy-MM-dd HH:mm:ss"))
+        self.update_connection_metrics()
+        
+    def update_connection_metrics(self):
+        device = self.fleet.devices.get(self.controller.active_device or '')
+        if device is None:
+            self.connection_label.setToolTip("")
+            return
+            
+        metrics = device.metrics()
+        lines = [
+            f"State: {metrics['state']}",
+            f"Uptime: {timedelta(seconds=int(metrics['uptime']))}"
+            f" (total {timedelta(seconds=int(metrics['total_uptime']))})",
+            f"Connects: {metrics['connects']} (reconnects {metrics['reconnects']})",
+            f"Framing: {metrics['framing']}"
+        ]
+        if metrics['crc_errors'] or metrics['lost_frames']:
+            lines.append(f"Bad frames: {metrics['crc_errors']} (lost {metrics['lost_frames']})")
+        if metrics['last_connect_ms'] is not None:
+            lines.append(f"Connect time: {metrics['last_connect_ms']:.0f} ms"
+                         f" (avg {metrics['avg_connect_ms']:.0f})")
+        if metrics['last_error']:
+            lines.append(f"Last error: {metrics['last_error']}")
+        self.connection_label.setToolTip("\n".join(lines))
+        
+    def log_error(self, message):
+        # Safe from any thread
+        self.log_bridge.message.emit(message, "error")
         
     def log_message(self, message, level="info"):
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.log_buffer.append(str(message), level)
+        if 'log' not in self.ticks:
+            self.ticks.after('log', LOG_FLUSH_INTERVAL, self.flush_log)
+            
+    def flush_log(self):
+        records, dropped = self.log_buffer.since(self.log_seq)
+        if not records:
+            return
+        self.log_seq = records[-1].seq
         
-        if level == "error":
-            formatted = f'<span style="color: red;">[{timestamp}] {message}</span>'
-        elif level == "warning":
-            formatted = f'<span style="color: orange;">[{timestamp}] {message}</span>'
-        else:
-            formatted = f'[{timestamp}] {message}'
+        # Lines past the block limit would be laid out only to be dropped
+        if len(records) > LOG_MAX_BLOCKS:
+            dropped += len(records) - LOG_MAX_BLOCKS
+            records = records[-LOG_MAX_BLOCKS:]
             
-        self.log_display.append(formatted)
+        cursor = QTextCursor(self.log_display.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        default_format = QTextCharFormat()
+        if dropped:
+            if cursor.position() > 0:
+                cursor.insertBlock()
+            cursor.insertText(f"... {dropped} messages skipped", self.log_formats["warning"])
+        for record in records:
+            if cursor.position() > 0:
+                cursor.insertBlock()
+            timestamp = time.strftime("%H:%M:%S", time.localtime(record.time))
+            cursor.insertText(f"[{timestamp}] {record.message}",
+                              self.log_formats.get(record.level, default_format))
+        cursor.endEditBlock()
         
         # Auto scroll
         scrollbar = self.log_display.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
         
     def save_settings(self):
-        self.settings.setValue('flow_rate', self.flow_rate_spin.value())
-        self.settings.setValue('default_duration', self.default_duration_spin.value())
-        self.settings.setValue('max_duration', self.max_duration_spin.value())
-        self.settings.setValue('sound_alert', self.sound_alert_checkbox.isChecked())
-        self.settings.setValue('auto_stop', self.auto_stop_checkbox.isChecked())
-        self.settings.setValue('schedules', json.dumps(self.schedules))
+        settings = self.controller.settings
+        settings.flow_rate = self.flow_rate_spin.value()
+        settings.default_duration = self.default_duration_spin.value()
+        settings.max_duration = self.max_duration_spin.value()
+        settings.sound_alert = self.sound_alert_checkbox.isChecked()
+        settings.auto_stop = self.auto_stop_checkbox.isChecked()
+        core_settings.save_settings(self.settings, settings, self.schedule_store)
         
         QMessageBox.information(self, "Success", "Settings saved successfully")
         self.log_message("Settings saved")
         
     def load_settings(self):
-        self.flow_rate_spin.setValue(self.settings.value('flow_rate', 1, type=int))
-        self.default_duration_spin.setValue(self.settings.value('default_duration', 10, type=int))
-        self.max_duration_spin.setValue(self.settings.value('max_duration', 60, type=int))
-        self.sound_alert_checkbox.setChecked(self.settings.value('sound_alert', True, type=bool))
-        self.auto_stop_checkbox.setChecked(self.settings.value('auto_stop', True, type=bool))
-        
-        # Load schedules
-        schedules_json = self.settings.value('schedules', '[]')
-        try:
-            self.schedules = json.loads(schedules_json)
-            self.update_schedule_table()
-        except:
-            self.schedules = []
+        settings = core_settings.load_settings(self.settings, self.schedule_store)
+        self.controller.apply_settings(settings)
+        
+        self.update_settings_fields()
+        self.on_schedules_changed()
             
         # Set default duration
-        self.duration_spin.setValue(self.default_duration_spin.value())
+        if 'manual' in self.built_tabs:
+            self.duration_spin.setValue(settings.default_duration)
+        
+    def update_settings_fields(self):
+        if 'settings' not in self.built_tabs:
+            return
+            
+        settings = self.controller.settings
+        self.flow_rate_spin.setValue(settings.flow_rate)
+        self.default_duration_spin.setValue(settings.default_duration)
+        self.max_duration_spin.setValue(settings.max_duration)
+        self.sound_alert_checkbox.setChecked(settings.sound_alert)
+        self.auto_stop_checkbox.setChecked(settings.auto_stop)
+        self.metrics_port_spin.setValue(settings.metrics_port)
+        self.metrics_checkbox.setChecked(settings.metrics_enabled)
+        self.set_text(self.metrics_url_label, self.metrics_server.url() if self.metrics_server else "")
+        self.profile_seconds_spin.setValue(settings.profile_seconds)
+        self.update_profile_view()
         
     def closeEvent(self, event):
-        if self.is_running:
+        if self.controller.is_running:
             reply = QMessageBox.question(self, "Confirm Exit", 
                                        "System is running. Stop and exit?",
                                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             
             if reply == QMessageBox.StandardButton.Yes:
-                self.stop_watering()
+                # The fleet goes down next, so wait (briefly) for the device
+                self.controller.stop_and_confirm()
             else:
                 event.ignore()
                 return
                 
-        # Save current schedules
-        self.settings.setValue('schedules', json.dumps(self.schedules))
+        # Write out schedule changes the store has not saved yet
+        self.schedule_store.close()
         
-        # Disconnect device
-        if self.device:
-            self.disconnect_device()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            
+        # A capture cut short by closing still gets written
+        self.stop_profiling()
+        
+        # Disconnect all devices
+        self.status_poller.stop()
+        self.fleet.stop()
+        
+        # An export still reading the history has to finish before it closes
+        if self.exporter is not None:
+            self.exporter.cancel()
+            self.exporter.wait()
+            
+        # Commit any history still queued for the writer
+        self.controller.history.close()
             
         event.accept()
 
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Smart Irrigation Control System')
+    parser.add_argument('--eager-tabs', action='store_true',
+                        help='build every tab at startup instead of on first use')
+    parser.add_argument('--startup-timing', action='store_true',
+                        help='print how long each startup phase took')
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help='profile the first SECONDS and print the hottest functions')
+    # Whatever is left (e.g. -platform) is for Qt
+    return parser.parse_known_args(argv)
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    startup = PhaseTimer(STARTED)
+    startup.mark('imports')
+    args, qt_args = parse_args(sys.argv[1:])
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Set application style
     app.setStyle('Fusion')
+    startup.mark('qt')
     
-    window = MainWindow()
+    window = MainWindow(lazy_tabs=not args.eager_tabs, startup_timing=args.startup_timing,
+                        startup=startup, profile_seconds=args.profile)
     window.show()
     
     sys.exit(app.exec())
@@ -0,0 +1,59 @@
+# Smart Irrigation core - pure Python, no Qt imports.
+#
+# main.py is a PyQt6 view over IrrigationController; `python -m smartwater`
+# runs the same engine headless.
+
+import importlib
+
+# Public name -> module; loaded on first use so `import smartwater` (and the
+# GUI's start) only pays for the parts it touches
+_EXPORTS = {
+    'BinaryFramer': '.framing',
+    'CommandError': '.fleet',
+    'DAYS': '.scheduler',
+    'DeviceState': '.devicestate',
+    'DeviceStateTracker': '.devicestate',
+    'FleetManager': '.fleet',
+    'HistoryExporter': '.export',
+    'IntervalTree': '.intervals',
+    'IrrigationController': '.controller',
+    'JsonSettingsStore': '.settings',
+    'LineFramer': '.framing',
+    'LogBuffer': '.logbuffer',
+    'MetricsRegistry': '.metrics',
+    'MetricsServer': '.metrics',
+    'ProfileSession': '.profiling',
+    'ScheduleStore': '.persist',
+    'Scheduler': '.scheduler',
+    'Settings': '.settings',
+    'SqliteHistory': '.history',
+    'StatsRollup': '.stats',
+    'StatusPoller': '.status',
+    'TickService': '.ticker',
+    'WateringHistory': '.history',
+    'Zone': '.planner',
+    'ZonePlanner': '.planner',
+    'command_for_mode': '.controller',
+    'describe': '.fleet',
+    'device_id_for': '.fleet',
+    'load_settings': '.settings',
+    'make_schedule': '.scheduler',
+    'normalize_mode': '.controller',
+    'open_columnar': '.export',
+    'save_settings': '.settings',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,157 @@
+# รันระบบรดน้ำแบบ headless (ไม่มี GUI)
+#
+#   python -m smartwater --serial /dev/ttyUSB0
+#   python -m smartwater --wifi 192.168.1.100 --settings smartwater.json
+
+import argparse
+import queue
+import sys
+import time
+
+from . import FleetManager, IrrigationController, JsonSettingsStore, load_settings
+from . import fleet as fleet_states
+from .framing import FRAMING_AUTO, FRAMING_TEXT
+from .history import SqliteHistory
+from .metrics import MetricsRegistry, MetricsServer, register_core
+from .persist import ScheduleStore
+from .status import StatusPoller
+
+TICK_INTERVAL = 1.0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='smartwater', description='Headless irrigation controller')
+    parser.add_argument('--serial', action='append', default=[], metavar='PORT',
+                        help='serial port of a controller (repeatable)')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--wifi', action='append', default=[], metavar='IP[:PORT]',
+                        help='address of a controller (repeatable)')
+    parser.add_argument('--framing', choices=[FRAMING_TEXT, FRAMING_AUTO], default=FRAMING_TEXT,
+                        help="'auto' offers binary framing and falls back to text lines")
+    parser.add_argument('--settings', default='smartwater.json',
+                        help='JSON settings file')
+    parser.add_argument('--schedules', default='schedules.bin',
+                        help='schedule file (JSON schedules in --settings are moved here)')
+    parser.add_argument('--history', default='history.db',
+                        help='SQLite watering history database')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='serve Prometheus metrics on 127.0.0.1:PORT/metrics')
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help='profile the first SECONDS and print the hottest functions')
+    parser.add_argument('--profile-dir', default='profiles',
+                        help='directory for the --profile output files')
+    return parser.parse_args(argv)
+
+
+def connection_infos(args):
+    for port in args.serial:
+        yield {'type': 'serial', 'port': port, 'baudrate': args.baudrate}
+    for address in args.wifi:
+        ip, _, port = address.partition(':')
+        yield {'type': 'wifi', 'ip': ip, 'port': int(port or 80)}
+
+
+def finish_profile(profiler, controller):
+    try:
+        report = profiler.stop()
+    except OSError as e:
+        controller.log(f"Profile not saved: {e}", "error")
+    else:
+        controller.log(f"Profile saved to {report.paths['summary']}")
+        print(report.summary())
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    conn_infos = list(connection_infos(args))
+    if not conn_infos:
+        print("No devices given (use --serial or --wifi)")
+        return 2
+
+    # Fleet callbacks arrive on the fleet thread; handle them on this one
+    events = queue.Queue()
+    fleet = FleetManager(
+        on_lines=lambda device_id, lines: events.put(
+            ('lines', device_id, (lines, time.monotonic()))),
+        on_state=lambda device_id, state, message: events.put(('state', device_id, (state, message))),
+        on_command_failed=lambda device_id, command, error: events.put(
+            ('failed', device_id, (command, error))),
+        framing=args.framing
+    )
+    # Background writers report errors here too
+    report_error = lambda message: events.put(('error', None, message))
+    schedule_store = ScheduleStore(args.schedules, on_error=report_error)
+    settings = load_settings(JsonSettingsStore(args.settings), schedule_store)
+    status = StatusPoller(
+        fleet, on_status=lambda device_id, answer: events.put(('status', device_id, answer)))
+    history = SqliteHistory(args.history, on_error=report_error)
+    controller = IrrigationController(fleet, settings, history=history,
+                                      status=status, schedule_store=schedule_store)
+
+    metrics_server = None
+    metrics_port = args.metrics_port
+    if metrics_port is None and settings.metrics_enabled:
+        metrics_port = settings.metrics_port
+    if metrics_port is not None:
+        metrics_server = MetricsServer(register_core(MetricsRegistry(), controller), metrics_port)
+        metrics_server.start()
+
+    fleet.start()
+    status.start()
+    device_ids = [controller.connect_device(info) for info in conn_infos]
+    controller.active_device = device_ids[0]
+    controller.log(f"Loaded {len(controller.scheduler.schedules)} schedules from {args.schedules}")
+    if metrics_server is not None:
+        controller.log(f"Metrics at {metrics_server.url()}")
+
+    profiler = None
+    if args.profile:
+        from .profiling import ProfileSession
+        profiler = ProfileSession(args.profile_dir, args.profile)
+        profiler.start()
+        controller.log(f"Profiling for {args.profile:g} s")
+
+    try:
+        while True:
+            try:
+                kind, device_id, payload = events.get(timeout=TICK_INTERVAL)
+            except queue.Empty:
+                pass
+            else:
+                if kind == 'lines':
+                    lines, read_at = payload
+                    controller.handle_device_lines(device_id, lines, read_at)
+                elif kind == 'status':
+                    controller.handle_device_status(device_id, payload)
+                elif kind == 'error':
+                    controller.log(payload, "error")
+                elif kind == 'failed':
+                    command, error = payload
+                    controller.handle_command_failed(device_id, command, error)
+                else:
+                    state, message = payload
+                    text = f"{device_id}: {state}" + (f" - {message}" if message else "")
+                    controller.log(text, "error" if state == fleet_states.FAILED else "info")
+
+            controller.check_completion()
+            controller.check_schedules()
+            if profiler is not None and not profiler.remaining():
+                finish_profile(profiler, controller)
+                profiler = None
+    except KeyboardInterrupt:
+        if controller.is_running:
+            controller.stop_and_confirm()
+    finally:
+        if profiler is not None:
+            finish_profile(profiler, controller)
+        status.stop()
+        fleet.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        schedule_store.close()
+        controller.history.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
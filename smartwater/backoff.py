@@ -0,0 +1,25 @@
+# หน่วงเวลาก่อนเชื่อมต่อใหม่แบบ exponential backoff + jitter
+
+import random
+
+
+class Backoff:
+    def __init__(self, base=1.0, cap=60.0, factor=2.0, jitter=0.5):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.cap, self.base * self.factor ** self.attempts)
+        # Once at the cap the exponent stops growing, so a device that stays
+        # offline for days never overflows the float power
+        if delay < self.cap:
+            self.attempts += 1
+        # Randomise part of the delay so a site-wide outage doesn't make every
+        # device reconnect in lock-step
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
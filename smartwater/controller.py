@@ -0,0 +1,379 @@
+# เครื่องยนต์หลักของระบบรดน้ำ (ไม่ขึ้นกับ Qt)
+#
+# IrrigationController owns the fleet, the watering session, the schedules and
+# the history. Views (MainWindow, the headless runner) call its methods and are
+# told about changes through the on_* callbacks; the controller itself never
+# touches a widget.
+
+import concurrent.futures
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from .devicestate import DeviceStateTracker
+from .fleet import CommandError, CommandSuperseded
+from .history import WateringHistory
+from .metrics import JITTER_BUCKETS, Histogram
+from .scheduler import Scheduler
+from .settings import Settings
+from .status import HTTP_PORT
+
+WATER_ONLY = "Water Only"
+WATER_FERTILIZER = "Water + Fertilizer"
+
+# Occurrences popped later than this (host asleep, clock jump) count as missed
+MISSED_GRACE = timedelta(seconds=60)
+# Upper bound for the host's schedule timer, so wall-clock changes are noticed
+MAX_TIMER_WAIT = 900
+# A "not watering" report this soon after starting may predate the command
+RECONCILE_GRACE = 3.0
+# How long an exiting host waits for the device to acknowledge STOP
+STOP_TIMEOUT = 3.0
+
+
+def command_for_mode(mode):
+    return "LED1_ON" if WATER_ONLY in mode else "LED2_ON"
+
+
+def normalize_mode(mode):
+    return WATER_ONLY if WATER_ONLY in mode else WATER_FERTILIZER
+
+
+class IrrigationController:
+    def __init__(self, fleet, settings=None, history=None, scheduler=None, status=None,
+                 schedule_store=None, on_log=None, on_watering_started=None, on_watering_stopped=None,
+                 on_history_changed=None, on_schedules_changed=None, on_hardware_changed=None):
+        self.fleet = fleet
+        self.settings = settings or Settings()
+        self.history = history if history is not None else WateringHistory()
+        self.scheduler = scheduler if scheduler is not None else Scheduler(self.settings.schedules)
+        # Optional StatusPoller with the devices' /status answers
+        self.status = status
+        # Optional ScheduleStore; every change to the schedules is saved there
+        self.schedule_store = schedule_store
+        self.on_log = on_log
+        self.on_watering_started = on_watering_started
+        self.on_watering_stopped = on_watering_stopped
+        self.on_history_changed = on_history_changed
+        self.on_schedules_changed = on_schedules_changed
+        self.on_hardware_changed = on_hardware_changed
+        # What each device last reported about its valves and pump
+        self.device_states = DeviceStateTracker()
+        # Reply read on the fleet thread until handled here, and how late
+        # schedules start (see metrics.register_core)
+        self.read_lag = Histogram()
+        self.trigger_jitter = Histogram(JITTER_BUCKETS)
+
+        self.active_device = None
+        self.auto_mode_enabled = True
+        self.is_running = False
+        self.watering_mode = None
+        self.watering_start_time = None
+        self.watering_duration = 0
+        # (fire time, schedule) that came due while another session was running
+        self.pending_schedules = deque()
+        self._busy_logged = False
+        # The running session's ON command, and ON futures that failed; the
+        # fleet thread appends, the host thread drains (_end_failed_start)
+        self._start_future = None
+        self._failed_starts = deque()
+
+    def apply_settings(self, settings):
+        # Share one schedule list between the settings and the scheduler
+        self.settings = settings
+        self.scheduler.replace(settings.schedules)
+        settings.schedules = self.scheduler.schedules
+
+    def log(self, message, level="info"):
+        if self.on_log:
+            self.on_log(message, level)
+        else:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
+    # Devices
+    def is_connected(self):
+        return self.fleet.is_connected(self.active_device)
+
+    def connect_device(self, conn_info):
+        device_id = self.fleet.add_device(conn_info)
+        if self.status is not None and conn_info['type'] == 'wifi':
+            self.status.add_device(device_id, conn_info['ip'], conn_info.get('http_port', HTTP_PORT))
+        return device_id
+
+    def disconnect_device(self, device_id=None):
+        device_id = device_id or self.active_device
+        if device_id:
+            self.fleet.remove_device(device_id)
+            self.device_states.forget(device_id)
+            if self.status is not None:
+                self.status.remove_device(device_id)
+        if device_id == self.active_device:
+            self.active_device = None
+
+    def device_status(self, max_age=None):
+        # Cached /status of the active device (None if unknown or stale)
+        if self.status is None or not self.active_device:
+            return None
+        return self.status.cached(self.active_device, max_age)
+
+    def hardware_state(self, device_id=None):
+        return self.device_states.get(device_id or self.active_device)
+
+    def device_busy(self):
+        # Watering started outside this app, e.g. from the device's web page
+        status = self.device_status()
+        return bool(status and status.get('isWatering')) and not self.is_running
+
+    def send_command(self, command):
+        # concurrent.futures.Future that completes when the device acknowledges
+        # the command; None if there is no device to send it to. Never waits.
+        if not self.is_connected():
+            self.log("Error: Not connected to device", "error")
+            return None
+
+        future = self.fleet.send(self.active_device, command)
+        if future.done() and future.exception() is not None:
+            self.log(f"Send error: {future.exception()}", "error")
+            return None
+
+        self.log(f"Sent: {command}")
+        return future
+
+    def handle_command_failed(self, device_id, command, error):
+        # The fleet's on_command_failed, delivered on the host thread
+        self.log(f"{command} to {device_id} failed: {error}", "error")
+        self._end_failed_start()
+
+    def handle_device_lines(self, device_id, lines, read_at=None):
+        # read_at: time.monotonic() when the fleet read the lines
+        if read_at is not None:
+            self.read_lag.observe(max(0.0, time.monotonic() - read_at))
+        for line in lines:
+            self.handle_device_data(line, device_id)
+
+    def handle_device_data(self, data, device_id=None):
+        if device_id and device_id != self.active_device:
+            self.log(f"Received [{device_id}]: {data}")
+        else:
+            self.log(f"Received: {data}")
+
+        device_id = device_id or self.active_device
+        if device_id:
+            # Reply lines follow the commands that caused them, so they are
+            # never older than the session
+            state, changes = self.device_states.feed(device_id, data)
+            self._hardware_changed(device_id, state, changes, fresh=True)
+
+    def handle_device_status(self, device_id, status):
+        # A /status answer from the StatusPoller; it may have been requested
+        # just before the session started
+        state, changes = self.device_states.feed_status(device_id, status)
+        self._hardware_changed(device_id, state, changes, fresh=False)
+
+    def _hardware_changed(self, device_id, state, changes, fresh):
+        if not changes:
+            return
+        if device_id == self.active_device and 'watering' in changes:
+            self._reconcile(state, fresh)
+        if self.on_hardware_changed:
+            self.on_hardware_changed(device_id, state, changes)
+
+    def _reconcile(self, state, fresh):
+        # Follow the hardware when it stops or starts on its own
+        if self.is_running and state.watering is False:
+            if fresh or time.time() - (self.watering_start_time or 0) > RECONCILE_GRACE:
+                self.log("Device stopped watering", "warning")
+                self._session_ended()
+        elif not self.is_running and state.watering:
+            self.log("Device is watering without a session from this app", "warning")
+
+    # Watering sessions
+    def start_watering(self, mode, duration, trigger="Manual", notes=None):
+        mode = normalize_mode(mode)
+        future = self.send_command(command_for_mode(mode))
+        if future is None:
+            return False
+
+        self.is_running = True
+        self._start_future = future
+        future.add_done_callback(self._start_settled)
+        self.watering_mode = mode
+        self.watering_start_time = time.time()
+        self.watering_duration = duration * 60  # Convert to seconds
+
+        if self.on_watering_started:
+            self.on_watering_started(mode, duration, trigger)
+
+        self.add_to_history(mode, duration, trigger, "Started", notes)
+        self.log(f"Started {mode} for {duration} minutes")
+        return True
+
+    def _start_settled(self, future):
+        # Runs on the fleet thread: only queue the failure, the session is
+        # ended by the host thread in _end_failed_start. An ON coalesced
+        # away by a STOP is expected; whoever stopped ended the session.
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None and not isinstance(error, CommandSuperseded):
+            self._failed_starts.append(future)
+
+    def _end_failed_start(self):
+        # The device refused the ON or never acknowledged it (the fleet fails
+        # it after ACK_TIMEOUT), so it is not watering
+        while self._failed_starts:
+            future = self._failed_starts.popleft()
+            if self.is_running and future is self._start_future:
+                self.log(f"Start not confirmed by the device: {future.exception()}", "error")
+                self._session_ended()
+
+    def stop_watering(self):
+        # The STOP's future, or None if it could not be sent
+        future = self.send_command("STOP")
+        if future is None:
+            return None
+        self._session_ended()
+        return future
+
+    def stop_and_confirm(self, timeout=STOP_TIMEOUT):
+        # For hosts about to exit: stop and wait until the device has it
+        future = self.stop_watering()
+        if future is None:
+            return False
+        try:
+            future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.log("STOP not acknowledged by the device", "error")
+            return False
+        except CommandError as e:
+            self.log(f"STOP failed: {e}", "error")
+            return False
+        return True
+
+    def _session_ended(self):
+        self.is_running = False
+        self._start_future = None
+
+        # Calculate actual duration
+        if self.watering_start_time is not None:
+            actual_duration = int((time.time() - self.watering_start_time) / 60)
+            self.log(f"Stopped after {actual_duration} minutes")
+
+        if self.on_watering_stopped:
+            self.on_watering_stopped()
+
+    def progress(self, now=None):
+        # (elapsed seconds, remaining seconds, percent) of the running session
+        elapsed = (now or time.time()) - self.watering_start_time
+        percent = min(100, int((elapsed / self.watering_duration) * 100))
+        remaining = max(0, self.watering_duration - elapsed)
+        return elapsed, remaining, percent
+
+    def check_completion(self, now=None):
+        self._end_failed_start()
+        if not self.is_running:
+            return False
+
+        _, _, percent = self.progress(now)
+        if percent >= 100:
+            self.stop_watering()
+            self.log("Watering completed")
+            return True
+        return False
+
+    # Schedules
+    def toggle_auto_mode(self, enabled):
+        self.auto_mode_enabled = enabled
+        status = "enabled" if enabled else "disabled"
+        self.log(f"Auto mode {status}")
+
+    def add_schedule(self, schedule):
+        # Returns the active schedules it overlaps; it is added regardless and
+        # the overlapping sessions will queue behind each other
+        conflicts = self.scheduler.conflicts(schedule) if schedule['active'] else []
+        if conflicts:
+            times = ', '.join(sorted({other['time'] for other in conflicts}))
+            self.log(f"Schedule {schedule['time']} overlaps {times}", "warning")
+        self.scheduler.add(schedule)
+        self._schedules_changed()
+        return conflicts
+
+    def toggle_schedule(self, index):
+        self.scheduler.toggle(index)
+        self._schedules_changed()
+
+    def delete_schedule(self, index):
+        self.scheduler.delete(index)
+        self._schedules_changed()
+
+    def clear_schedules(self):
+        self.scheduler.clear()
+        self.pending_schedules.clear()
+        self._schedules_changed()
+
+    def _schedules_changed(self):
+        if self.schedule_store is not None:
+            self.schedule_store.save(self.scheduler.schedules)
+        if self.on_schedules_changed:
+            self.on_schedules_changed()
+
+    def check_schedules(self, now=None):
+        now = now or datetime.now()
+        due = self.scheduler.pop_due(now)
+
+        for fire_time, schedule in due:
+            if not self.auto_mode_enabled:
+                continue
+            if not self.is_connected():
+                self.log(f"Missed schedule {schedule['time']}: not connected", "warning")
+            elif now - fire_time > MISSED_GRACE:
+                self.log(f"Missed schedule {schedule['time']}", "warning")
+            else:
+                self.pending_schedules.append((fire_time, schedule))
+
+        started = None
+        if self.pending_schedules and not self.is_running and self.is_connected():
+            if self.device_busy():
+                if not self._busy_logged:
+                    self.log("Device is already watering; waiting to start schedule", "warning")
+                    self._busy_logged = True
+            else:
+                self._busy_logged = False
+                fire_time, started = self.pending_schedules.popleft()
+                self.trigger_jitter.observe(max(0.0, (now - fire_time).total_seconds()))
+                self.log(f"Auto schedule triggered: {started['time']}")
+                self.start_watering(started['mode'], started['duration'],
+                                    "Auto", "Auto Schedule")
+
+        # A one-shot schedule may have been switched off
+        if any(not schedule.get('repeat', True) for _, schedule in due):
+            self._schedules_changed()
+        return started
+
+    def next_check_delay(self, now=None):
+        # Seconds until check_schedules() has something to do, or None
+        if self.pending_schedules and not self.is_running and self.is_connected():
+            return self.status.ttl if self.device_busy() else 0.0
+
+        fire_time = self.scheduler.next_fire_time()
+        if fire_time is None:
+            return None
+        delay = (fire_time - (now or datetime.now())).total_seconds()
+        return max(0.0, min(delay, MAX_TIMER_WAIT))
+
+    # History
+    def add_to_history(self, mode, duration, trigger, status, notes=None):
+        # Litres are fixed at the flow rate in effect when the session ran
+        litres = duration * self.settings.flow_rate
+        entry = self.history.add(mode, duration, trigger, status, notes, litres=litres)
+        if self.on_history_changed:
+            self.on_history_changed(entry)
+        return entry
+
+    def clear_history(self):
+        self.history.clear()
+        if self.on_history_changed:
+            self.on_history_changed(None)
+
+    def statistics(self):
+        return self.history.statistics()
@@ -0,0 +1,119 @@
+# สถานะฮาร์ดแวร์ของอุปกรณ์ (วาล์ว/ปั๊ม) จากข้อความที่บอร์ดตอบกลับ
+#
+# Every reply format test.ino produces is folded into one immutable
+# DeviceState per device: the STATUS line, the Serial.println() messages
+# that follow each command, the auto-stop notice and the HTTP /status JSON.
+# Lines that say nothing about the hardware ("OK", "Executing command: ...")
+# cost one dict lookup. feed() reports only the fields that changed, so
+# callers can skip work when a line merely repeats what is already known.
+
+import time
+from collections import namedtuple
+
+MODE_IDLE = 'idle'
+MODE_WATER = 'water'
+MODE_FERTILIZER = 'fertilizer'
+
+# None means "not reported yet"
+DeviceState = namedtuple('DeviceState', ['led1', 'led2', 'pump', 'watering', 'mode', 'duration'])
+UNKNOWN = DeviceState(None, None, None, None, None, None)
+
+AUTO_STOP = "Auto stop - duration reached"
+
+_ALL_OFF = {'led1': False, 'led2': False, 'pump': False, 'watering': False,
+            'mode': MODE_IDLE, 'duration': 0}
+
+# Exact lines and the fields they set
+_MESSAGES = {
+    "Water mode ON": {'led1': True, 'pump': True, 'watering': True, 'mode': MODE_WATER},
+    "Fertilizer mode ON": {'led1': True, 'led2': True, 'pump': True, 'watering': True,
+                           'mode': MODE_FERTILIZER},
+    "All systems OFF": _ALL_OFF,
+    AUTO_STOP: _ALL_OFF,
+    "OK": None,
+}
+
+
+def parse_status_line(line):
+    # "LED1:1,LED2:0,PUMP:1" -> {'led1': True, ...}
+    fields = {}
+    for part in line.split(','):
+        name, _, value = part.partition(':')
+        name = name.strip().lower()
+        if name in ('led1', 'led2', 'pump') and value.strip() in ('0', '1'):
+            fields[name] = value.strip() == '1'
+    if 'pump' in fields:
+        fields['watering'] = fields['pump']
+        if not fields['pump']:
+            fields['mode'] = MODE_IDLE
+    return fields
+
+
+def parse_line(line, state=UNKNOWN):
+    # Fields a reply line sets, or None if it says nothing about the hardware
+    if line in _MESSAGES:
+        return _MESSAGES[line]
+    if line.startswith("LED1:"):
+        return parse_status_line(line) or None
+    if line.startswith("Duration set to:"):
+        digits = line[len("Duration set to:"):].split()
+        return {'duration': int(digits[0])} if digits and digits[0].lstrip('-').isdigit() else None
+    if line == "Water valve OFF":
+        # The pump stops only if the other valve is closed too
+        if state.led2 is False:
+            return {'led1': False, 'pump': False, 'watering': False}
+        return {'led1': False}
+    if line == "Fertilizer valve OFF":
+        if state.led1 is False:
+            return {'led2': False, 'pump': False, 'watering': False}
+        return {'led2': False}
+    return None
+
+
+def parse_status_json(status):
+    # The dict /status returns (see StatusPoller)
+    fields = {}
+    for key, field in (('led1', 'led1'), ('led2', 'led2'), ('pump', 'pump'),
+                       ('isWatering', 'watering')):
+        if isinstance(status.get(key), bool):
+            fields[field] = status[key]
+    if status.get('mode') in (MODE_IDLE, MODE_WATER, MODE_FERTILIZER):
+        fields['mode'] = status['mode']
+    return fields
+
+
+class DeviceStateTracker:
+    def __init__(self):
+        self.states = {}
+        self.updated = {}  # device_id -> monotonic time of the last report
+
+    def get(self, device_id):
+        return self.states.get(device_id, UNKNOWN)
+
+    def feed(self, device_id, line):
+        # (state, {field: (old, new)}) for a reply line; changes is empty if
+        # nothing new was learned
+        state = self.get(device_id)
+        fields = parse_line(line.strip(), state)
+        if not fields:
+            return state, {}
+        return self._apply(device_id, state, fields)
+
+    def feed_status(self, device_id, status):
+        return self._apply(device_id, self.get(device_id), parse_status_json(status))
+
+    def forget(self, device_id):
+        self.states.pop(device_id, None)
+        self.updated.pop(device_id, None)
+
+    def _apply(self, device_id, state, fields):
+        self.updated[device_id] = time.monotonic()
+        changes = {}
+        for name, value in fields.items():
+            old = getattr(state, name)
+            if old != value:
+                changes[name] = (old, value)
+        if changes:
+            state = state._replace(**{name: new for name, (_, new) in changes.items()})
+            self.states[device_id] = state
+        return state, changes
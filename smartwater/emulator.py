@@ -0,0 +1,550 @@
+# จำลองบอร์ด ESP32 (test.ino) สำหรับทดสอบโดยไม่ต้องใช้ฮาร์ดแวร์
+#
+#   python -m smartwater.emulator --devices 100 --tcp-port 9000 --http-port 10000
+#   python -m smartwater.emulator --serial 2 --latency 0.05 --loss 0.01
+#
+# Each virtual device runs the same handleCommand() state machine as the
+# firmware and answers the way it does: on the serial port every command is
+# echoed with the firmware's Serial.println() lines, over TCP every command is
+# answered with "OK", and HTTP serves /status (JSON) and /control?cmd=.
+# Unlike the firmware, TCP and HTTP listen on separate ports; both answer while
+# a TCP client is connected, as the firmware's TCP loop also services the web
+# server (the HTTP /status poller relies on that). All devices share
+# one asyncio loop, so thousands fit in a process; auto-stop is a timer per
+# device rather than a polling loop. Faults are injected per device: reply
+# latency, lost commands (dropped before they run) and random disconnects.
+# Both the TCP and the serial link accept "PROTO:BIN1" and then speak binary
+# frames like the firmware's handler: one ACK per CMD frame, and the Serial
+# lines of every command (or auto-stop) sent as EVENT/STATUS frames to all
+# binary links.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from .framing import (EVENT_CODES, FRAME_ACK, FRAME_EVENT, FRAME_STATUS, PROTO_ACK, PROTO_HELLO,
+                      BinaryFramer, LineFramer, encode_frame, status_payload)
+
+BANNER = ["ESP32 Smart Irrigation System Starting...", "Web server started", "System Ready!"]
+
+
+class Faults:
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, disconnect_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.disconnect_rate = disconnect_rate  # mean disconnects per second per link
+        self.random = random.Random(seed)
+
+    def delay(self):
+        if not self.latency and not self.jitter:
+            return 0.0
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def lost(self):
+        return self.loss > 0 and self.random.random() < self.loss
+
+    def next_disconnect(self):
+        if self.disconnect_rate <= 0:
+            return None
+        return self.random.expovariate(self.disconnect_rate)
+
+
+class Firmware:
+    # The pins and globals of test.ino; handle_command() returns what the
+    # firmware would print on Serial
+    def __init__(self, loop, on_serial=None):
+        self.loop = loop
+        self.on_serial = on_serial
+        self.led1 = self.led2 = self.pump = False
+        self.is_watering = False
+        self.water_mode = False
+        self.fertilizer_mode = False
+        self.watering_start = 0.0
+        self.watering_duration = 0.0
+        self.commands = 0
+        self._auto_stop = None
+
+    def handle_command(self, cmd):
+        cmd = cmd.strip()
+        self.commands += 1
+        out = [f"Executing command: {cmd}"]
+
+        if cmd == "LED1_ON":
+            self.led1 = self.pump = True
+            self.is_watering = True
+            self.water_mode, self.fertilizer_mode = True, False
+            self.watering_start = time.monotonic()
+            out.append("Water mode ON")
+        elif cmd == "LED2_ON":
+            self.led1 = self.led2 = self.pump = True
+            self.is_watering = True
+            self.water_mode, self.fertilizer_mode = False, True
+            self.watering_start = time.monotonic()
+            out.append("Fertilizer mode ON")
+        elif cmd == "LED1_OFF":
+            self.led1 = False
+            if not self.led2:
+                self.pump = False
+                self.is_watering = False
+            out.append("Water valve OFF")
+        elif cmd == "LED2_OFF":
+            self.led2 = False
+            if not self.led1:
+                self.pump = False
+                self.is_watering = False
+            out.append("Fertilizer valve OFF")
+        elif cmd in ("LED_OFF", "STOP"):
+            out.extend(self.stop_all())
+        elif cmd.startswith("DURATION:"):
+            self.watering_duration = _to_int(cmd[9:])
+            out.append(f"Duration set to: {self.watering_duration} seconds")
+        elif cmd == "STATUS":
+            out.append(self.status_line())
+
+        self._arm_auto_stop()
+        return out
+
+    def stop_all(self):
+        self.led1 = self.led2 = self.pump = False
+        self.is_watering = False
+        self.water_mode = self.fertilizer_mode = False
+        self.watering_duration = 0
+        return ["All systems OFF"]
+
+    def status_line(self):
+        return f"LED1:{int(self.led1)},LED2:{int(self.led2)},PUMP:{int(self.pump)}"
+
+    def status_payload(self):
+        mode = "water" if self.water_mode else "fertilizer" if self.fertilizer_mode else "idle"
+        return status_payload(self.led1, self.led2, self.pump, self.is_watering, mode,
+                              self.watering_duration)
+
+    def status_json(self):
+        mode = "water" if self.water_mode else "fertilizer" if self.fertilizer_mode else "idle"
+        return json.dumps({'led1': self.led1, 'led2': self.led2, 'pump': self.pump,
+                           'isWatering': self.is_watering, 'mode': mode}, separators=(',', ':'))
+
+    def _arm_auto_stop(self):
+        if self._auto_stop is not None:
+            self._auto_stop.cancel()
+            self._auto_stop = None
+        if self.is_watering and self.watering_duration > 0:
+            when = self.watering_start + self.watering_duration
+            self._auto_stop = self.loop.call_later(max(0.0, when - time.monotonic()), self._auto_stop_due)
+
+    def _auto_stop_due(self):
+        self._auto_stop = None
+        lines = self.stop_all() + ["Auto stop - duration reached"]
+        if self.on_serial:
+            self.on_serial(lines)
+
+
+def _to_int(text):
+    # Arduino String.toInt(): leading digits, 0 if none
+    digits = ''
+    for ch in text.strip():
+        if ch.isdigit() or (ch == '-' and not digits):
+            digits += ch
+        else:
+            break
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+
+class _Link:
+    # Command side of a TCP or serial link: text lines until PROTO:BIN1, then
+    # binary frames; a plain text line switches back, as in the firmware
+    ok_reply = None  # written after each text command
+
+    def __init__(self, device):
+        self.device = device
+        self.framer = LineFramer()
+        self.binary = False
+        self._seq = 0
+        self._queue = asyncio.Queue()
+
+    def received(self, data):
+        for item in self.framer.feed(data):
+            if item == PROTO_HELLO:
+                self.write(f"{PROTO_ACK}\r\n".encode())
+                if not self.binary:
+                    self.binary = True
+                    self.framer = BinaryFramer()
+            elif item:
+                if self.binary and isinstance(item, str):
+                    self.binary = False
+                    self.framer = LineFramer()
+                self._queue.put_nowait(item)
+
+    async def _run(self):
+        faults = self.device.faults
+        while True:
+            item = await self._queue.get()
+            if faults.lost():
+                continue
+            delay = faults.delay()
+            if delay:
+                await asyncio.sleep(delay)
+            if isinstance(item, str):
+                self.device.run_command(item)
+                if self.ok_reply:
+                    self.write(self.ok_reply)
+            else:
+                for command in item.commands:
+                    self.device.run_command(command)
+                self.send_frame(FRAME_ACK, bytes((item.seq, len(item.commands))))
+
+    def send_frame(self, frame_type, payload):
+        self.write(encode_frame(frame_type, self._seq, payload))
+        self._seq = (self._seq + 1) & 0xFF
+
+    def send_report(self, lines):
+        # The firmware's Serial lines as frames; the echo is not sent
+        events = bytes(EVENT_CODES[line] for line in lines if line in EVENT_CODES)
+        if events:
+            self.send_frame(FRAME_EVENT, events)
+        if any(line.startswith(("LED1:", "Duration set to:")) for line in lines):
+            self.send_frame(FRAME_STATUS, self.device.firmware.status_payload())
+
+    def write(self, data):
+        raise NotImplementedError
+
+
+class _CommandLink(_Link, asyncio.Protocol):
+    # TCP connection to one device: a line in, "OK" out
+    ok_reply = b"OK\r\n"
+
+    def __init__(self, device):
+        super().__init__(device)
+        self.transport = None
+        self._worker = None
+        self._disconnect = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.device.links.add(self)
+        self._worker = asyncio.ensure_future(self._run())
+        delay = self.device.faults.next_disconnect()
+        if delay is not None:
+            self._disconnect = asyncio.get_running_loop().call_later(delay, transport.abort)
+
+    def data_received(self, data):
+        self.received(data)
+
+    def connection_lost(self, exc):
+        self.device.links.discard(self)
+        self._worker.cancel()
+        if self._disconnect is not None:
+            self._disconnect.cancel()
+
+    def write(self, data):
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+
+class _HttpLink(asyncio.Protocol):
+    # Enough HTTP/1.1 for /status and /control, with keep-alive
+    def __init__(self, device):
+        self.device = device
+        self.buffer = b''
+        self.transport = None
+        self._busy = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        if not self._busy:
+            self._busy = True
+            asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        try:
+            while b'\r\n\r\n' in self.buffer and not self.transport.is_closing():
+                head, self.buffer = self.buffer.split(b'\r\n\r\n', 1)
+                await self._respond(head.decode('latin-1'))
+        finally:
+            self._busy = False
+
+    async def _respond(self, head):
+        request_line, *header_lines = head.split('\r\n')
+        try:
+            method, target, version = request_line.split(' ', 2)
+        except ValueError:
+            self.transport.close()
+            return
+        headers = {}
+        for header in header_lines:
+            name, _, value = header.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close') or \
+                     headers.get('connection', '').lower() == 'keep-alive'
+
+        faults = self.device.faults
+        if faults.lost():
+            self.transport.abort()
+            return
+        delay = faults.delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+        url = urlsplit(target)
+        if method != 'GET':
+            status, content_type, body = 405, 'text/plain', 'Method not allowed'
+        elif url.path == '/status':
+            status, content_type, body = 200, 'application/json', self.device.firmware.status_json()
+        elif url.path == '/control':
+            cmd = parse_qs(url.query).get('cmd', [''])[0]
+            if cmd:
+                self.device.run_command(cmd)
+                status, content_type, body = 200, 'text/plain', f"Command executed: {cmd}"
+            else:
+                status, content_type, body = 400, 'text/plain', "No command specified"
+        else:
+            status, content_type, body = 404, 'text/plain', f"Not found: {url.path}"
+
+        payload = body.encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}[status]
+        self.transport.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload
+        )
+        if not keep_alive:
+            self.transport.close()
+
+
+class _SerialPort(_Link):
+    # A pty pair: the app opens `path`, the emulator reads and writes the master
+    def __init__(self, device, loop):
+        import tty
+        super().__init__(device)
+        self.loop = loop
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.path = os.ttyname(self.slave)
+        self._worker = loop.create_task(self._run())
+        loop.add_reader(self.master, self._readable)
+
+    def _readable(self):
+        try:
+            data = os.read(self.master, 4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            return
+        self.received(data)
+
+    def write_lines(self, lines):
+        if self.binary:
+            self.send_report(lines)
+        else:
+            self.write(''.join(f"{line}\r\n" for line in lines).encode())
+
+    def write(self, data):
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass  # nobody reading; the firmware would not notice either
+
+    def close(self):
+        self.loop.remove_reader(self.master)
+        self._worker.cancel()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class EmulatedDevice:
+    def __init__(self, name, loop, faults):
+        self.name = name
+        self.faults = faults
+        self.firmware = Firmware(loop, on_serial=self.serial_print)
+        self.links = set()
+        self.serial = None
+        self.tcp_address = None
+        self.http_address = None
+        self._servers = []
+
+    def run_command(self, cmd):
+        self.serial_print(self.firmware.handle_command(cmd))
+
+    def serial_print(self, lines):
+        if self.serial is not None:
+            self.serial.write_lines(lines)
+        for link in self.links:
+            if link.binary:
+                link.send_report(lines)
+
+    async def start(self, loop, host, tcp_port=None, http_port=None, serial=False):
+        if tcp_port is not None:
+            server = await loop.create_server(lambda: _CommandLink(self), host, tcp_port)
+            self._servers.append(server)
+            self.tcp_address = server.sockets[0].getsockname()[:2]
+        if http_port is not None:
+            server = await loop.create_server(lambda: _HttpLink(self), host, http_port)
+            self._servers.append(server)
+            self.http_address = server.sockets[0].getsockname()[:2]
+        if serial:
+            self.serial = _SerialPort(self, loop)
+            self.serial.write_lines(BANNER)
+
+    def drop_links(self):
+        for link in list(self.links):
+            link.transport.abort()
+
+    def close(self):
+        for server in self._servers:
+            server.close()
+        self.drop_links()
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+
+
+class Emulator:
+    def __init__(self, devices=1, host='127.0.0.1', tcp_port=0, http_port=None, serial=0,
+                 faults=None):
+        # Ports are consecutive from the given base (0 picks free ports);
+        # http_port None means no HTTP server. `serial` devices also get a pty.
+        self.count = devices
+        self.host = host
+        self.tcp_port = tcp_port
+        self.http_port = http_port
+        self.serial_count = serial
+        self.faults = faults or Faults()
+        self.devices = []
+        self.loop = None
+        self._thread = None
+
+    def start(self):
+        raise_fd_limit()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='Emulator', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_devices(), self.loop).result()
+        return self
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _start_devices(self):
+        for i in range(self.count):
+            device = EmulatedDevice(f"esp32-{i}", self.loop, self.faults)
+            await device.start(
+                self.loop, self.host,
+                tcp_port=None if self.tcp_port is None else (self.tcp_port + i if self.tcp_port else 0),
+                http_port=None if self.http_port is None else (self.http_port + i if self.http_port else 0),
+                serial=i < self.serial_count
+            )
+            self.devices.append(device)
+
+    def stop(self):
+        if self.loop is None:
+            return
+
+        async def close_all():
+            for device in self.devices:
+                device.close()
+
+        asyncio.run_coroutine_threadsafe(close_all(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop = None
+
+    def drop_links(self):
+        # Disconnect every TCP client at once (e.g. a simulated access point reboot)
+        self.loop.call_soon_threadsafe(lambda: [d.drop_links() for d in self.devices])
+
+    def connection_infos(self, kind='wifi'):
+        # Connection settings the app would use for each device
+        infos = []
+        for device in self.devices:
+            if kind == 'serial' and device.serial is not None:
+                infos.append({'type': 'serial', 'port': device.serial.path, 'baudrate': 9600})
+            elif kind == 'wifi' and device.tcp_address is not None:
+                info = {'type': 'wifi', 'ip': device.tcp_address[0], 'port': device.tcp_address[1]}
+                if device.http_address is not None:
+                    info['http_port'] = device.http_address[1]
+                infos.append(info)
+        return infos
+
+    def commands(self):
+        return sum(device.firmware.commands for device in self.devices)
+
+
+def raise_fd_limit():
+    # Thousands of listeners need thousands of descriptors
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='smartwater.emulator', description='ESP32 firmware emulator')
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--tcp-port', type=int, default=9000, help='first TCP command port (0 = any)')
+    parser.add_argument('--http-port', type=int, default=None, help='first HTTP port (off if not given)')
+    parser.add_argument('--serial', type=int, default=0, metavar='N', help='give the first N devices a pty')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds added to latency')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability a command is lost')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0,
+                        help='mean forced disconnects per second per connection')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    faults = Faults(args.latency, args.jitter, args.loss, args.disconnect_rate, args.seed)
+    emulator = Emulator(args.devices, args.host, args.tcp_port, args.http_port, args.serial, faults)
+    emulator.start()
+
+    for device in emulator.devices[:10]:
+        parts = [device.name]
+        if device.tcp_address:
+            parts.append(f"tcp {device.tcp_address[0]}:{device.tcp_address[1]}")
+        if device.http_address:
+            parts.append(f"http {device.http_address[0]}:{device.http_address[1]}")
+        if device.serial:
+            parts.append(f"serial {device.serial.path}")
+        print("  ".join(parts))
+    if len(emulator.devices) > 10:
+        print(f"... {len(emulator.devices) - 10} more")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{emulator.commands()} commands handled")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# ส่งออกประวัติการรดน้ำ (CSV, CSV.gz และไฟล์แบบคอลัมน์)
+#
+# HistoryExporter walks a history view on its own thread, a chunk at a time,
+# so memory stays flat however many years are exported. Output goes to a
+# .part file that is renamed into place only once it is complete.
+#
+# The columnar format (.swcol) keeps every field in its own contiguous,
+# little-endian, 8-byte aligned array so analysis tools can mmap it and use
+# the columns in place (e.g. numpy.frombuffer). Layout:
+#
+#   header    MAGIC, uint32 version, uint32 0, uint64 rows,
+#             uint64 directory offset, uint64 directory length
+#   columns   ts <f8 (unix time), duration <i4 (min), litres <f8,
+#             mode/trigger/status <u2 (codes into the directory's
+#             dictionaries), notes_offsets <u8 (rows + 1), notes_data (utf-8)
+#   directory JSON: {"columns": {name: {dtype, offset, count}},
+#                    "dictionaries": {name: [values]}}
+
+import csv
+import gzip
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+MAGIC = b'SWHCOL\0\0'
+COLUMNAR_VERSION = 1
+HEADER = struct.Struct('<8sIIQQQ')
+CHUNK_SIZE = 4096
+
+CSV_HEADER = ['Date', 'Time', 'Mode', 'Duration', 'Status', 'Notes', 'Litres']
+
+FORMAT_CSV = 'csv'
+FORMAT_CSV_GZ = 'csv.gz'
+FORMAT_COLUMNAR = 'swcol'
+
+# (name, array typecode, numpy-style dtype)
+FIXED_COLUMNS = [
+    ('ts', 'd', '<f8'),
+    ('duration', 'i', '<i4'),
+    ('litres', 'd', '<f8'),
+    ('mode', 'H', '<u2'),
+    ('trigger', 'H', '<u2'),
+    ('status', 'H', '<u2'),
+]
+CODED = ('mode', 'trigger', 'status')
+
+
+def format_for(path):
+    if path.endswith('.gz'):
+        return FORMAT_CSV_GZ
+    if path.endswith('.' + FORMAT_COLUMNAR):
+        return FORMAT_COLUMNAR
+    return FORMAT_CSV
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _pack(values):
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class HistoryExporter:
+    def __init__(self, entries, path, fmt=None, chunk_size=CHUNK_SIZE,
+                 on_progress=None, on_finished=None):
+        self.entries = entries
+        self.path = path
+        self.fmt = fmt or format_for(path)
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.rows = 0
+        self.cancelled = False
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='HistoryExport', daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        # on_finished(rows, error) with error None on success
+        error = None
+        part = self.path + '.part'
+        try:
+            if self.fmt == FORMAT_COLUMNAR:
+                self._write_columnar(part)
+            else:
+                self._write_csv(part)
+            os.replace(part, self.path)
+        except ExportCancelled:
+            self.cancelled = True
+            error = 'cancelled'
+        except Exception as e:
+            error = str(e)
+        if error is not None:
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+        if self.on_finished:
+            self.on_finished(self.rows, error)
+
+    def _chunks(self):
+        total = len(self.entries)
+        for start in range(0, total, self.chunk_size):
+            if self._cancel.is_set():
+                raise ExportCancelled()
+            yield self.entries[start:start + self.chunk_size]
+
+    def _progress(self, done):
+        self.rows = done
+        if self.on_progress:
+            self.on_progress(done, len(self.entries))
+
+    def _write_csv(self, part):
+        if self.fmt == FORMAT_CSV_GZ:
+            f = io.TextIOWrapper(gzip.open(part, 'wb'), encoding='utf-8', newline='')
+        else:
+            f = open(part, 'w', encoding='utf-8', newline='')
+        with f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            done = 0
+            for chunk in self._chunks():
+                writer.writerows([
+                    e['datetime'].strftime('%Y-%m-%d'),
+                    e['datetime'].strftime('%H:%M'),
+                    e['mode'],
+                    e['duration'],
+                    e['status'],
+                    e['notes'],
+                    e['litres']
+                ] for e in chunk)
+                done += len(chunk)
+                self._progress(done)
+
+    def _write_columnar(self, part):
+        rows = len(self.entries)
+
+        # Every fixed-width column's place is known up front, so each chunk is
+        # written straight to its slot; notes data grows at the end
+        columns = {}
+        offset = HEADER.size
+        for name, typecode, dtype in FIXED_COLUMNS:
+            offset = _align(offset)
+            columns[name] = {'dtype': dtype, 'offset': offset, 'count': rows}
+            offset += array(typecode).itemsize * rows
+        offset = _align(offset)
+        columns['notes_offsets'] = {'dtype': '<u8', 'offset': offset, 'count': rows + 1}
+        offset += 8 * (rows + 1)
+        notes_start = _align(offset)
+
+        dictionaries = {name: {} for name in CODED}
+        notes_size = 0
+
+        with open(part, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, COLUMNAR_VERSION, 0, rows, 0, 0))
+            f.seek(columns['notes_offsets']['offset'])
+            f.write(_pack(array('Q', [0])))
+
+            done = 0
+            for chunk in self._chunks():
+                values = {name: array(typecode) for name, typecode, _ in FIXED_COLUMNS}
+                note_offsets = array('Q')
+                notes = bytearray()
+                for e in chunk:
+                    values['ts'].append(e['datetime'].timestamp())
+                    values['duration'].append(e['duration'])
+                    values['litres'].append(e['litres'])
+                    for name in CODED:
+                        codes = dictionaries[name]
+                        values[name].append(codes.setdefault(e[name], len(codes)))
+                    notes += (e['notes'] or '').encode('utf-8')
+                    note_offsets.append(notes_size + len(notes))
+
+                for name, typecode, _ in FIXED_COLUMNS:
+                    f.seek(columns[name]['offset'] + values[name].itemsize * done)
+                    f.write(_pack(values[name]))
+                f.seek(columns['notes_offsets']['offset'] + 8 * (done + 1))
+                f.write(_pack(note_offsets))
+                f.seek(notes_start + notes_size)
+                f.write(notes)
+
+                notes_size += len(notes)
+                done += len(chunk)
+                self._progress(done)
+
+            columns['notes_data'] = {'dtype': '|u1', 'offset': notes_start, 'count': notes_size}
+            directory = json.dumps({
+                'columns': columns,
+                'dictionaries': {name: list(codes) for name, codes in dictionaries.items()}
+            }).encode('utf-8')
+            directory_offset = _align(notes_start + notes_size)
+            f.seek(directory_offset)
+            f.write(directory)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, COLUMNAR_VERSION, 0, rows, directory_offset, len(directory)))
+
+
+def open_columnar(path):
+    # mmap a .swcol file; returns (rows, directory, {column: memoryview})
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, rows, directory_offset, directory_size = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != COLUMNAR_VERSION:
+        raise ValueError(f"Not a history column file: {path}")
+
+    directory = json.loads(mapped[directory_offset:directory_offset + directory_size])
+    view = memoryview(mapped)
+    typecodes = {'<f8': 'd', '<i4': 'i', '<u2': 'H', '<u8': 'Q', '|u1': 'B'}
+    columns = {}
+    for name, info in directory['columns'].items():
+        typecode = typecodes[info['dtype']]
+        size = array(typecode).itemsize * info['count']
+        columns[name] = view[info['offset']:info['offset'] + size].cast(typecode)
+    return rows, directory, columns
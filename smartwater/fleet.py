@@ -0,0 +1,673 @@
+# จัดการการเชื่อมต่อ ESP32 หลายตัวบน asyncio event loop เดียว
+#
+# Every device gets its own state, command queue and reconnect loop, but they
+# all share one event loop running in one background thread, so the number of
+# threads does not grow with the number of controllers. TCP links use a
+# BufferedProtocol that reads straight into the device's LineFramer; serial
+# ports are watched with add_reader() on their fd (or polled where the loop
+# cannot watch serial handles, i.e. Windows).
+#
+# Connections are kept open for the lifetime of the device. A link counts as
+# dead when the transport errors out, or when an idle link does not answer a
+# STATUS heartbeat in time; it is then reopened with jittered exponential
+# backoff. Connect latency, uptime and reconnect counts are kept per device.
+#
+# With framing 'auto' each (re)connect first offers binary framing (see
+# framing.py) and falls back to text lines if the firmware does not accept.
+# Queued commands are written in batches: one write, and in binary mode one
+# CMD frame, for everything waiting. The writer waits until the link has
+# taken each batch (the TCP transport drained below its high-water mark, the
+# serial write finished in an executor thread), so a slow device backs
+# commands up in its bounded queue rather than in an unbounded buffer, and a
+# full queue refuses new ones. While they wait, a stop makes the valve
+# commands before it pointless and the same command twice in a row is sent
+# once.
+#
+# send() returns a concurrent.futures.Future. Acknowledgements are matched to
+# writes in order ("OK" on TCP, the "Executing command:" echo on serial, ACK
+# frames in binary mode), which completes the future with the round trip and
+# feeds a histogram per device. Commands that are refused, never acknowledged
+# or still pending when the link drops fail with CommandError. A probe timer
+# records how late the loop itself runs.
+
+import asyncio
+import concurrent.futures
+import functools
+import socket
+import threading
+import time
+from collections import deque
+
+import serial
+
+from .backoff import Backoff
+from .framing import (FRAME_CMD, FRAMING_AUTO, FRAMING_TEXT, PROTO_ACK, PROTO_HELLO, BinaryFramer,
+                      LineFramer, command_chunks, encode_frame)
+from .metrics import Histogram
+
+# Device states reported through on_state
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+RECONNECTING = 'reconnecting'
+DISCONNECTED = 'disconnected'
+FAILED = 'failed'
+
+CONNECT_TIMEOUT = 5
+SERIAL_POLL_INTERVAL = 0.05
+HEARTBEAT_COMMAND = "STATUS"
+NEGOTIATE_TIMEOUT = 2.0
+# Most commands written at once
+MAX_BATCH = 32
+# Writes still waiting for an acknowledgement that are remembered
+MAX_UNACKED = 256
+# Written commands not acknowledged this long after later replies have failed
+ACK_TIMEOUT = 10.0
+SERIAL_WRITE_TIMEOUT = 5.0
+# Bytes a TCP transport may buffer before the writer waits for it
+WRITE_BUFFER_HIGH = 16 * 1024
+LAG_PROBE_INTERVAL = 1.0
+SERIAL_ACK_PREFIX = "Executing command: "
+
+# Unsent commands a later stop makes pointless, and commands that change
+# nothing when sent twice in a row
+STOP_COMMANDS = frozenset(("STOP", "LED_OFF"))
+SUPERSEDED_BY_STOP = STOP_COMMANDS | {"LED1_ON", "LED2_ON", "LED1_OFF", "LED2_OFF"}
+IDEMPOTENT_COMMANDS = SUPERSEDED_BY_STOP | {"STATUS"}
+
+
+class CommandError(Exception):
+    pass
+
+
+class CommandSuperseded(CommandError):
+    pass
+
+
+def _settle(futures, result=None, error=None):
+    for future in futures:
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except concurrent.futures.InvalidStateError:
+            pass  # cancelled by the sender meanwhile
+
+
+def device_id_for(conn_info):
+    if conn_info['type'] == 'serial':
+        return conn_info['port']
+    return f"{conn_info['ip']}:{conn_info['port']}"
+
+
+def describe(conn_info):
+    if conn_info['type'] == 'serial':
+        return f"Serial: {conn_info['port']}"
+    return f"WiFi: {conn_info['ip']}:{conn_info['port']}"
+
+
+def _enable_keepalive(sock, idle):
+    # Let the OS notice a silently dropped TCP peer as well
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(1, int(idle)))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(idle) // 3))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+class CommandQueue:
+    # Commands waiting for the writer, each with the futures of its senders
+    # (none for heartbeat probes); lives on the fleet loop
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.coalesced = 0
+        self._items = deque()  # [command, [futures]]
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, command, futures):
+        # False if there is no room
+        items = self._items
+        if command in STOP_COMMANDS:
+            while items and items[-1][0] in SUPERSEDED_BY_STOP:
+                old, old_futures = items.pop()
+                self.coalesced += 1
+                if old in STOP_COMMANDS:
+                    futures = old_futures + futures
+                else:
+                    _settle(old_futures, error=CommandSuperseded(f"{old} superseded by {command}"))
+            # A stop is never refused for lack of room
+        elif items and items[-1][0] == command and command in IDEMPOTENT_COMMANDS:
+            items[-1][1].extend(futures)
+            self.coalesced += 1
+            return True
+        elif len(items) >= self.maxsize:
+            return False
+        items.append([command, futures])
+        self._ready.set()
+        return True
+
+    async def get_batch(self, limit):
+        # Up to `limit` commands, skipping those every sender has cancelled
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        batch = []
+        while self._items and len(batch) < limit:
+            command, futures = self._items.popleft()
+            running = [future for future in futures if future.set_running_or_notify_cancel()]
+            if running or not futures:
+                batch.append((command, running))
+        return batch
+
+    def drain(self):
+        items = list(self._items)
+        self._items.clear()
+        return items
+
+
+class _TcpProtocol(asyncio.BufferedProtocol):
+    def __init__(self, device):
+        self.device = device
+        # Set while the transport holds more than its high-water mark
+        self._resumed = None
+
+    def pause_writing(self):
+        self._resumed = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        resumed, self._resumed = self._resumed, None
+        if resumed is not None and not resumed.done():
+            resumed.set_result(None)
+
+    async def drain(self):
+        if self._resumed is not None:
+            await self._resumed
+
+    def get_buffer(self, sizehint):
+        return self.device.framer.free_space()
+
+    def buffer_updated(self, nbytes):
+        self.device.on_bytes(nbytes)
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc):
+        self.resume_writing()
+        self.device.on_link_lost(exc)
+
+
+class ManagedDevice:
+    def __init__(self, fleet, device_id, conn_info):
+        self.fleet = fleet
+        self.device_id = device_id
+        self.conn_info = conn_info
+        self.state = DISCONNECTED
+        self.framing = conn_info.get('framing', fleet.framing)
+        self.framer = LineFramer()
+        self.binary = False
+        self.latencies = deque(maxlen=100)
+        self.reply_rtt = Histogram()
+        self.backoff = Backoff(fleet.reconnect_delay, fleet.max_reconnect_delay)
+        self.connect_times = deque(maxlen=100)
+        self.connects = 0
+        self.reconnects = 0
+        self.connected_since = None
+        self.total_uptime = 0.0
+        self.last_error = ''
+        self.commands = None
+        self.task = None
+        self._transport = None
+        self._protocol = None
+        self._serial = None
+        self._poll_handle = None
+        self._lost = None
+        self._sent_at = None
+        # (written at, [(command, futures)]) per write or CMD frame, oldest first
+        self._unacked = deque()
+        self._acks_seen = 0
+        self._last_rx = 0.0
+        self._tx_seq = 0
+        self._negotiation = None
+
+    def set_state(self, state, message=''):
+        self.state = state
+        self.fleet._notify_state(self.device_id, state, message)
+
+    async def run(self):
+        connected_once = False
+        try:
+            while True:
+                self.set_state(RECONNECTING if connected_once else CONNECTING)
+                started = time.monotonic()
+                try:
+                    await self._open()
+                except Exception as e:
+                    self.last_error = str(e)
+                    # A device that never came up is reported, not retried
+                    if not connected_once:
+                        self.set_state(FAILED, f"Connection failed: {e}")
+                        return
+                    await asyncio.sleep(self.backoff.next_delay())
+                    continue
+
+                now = time.monotonic()
+                self.connect_times.append((now - started) * 1000)
+                self.connects += 1
+                if connected_once:
+                    self.reconnects += 1
+                connected_once = True
+                self.last_error = ''
+                self.backoff.reset()
+                self.connected_since = now
+                self._last_rx = now
+
+                self.set_state(CONNECTED, describe(self.conn_info))
+                workers = [asyncio.create_task(self._write_loop()),
+                           asyncio.create_task(self._heartbeat_loop())]
+                try:
+                    await self._lost.wait()
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    self._close()
+                    self._fail_pending(CommandError(self.last_error or "connection lost"))
+                    self.total_uptime += time.monotonic() - self.connected_since
+                    self.connected_since = None
+
+                reason = f"Connection lost: {self.last_error}" if self.last_error else "Connection lost"
+                self.set_state(RECONNECTING, reason)
+                await asyncio.sleep(self.backoff.next_delay())
+        finally:
+            self._close()
+            self._fail_pending(CommandError("disconnected"))
+            if self.state != FAILED:
+                self.set_state(DISCONNECTED)
+
+    async def _open(self):
+        loop = asyncio.get_running_loop()
+        self.framer = LineFramer()
+        self.binary = False
+        self._lost = asyncio.Event()
+        self._sent_at = None
+        self._unacked.clear()
+        self._acks_seen = 0
+
+        if self.conn_info['type'] == 'serial':
+            self._serial = await loop.run_in_executor(None, functools.partial(
+                serial.Serial,
+                port=self.conn_info['port'],
+                baudrate=self.conn_info['baudrate'],
+                timeout=0,
+                write_timeout=SERIAL_WRITE_TIMEOUT
+            ))
+            try:
+                loop.add_reader(self._serial.fileno(), self._on_serial_readable)
+            except (AttributeError, NotImplementedError, OSError, ValueError):
+                # No pollable fd: pyserial on Windows raises io.UnsupportedOperation
+                self._poll_handle = loop.call_later(SERIAL_POLL_INTERVAL, self._poll_serial)
+        else:
+            self._transport, self._protocol = await asyncio.wait_for(
+                loop.create_connection(
+                    lambda: _TcpProtocol(self),
+                    self.conn_info['ip'], self.conn_info['port']
+                ),
+                CONNECT_TIMEOUT
+            )
+            self._transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+            sock = self._transport.get_extra_info('socket')
+            if sock is not None and self.fleet.heartbeat_interval:
+                _enable_keepalive(sock, self.fleet.heartbeat_interval)
+
+        if self.framing == FRAMING_AUTO:
+            await self._negotiate()
+
+    async def _negotiate(self):
+        # Old firmware answers the offer with "OK" (TCP) or its serial echo
+        self._negotiation = asyncio.get_running_loop().create_future()
+        try:
+            await self._send(f"{PROTO_HELLO}\n".encode('utf-8'))
+            self.binary = await asyncio.wait_for(self._negotiation, self.fleet.negotiate_timeout)
+        except asyncio.TimeoutError:
+            self.binary = False
+        finally:
+            self._negotiation = None
+        if self.binary:
+            self.framer = BinaryFramer()
+
+    def _negotiated(self, lines):
+        for line in lines:
+            if line == PROTO_ACK:
+                self._negotiation.set_result(True)
+            elif line in ("OK", f"Executing command: {PROTO_HELLO}"):
+                self._negotiation.set_result(False)
+            else:
+                continue  # boot banner and the like
+            return
+
+    def _close(self):
+        if self._serial is not None:
+            if self._poll_handle is not None:
+                self._poll_handle.cancel()
+                self._poll_handle = None
+            else:
+                try:
+                    asyncio.get_running_loop().remove_reader(self._serial.fileno())
+                except (AttributeError, NotImplementedError, OSError, ValueError):
+                    pass
+            self._serial.close()
+            self._serial = None
+        if self._transport is not None:
+            self._transport.abort()
+            self._transport = None
+            self._protocol = None
+
+    async def _write_loop(self):
+        while True:
+            batch = await self.commands.get_batch(MAX_BATCH)
+            if not batch:
+                continue
+            # Start the reply clocks before writing so a fast reply isn't missed
+            now = time.monotonic()
+            payload = self._encode(batch, now)
+            if self._sent_at is None:
+                self._sent_at = now
+            try:
+                await self._send(payload)
+            except Exception as e:
+                self.on_link_lost(e)
+                return
+
+    def _encode(self, batch, now):
+        if not self.binary:
+            for item in batch:
+                self._track(now, [item])
+            return ''.join(command + '\n' for command, _ in batch).encode('utf-8')
+        frames = []
+        start = 0
+        for payload, count in command_chunks([command for command, _ in batch]):
+            frames.append(encode_frame(FRAME_CMD, self._tx_seq, payload))
+            self._tx_seq = (self._tx_seq + 1) & 0xFF
+            # The device sends one ACK per frame
+            self._track(now, batch[start:start + count])
+            start += count
+        return b''.join(frames)
+
+    def _track(self, now, items):
+        if len(self._unacked) >= MAX_UNACKED:
+            _, lost = self._unacked.popleft()
+            self._fail(lost, CommandError("no acknowledgement"))
+        self._unacked.append((now, items))
+
+    async def _send(self, payload):
+        # Returns once the link has taken all of the payload
+        if self._transport is not None:
+            self._transport.write(payload)
+            await self._protocol.drain()
+        else:
+            serial_port = self._serial
+            await asyncio.get_running_loop().run_in_executor(None, serial_port.write, payload)
+
+    def _fail(self, items, error):
+        for command, futures in items:
+            if futures:
+                _settle(futures, error=error)
+                # A command replaced by a later one did not go wrong
+                if not isinstance(error, CommandSuperseded):
+                    self.fleet._notify_command_failed(self.device_id, command, str(error))
+
+    def _fail_pending(self, error):
+        # Nothing queued or unacknowledged survives a dropped link
+        if self.commands is not None:
+            self._fail(self.commands.drain(), error)
+        while self._unacked:
+            self._fail(self._unacked.popleft()[1], error)
+
+    async def _heartbeat_loop(self):
+        interval = self.fleet.heartbeat_interval
+        if not interval:
+            return
+        while True:
+            idle = time.monotonic() - self._last_rx
+            if idle < interval:
+                await asyncio.sleep(interval - idle)
+                continue
+
+            # Quiet for a whole interval - the device must answer a probe
+            probe_at = time.monotonic()
+            self.enqueue(HEARTBEAT_COMMAND, [])
+            await asyncio.sleep(self.fleet.heartbeat_timeout)
+            if self._last_rx < probe_at:
+                self.on_link_lost(TimeoutError("heartbeat timeout"))
+                return
+
+    def enqueue(self, command, futures):
+        if self.state != CONNECTED:
+            error = CommandError(f"{self.device_id} not connected")
+        elif not self.commands.put(command, futures):
+            error = CommandError(f"{self.device_id} command queue full")
+        else:
+            return
+        self._fail([(command, futures)], error)
+
+    def _on_serial_readable(self):
+        try:
+            nbytes = self._serial.readinto(self.framer.free_space())
+        except (serial.SerialException, OSError) as e:
+            # pyserial raises when a readable fd returns no data (unplugged)
+            self.on_link_lost(e)
+            return
+        if nbytes:
+            self.on_bytes(nbytes)
+
+    def _poll_serial(self):
+        self._poll_handle = None
+        try:
+            waiting = self._serial.in_waiting
+        except (serial.SerialException, OSError) as e:
+            self.on_link_lost(e)
+            return
+        if waiting:
+            self._on_serial_readable()
+        if self._serial is not None and not self._lost.is_set():
+            loop = asyncio.get_running_loop()
+            self._poll_handle = loop.call_later(SERIAL_POLL_INTERVAL, self._poll_serial)
+
+    def on_bytes(self, nbytes):
+        now = self._last_rx = time.monotonic()
+        sent_at = self._sent_at
+        if sent_at is not None:
+            self._sent_at = None
+            latency_ms = (now - sent_at) * 1000
+            self.latencies.append(latency_ms)
+            self.fleet._notify_latency(self.device_id, latency_ms)
+
+        lines = self.framer.commit(nbytes)
+        if self._negotiation is not None:
+            if not self._negotiation.done():
+                self._negotiated(lines)
+            return
+        if self.binary or self._unacked:
+            self._match_acks(lines, now)
+        if lines:
+            self.fleet._notify_lines(self.device_id, lines)
+
+    def _match_acks(self, lines, now):
+        if self.binary:
+            acks = self.framer.acks - self._acks_seen
+            self._acks_seen = self.framer.acks
+        elif self._serial is not None:
+            acks = sum(1 for line in lines if line.startswith(SERIAL_ACK_PREFIX))
+        else:
+            acks = lines.count("OK")
+        unacked = self._unacked
+        while acks and unacked:
+            sent_at, items = unacked.popleft()
+            rtt = now - sent_at
+            self.reply_rtt.observe(rtt, len(items))
+            for _, futures in items:
+                _settle(futures, rtt)
+            acks -= 1
+        # The device is answering, so whatever it skipped is not coming
+        while unacked and now - unacked[0][0] > ACK_TIMEOUT:
+            self._fail(unacked.popleft()[1], CommandError("no acknowledgement"))
+
+    def on_link_lost(self, exc):
+        if exc is not None:
+            self.last_error = str(exc) or type(exc).__name__
+        if self._lost is not None:
+            self._lost.set()
+
+    def metrics(self):
+        now = time.monotonic()
+        uptime = now - self.connected_since if self.connected_since is not None else 0.0
+        connect_times = self.connect_times
+        latencies = self.latencies
+        return {
+            'state': self.state,
+            'uptime': uptime,
+            'total_uptime': self.total_uptime + uptime,
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'last_connect_ms': connect_times[-1] if connect_times else None,
+            'avg_connect_ms': sum(connect_times) / len(connect_times) if connect_times else None,
+            'avg_reply_ms': sum(latencies) / len(latencies) if latencies else None,
+            'rtt': self.reply_rtt.summary(),
+            'queued': len(self.commands) if self.commands is not None else 0,
+            'coalesced': self.commands.coalesced if self.commands is not None else 0,
+            'unacked': len(self._unacked),
+            'framing': 'binary' if self.binary else 'text',
+            'crc_errors': getattr(self.framer, 'crc_errors', 0),
+            'lost_frames': getattr(self.framer, 'lost_frames', 0),
+            'last_error': self.last_error
+        }
+
+
+class FleetManager:
+    def __init__(self, on_lines=None, on_state=None, on_latency=None,
+                 reconnect_delay=1.0, max_reconnect_delay=60.0,
+                 heartbeat_interval=30.0, heartbeat_timeout=5.0, queue_size=32,
+                 framing=FRAMING_TEXT, negotiate_timeout=NEGOTIATE_TIMEOUT, on_command_failed=None):
+        self.on_lines = on_lines
+        self.on_state = on_state
+        self.on_latency = on_latency
+        self.on_command_failed = on_command_failed
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.queue_size = queue_size
+        # Default for devices whose conn_info has no 'framing'
+        self.framing = framing
+        self.negotiate_timeout = negotiate_timeout
+        self.devices = {}
+        self.loop = None
+        # How late the loop runs timers, i.e. how long a reply can sit unread
+        self.loop_lag = Histogram()
+        self._thread = None
+        self._lag_task = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='FleetManager', daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._lag_task = self.loop.create_task(self._probe_lag())
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def stop(self, timeout=5):
+        if self.loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        try:
+            future.result(timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            self.loop = None
+
+    async def _probe_lag(self):
+        while True:
+            due = time.monotonic() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.loop_lag.observe(max(0.0, time.monotonic() - due))
+
+    async def _shutdown(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        tasks = [d.task for d in self.devices.values() if d.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.devices.clear()
+
+    # Public API - safe to call from any thread
+    def add_device(self, conn_info):
+        device_id = device_id_for(conn_info)
+        if device_id not in self.devices:
+            device = ManagedDevice(self, device_id, conn_info)
+            self.devices[device_id] = device
+            self.loop.call_soon_threadsafe(self._start_device, device)
+        return device_id
+
+    def remove_device(self, device_id):
+        device = self.devices.pop(device_id, None)
+        if device is not None:
+            self.loop.call_soon_threadsafe(self._stop_device, device)
+
+    def send(self, device_id, command):
+        # concurrent.futures.Future with the round trip in seconds once the
+        # device has acknowledged the command, or a CommandError
+        future = concurrent.futures.Future()
+        device = self.devices.get(device_id)
+        if device is None or device.state != CONNECTED:
+            future.set_exception(CommandError(f"{device_id} not connected"))
+        else:
+            self.loop.call_soon_threadsafe(device.enqueue, command, [future])
+        return future
+
+    def is_connected(self, device_id):
+        device = self.devices.get(device_id)
+        return device is not None and device.state == CONNECTED
+
+    def metrics(self):
+        return {device_id: device.metrics() for device_id, device in list(self.devices.items())}
+
+    def _start_device(self, device):
+        device.commands = CommandQueue(self.queue_size)
+        device.task = self.loop.create_task(device.run())
+        device.task.add_done_callback(functools.partial(self._device_done, device))
+
+    def _stop_device(self, device):
+        if device.task is not None:
+            device.task.cancel()
+
+    def _device_done(self, device, task):
+        # Failed devices drop out of the fleet on their own
+        if device.state == FAILED and self.devices.get(device.device_id) is device:
+            del self.devices[device.device_id]
+
+    # Callbacks run on the fleet thread
+    def _notify_lines(self, device_id, lines):
+        if self.on_lines:
+            self.on_lines(device_id, lines)
+
+    def _notify_state(self, device_id, state, message):
+        if self.on_state:
+            self.on_state(device_id, state, message)
+
+    def _notify_latency(self, device_id, latency_ms):
+        if self.on_latency:
+            self.on_latency(device_id, latency_ms)
+
+    def _notify_command_failed(self, device_id, command, error):
+        if self.on_command_failed:
+            self.on_command_failed(device_id, command, error)
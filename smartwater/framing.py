@@ -0,0 +1,326 @@
+# Incremental line framing ที่ใช้ร่วมกันระหว่าง Serial และ TCP
+#
+# Bytes are read straight into a preallocated bytearray through a memoryview
+# (recv_into / readinto), complete "\n"-terminated frames are sliced out with
+# bytearray.find() and decoded in place, and only the trailing partial frame is
+# moved back to the start of the buffer once per read.
+
+import binascii
+import functools
+import struct
+from collections import namedtuple
+
+DEFAULT_MAX_FRAME = 1024
+DEFAULT_READ_SIZE = 4096
+
+
+class LineFramer:
+    def __init__(self, max_frame_size=DEFAULT_MAX_FRAME, read_size=DEFAULT_READ_SIZE,
+                 encoding='utf-8'):
+        self.max_frame_size = max_frame_size
+        self.encoding = encoding
+        self._buffer = bytearray(max_frame_size + read_size)
+        self._view = memoryview(self._buffer)
+        self._end = 0
+        self._discarding = False
+        # Number of frames dropped for exceeding max_frame_size
+        self.overflows = 0
+
+    def free_space(self):
+        # Writable tail of the buffer; pass to recv_into()/readinto()
+        return self._view[self._end:]
+
+    def commit(self, nbytes):
+        # Account for nbytes written into free_space() and return all complete lines
+        self._end += nbytes
+        return self._drain()
+
+    def feed(self, data):
+        # Copying entry point for transports that can only return bytes
+        lines = []
+        data = memoryview(data)
+        while data:
+            space = self.free_space()
+            n = min(len(space), len(data))
+            space[:n] = data[:n]
+            lines.extend(self.commit(n))
+            data = data[n:]
+        return lines
+
+    def pending(self):
+        return self._end
+
+    def reset(self):
+        self._end = 0
+        self._discarding = False
+
+    def _drain(self):
+        buf = self._buffer
+        end = self._end
+        start = 0
+        lines = []
+
+        while True:
+            newline = buf.find(b'\n', start, end)
+            if newline < 0:
+                break
+            if self._discarding:
+                # Tail of an oversized frame - drop it and resync here
+                self._discarding = False
+            elif newline - start > self.max_frame_size:
+                self.overflows += 1
+            else:
+                line = str(self._view[start:newline], self.encoding, 'replace').strip()
+                if line:
+                    lines.append(line)
+            start = newline + 1
+
+        remaining = end - start
+        if self._discarding:
+            remaining = 0
+        elif remaining > self.max_frame_size:
+            # No terminator within the limit: drop what we have and skip
+            # everything up to the next newline
+            self.overflows += 1
+            self._discarding = True
+            remaining = 0
+        elif remaining and start:
+            self._view[:remaining] = self._view[start:end]
+
+        self._end = remaining
+        return lines
+
+
+# Binary framing, offered with the text line "PROTO:BIN1" after connecting.
+# Firmware that knows it answers "PROTO:BIN1 OK" and switches that link to
+# frames; anything else ("OK" over TCP, the serial echo, silence) keeps text.
+#
+#   0xA5 | type | seq | len | payload[len] | CRC-16/CCITT-FALSE (LE)
+#
+# The CRC covers type..payload. One CMD frame carries several commands as
+# one-byte opcodes. The device answers each with an ACK (CMD seq, commands
+# run) and reports what it would print on Serial as EVENT codes, a 4-byte
+# STATUS or TEXT. Both sides number their own frames, so the receiver can
+# count lost ones. After a bad CRC the decoder resyncs on the next 0xA5.
+# Text lines between frames (a rebooted board's banner, a fresh
+# "PROTO:BIN1") are still returned as lines.
+
+PROTO_HELLO = "PROTO:BIN1"
+PROTO_ACK = "PROTO:BIN1 OK"
+
+# Values of conn_info['framing'] / FleetManager(framing=...)
+FRAMING_TEXT = 'text'
+FRAMING_AUTO = 'auto'
+
+SYNC = 0xA5
+FRAME_CMD = 0x01
+FRAME_ACK = 0x81
+FRAME_EVENT = 0x82
+FRAME_STATUS = 0x83
+FRAME_TEXT = 0x84
+FRAME_TYPES = frozenset((FRAME_CMD, FRAME_ACK, FRAME_EVENT, FRAME_STATUS, FRAME_TEXT))
+
+HEADER_SIZE = 4
+CRC_SIZE = 2
+MAX_PAYLOAD = 255
+MAX_BINARY_FRAME = HEADER_SIZE + MAX_PAYLOAD + CRC_SIZE
+
+OP_DURATION = 0x07
+OP_TEXT = 0x7F
+OPCODES = {'LED1_ON': 0x01, 'LED2_ON': 0x02, 'LED1_OFF': 0x03, 'LED2_OFF': 0x04,
+           'STOP': 0x05, 'LED_OFF': 0x05, 'STATUS': 0x06}
+OPCODE_NAMES = {0x01: 'LED1_ON', 0x02: 'LED2_ON', 0x03: 'LED1_OFF', 0x04: 'LED2_OFF',
+                0x05: 'STOP', 0x06: 'STATUS'}
+
+# EVENT codes and the Serial.println() text they stand for
+EVENT_LINES = {0x01: "Water mode ON", 0x02: "Fertilizer mode ON", 0x03: "Water valve OFF",
+               0x04: "Fertilizer valve OFF", 0x05: "All systems OFF",
+               0x06: "Auto stop - duration reached"}
+EVENT_CODES = {line: code for code, line in EVENT_LINES.items()}
+
+# STATUS payload: flags (bit0 LED1, bit1 LED2, bit2 PUMP, bit3 watering),
+# mode (0 idle, 1 water, 2 fertilizer), duration in seconds (u16)
+STATUS_FORMAT = struct.Struct('<BBH')
+STATUS_MODES = ('idle', 'water', 'fertilizer')
+STATUS_LINES = tuple(f"LED1:{f & 1},LED2:{f >> 1 & 1},PUMP:{f >> 2 & 1}" for f in range(8))
+
+# Commands and the frame numbers each end uses
+CommandBatch = namedtuple('CommandBatch', ['seq', 'commands'])
+
+
+def crc16(data, crc=0xFFFF):
+    return binascii.crc_hqx(data, crc)
+
+
+def encode_frame(frame_type, seq, payload=b''):
+    head = bytes((SYNC, frame_type, seq & 0xFF, len(payload)))
+    crc = crc16(payload, crc16(head[1:]))
+    return head + payload + bytes((crc & 0xFF, crc >> 8))
+
+
+@functools.lru_cache(maxsize=256)
+def encode_command(command):
+    op = OPCODES.get(command)
+    if op is not None:
+        return bytes((op,))
+    arg = command[9:]
+    if command.startswith("DURATION:") and arg.isdigit() and int(arg) <= 0xFFFF:
+        return struct.pack('<BH', OP_DURATION, int(arg))
+    data = command.encode('utf-8')[:MAX_PAYLOAD - 2]
+    return bytes((OP_TEXT, len(data))) + data
+
+
+def command_payloads(commands):
+    # CMD payloads for a batch of commands, split where a frame would overflow
+    for payload, _ in command_chunks(commands):
+        yield payload
+
+
+def command_chunks(commands):
+    # (CMD payload, number of commands in it)
+    payload = b''
+    count = 0
+    for command in commands:
+        encoded = encode_command(command)
+        if len(payload) + len(encoded) > MAX_PAYLOAD:
+            yield payload, count
+            payload = b''
+            count = 0
+        payload += encoded
+        count += 1
+    if payload:
+        yield payload, count
+
+
+def decode_commands(payload):
+    commands = []
+    i, n = 0, len(payload)
+    while i < n:
+        op = payload[i]
+        i += 1
+        if op == OP_DURATION and i + 2 <= n:
+            commands.append(f"DURATION:{payload[i] | payload[i + 1] << 8}")
+            i += 2
+        elif op == OP_TEXT and i < n and i + 1 + payload[i] <= n:
+            commands.append(str(payload[i + 1:i + 1 + payload[i]], 'utf-8', 'replace'))
+            i += 1 + payload[i]
+        elif op in OPCODE_NAMES:
+            commands.append(OPCODE_NAMES[op])
+        else:
+            break  # unknown opcode: the rest cannot be parsed
+    return commands
+
+
+def status_payload(led1, led2, pump, watering, mode, duration):
+    flags = led1 | led2 << 1 | pump << 2 | watering << 3
+    return STATUS_FORMAT.pack(flags, STATUS_MODES.index(mode), min(max(0, duration), 0xFFFF))
+
+
+class BinaryFramer:
+    # Drop-in for LineFramer once a link has switched to frames. commit()
+    # returns reply lines (EVENT/STATUS/TEXT decoded to the firmware's text)
+    # and, on the device side, a CommandBatch per CMD frame
+    def __init__(self, read_size=DEFAULT_READ_SIZE, encoding='utf-8'):
+        self.encoding = encoding
+        self._buffer = bytearray(MAX_BINARY_FRAME + read_size)
+        self._view = memoryview(self._buffer)
+        self._end = 0
+        self._text = LineFramer(encoding=encoding)
+        self._resyncing = False
+        self._rx_seq = None
+        self.overflows = 0
+        self.crc_errors = 0
+        self.lost_frames = 0
+        self.acks = 0
+        self.last_ack = None  # (CMD seq, commands run)
+
+    def free_space(self):
+        return self._view[self._end:]
+
+    def commit(self, nbytes):
+        self._end += nbytes
+        return self._drain()
+
+    def feed(self, data):
+        items = []
+        data = memoryview(data)
+        while data:
+            space = self.free_space()
+            n = min(len(space), len(data))
+            space[:n] = data[:n]
+            items.extend(self.commit(n))
+            data = data[n:]
+        return items
+
+    def pending(self):
+        return self._end
+
+    def reset(self):
+        self._end = 0
+        self._text.reset()
+        self._resyncing = False
+        self._rx_seq = None
+
+    def _drain(self):
+        buf = self._buffer
+        view = self._view
+        end = self._end
+        pos = 0
+        items = []
+        crc_hqx = binascii.crc_hqx
+
+        while pos < end:
+            start = pos if buf[pos] == SYNC else buf.find(SYNC, pos, end)
+            if start < 0:
+                start = end
+            if start > pos:
+                # Bytes outside any frame: text, unless they follow a bad frame
+                if not self._resyncing:
+                    items.extend(self._text.feed(view[pos:start]))
+                pos = start
+                continue
+            if end - start < HEADER_SIZE:
+                break
+            body_end = start + HEADER_SIZE + buf[start + 3]
+            if body_end + CRC_SIZE > end:
+                break
+            frame_type = buf[start + 1]
+            if (frame_type not in FRAME_TYPES or
+                    crc_hqx(view[start + 1:body_end], 0xFFFF) != buf[body_end] | buf[body_end + 1] << 8):
+                self.crc_errors += 1
+                self._resyncing = True
+                pos = start + 1
+                continue
+            self._resyncing = False
+
+            seq = buf[start + 2]
+            if self._rx_seq is not None and seq != (self._rx_seq + 1) & 0xFF:
+                self.lost_frames += (seq - self._rx_seq - 1) & 0xFF
+            self._rx_seq = seq
+            if frame_type == FRAME_STATUS and body_end > start + HEADER_SIZE:
+                items.append(STATUS_LINES[buf[start + HEADER_SIZE] & 7])
+            elif frame_type == FRAME_EVENT:
+                for code in view[start + HEADER_SIZE:body_end]:
+                    line = EVENT_LINES.get(code)
+                    if line is not None:
+                        items.append(line)
+            else:
+                self._frame(frame_type, seq, bytes(view[start + HEADER_SIZE:body_end]), items)
+            pos = body_end + CRC_SIZE
+
+        remaining = end - pos
+        if remaining and pos:
+            view[:remaining] = view[pos:end]
+        self._end = remaining
+        return items
+
+    def _frame(self, frame_type, seq, payload, items):
+        if frame_type == FRAME_TEXT:
+            line = str(payload, self.encoding, 'replace').strip()
+            if line:
+                items.append(line)
+        elif frame_type == FRAME_ACK and len(payload) >= 2:
+            self.acks += 1
+            self.last_ack = (payload[0], payload[1])
+        elif frame_type == FRAME_CMD:
+            items.append(CommandBatch(seq, decode_commands(payload)))
@@ -0,0 +1,427 @@
+# ประวัติการรดน้ำ (ไม่ขึ้นกับ Qt)
+#
+# WateringHistory keeps records in a list and is used where nothing needs to
+# survive a restart. SqliteHistory has the same interface but persists to a
+# SQLite database in WAL mode: records are handed to a writer thread that
+# commits them in batches, and filters become indexed range queries on the
+# timestamp column. Both keep a StatsRollup up to date on every add; the
+# SQLite store also maintains per-day totals on disk so the rollup can be
+# rebuilt at startup without reading every record.
+#
+# Time ranges are binary searches on timestamp order (bisect over the sorted
+# list, or the ts index in SQLite) and come back as views rather than copies,
+# so a filter costs the size of its result, not the size of the history.
+
+import bisect
+import queue
+import sqlite3
+import threading
+from array import array
+from datetime import date, datetime, timedelta
+
+from .settings import DEFAULTS
+from .stats import StatsRollup
+
+FILTERS = ['All', 'Today', 'This Week', 'This Month']
+
+SCHEMA_VERSION = 2
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.2
+
+# SqliteHistoryView reads records this many at a time and keeps a few pages
+PAGE_SIZE = 256
+PAGE_CACHE = 16
+
+
+def make_entry(mode, duration, trigger, status, notes=None, when=None, litres=None):
+    return {
+        'datetime': when or datetime.now(),
+        'mode': mode,
+        'duration': duration,
+        'trigger': trigger,
+        'status': status,
+        'notes': notes if notes is not None else trigger,
+        'litres': litres if litres is not None else duration * DEFAULTS['flow_rate']
+    }
+
+
+def filter_range(filter_text, now=None):
+    # [start, end) covered by a history filter; None means unbounded
+    if filter_text not in FILTERS[1:]:
+        return None, None
+
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if filter_text == 'Today':
+        return today, today + timedelta(days=1)
+    elif filter_text == 'This Week':
+        week_start = today - timedelta(days=now.weekday())
+        return week_start, week_start + timedelta(days=7)
+    else:
+        month_start = today.replace(day=1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        return month_start, next_month
+
+
+def in_range(entry, start, end):
+    when = entry['datetime']
+    return (start is None or when >= start) and (end is None or when < end)
+
+
+class HistoryView:
+    # Read-only window onto entries[start:stop]; slicing gives another view
+    __slots__ = ('_entries', '_start', '_stop')
+
+    def __init__(self, entries, start=0, stop=None):
+        self._entries = entries
+        self._start = start
+        self._stop = len(entries) if stop is None else stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return HistoryView(self._entries, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('history view index out of range')
+        return self._entries[self._start + index]
+
+    def __iter__(self):
+        entries = self._entries
+        for i in range(self._start, self._stop):
+            yield entries[i]
+
+
+class SqliteHistoryView:
+    # The ids in range are read from the ts index up front (8 bytes a row);
+    # whole records are only loaded, a page at a time, for rows that are used.
+    # Records still waiting for the writer follow the stored ones.
+    def __init__(self, history, ids, pending):
+        self._history = history
+        self._ids = ids
+        self._pending = pending
+        self._pages = {}
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('history view index out of range')
+        if index >= len(self._ids):
+            return self._pending[index - len(self._ids)]
+
+        page_no, offset = divmod(index, PAGE_SIZE)
+        page = self._page(page_no)
+        if offset >= len(page):
+            # Only clear() deletes rows
+            raise IndexError('history cleared since the view was taken')
+        return page[offset]
+
+    def __iter__(self):
+        # A page at a time, so rows cleared meanwhile are skipped
+        for page_no in range(-(-len(self._ids) // PAGE_SIZE)):
+            yield from self._page(page_no)
+        yield from self._pending
+
+    def _page(self, page_no):
+        page = self._pages.get(page_no)
+        if page is None:
+            if len(self._pages) >= PAGE_CACHE:
+                self._pages.clear()
+            start = page_no * PAGE_SIZE
+            page = self._pages[page_no] = self._history.fetch(self._ids[start:start + PAGE_SIZE])
+        return page
+
+
+class WateringHistory:
+    def __init__(self):
+        # Kept in timestamp order; _times mirrors it for bisect
+        self.entries = []
+        self._times = []
+        self.rollup = StatsRollup()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, mode, duration, trigger, status, notes=None, when=None, litres=None):
+        entry = make_entry(mode, duration, trigger, status, notes, when, litres)
+        when = entry['datetime']
+        if not self._times or when >= self._times[-1]:
+            self.entries.append(entry)
+            self._times.append(when)
+        else:
+            # Back-dated record; shifts rows under any view taken earlier
+            pos = bisect.bisect_right(self._times, when)
+            self.entries.insert(pos, entry)
+            self._times.insert(pos, when)
+        self.rollup.add(when, duration, entry['litres'])
+        return entry
+
+    def clear(self):
+        # New lists, so views taken before the clear keep their rows
+        self.entries = []
+        self._times = []
+        self.rollup.clear()
+
+    def between(self, start=None, end=None):
+        lo = 0 if start is None else bisect.bisect_left(self._times, start)
+        hi = len(self._times) if end is None else bisect.bisect_left(self._times, end, lo)
+        return HistoryView(self.entries, lo, hi)
+
+    def filter(self, filter_text, now=None):
+        return self.between(*filter_range(filter_text, now))
+
+    def statistics(self, now=None):
+        return self.rollup.summary(now)
+
+    def close(self):
+        pass
+
+
+class SqliteHistory:
+    def __init__(self, path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, on_error=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Called with a message, on the writer thread, when a batch is lost
+        self.on_error = on_error
+
+        self._db = self._connect()
+        self._create_schema()
+        self.rollup = StatsRollup()
+        self._load_rollup()
+
+        # Records handed to the writer but not committed yet; reads merge them
+        # in so callers never see a record disappear between add() and commit
+        self._pending = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='HistoryWriter', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def _create_schema(self):
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        with self._db:
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY,
+                    ts REAL NOT NULL,
+                    mode TEXT NOT NULL,
+                    duration INTEGER NOT NULL,
+                    trigger TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    notes TEXT NOT NULL DEFAULT '',
+                    litres REAL NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS history_ts ON history (ts);
+                CREATE INDEX IF NOT EXISTS history_mode_ts ON history (mode, ts);
+                CREATE INDEX IF NOT EXISTS history_trigger_ts ON history (trigger, ts);
+                CREATE TABLE IF NOT EXISTS daily_totals (
+                    day TEXT PRIMARY KEY,
+                    sessions INTEGER NOT NULL,
+                    minutes INTEGER NOT NULL,
+                    litres REAL NOT NULL
+                );
+            ''')
+            if version == 1:
+                # v1 didn't record litres; assume the default flow rate
+                self._db.execute('ALTER TABLE history ADD COLUMN litres REAL NOT NULL DEFAULT 0')
+                self._db.execute('UPDATE history SET litres = duration * ?',
+                                 (DEFAULTS['flow_rate'],))
+                self._db.execute('''
+                    INSERT INTO daily_totals (day, sessions, minutes, litres)
+                    SELECT date(ts, 'unixepoch', 'localtime'), COUNT(*), SUM(duration), SUM(litres)
+                    FROM history GROUP BY 1
+                ''')
+            self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _load_rollup(self):
+        rows = self._db.execute('SELECT day, sessions, minutes, litres FROM daily_totals')
+        for day, sessions, minutes, litres in rows:
+            self.rollup.add_bucket(date.fromisoformat(day), sessions, minutes, litres)
+
+    # Writes
+    def add(self, mode, duration, trigger, status, notes=None, when=None, litres=None):
+        entry = make_entry(mode, duration, trigger, status, notes, when, litres)
+        with self._lock:
+            self._pending.append(entry)
+        self.rollup.add(entry['datetime'], duration, entry['litres'])
+        self._queue.put(('insert', entry))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+        self.rollup.clear()
+        self._queue.put(('clear', None))
+        self.flush()
+
+    def flush(self):
+        # Block until everything queued so far is committed
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(('stop', None))
+        self._writer.join()
+        self._db.close()
+
+    def _write_loop(self):
+        db = self._connect()
+        try:
+            while True:
+                ops = [self._queue.get()]
+                try:
+                    # Gather whatever else arrives within the flush interval
+                    while len(ops) < self.batch_size and ops[-1][0] == 'insert':
+                        ops.append(self._queue.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    pass
+
+                try:
+                    self._apply(db, ops)
+                except sqlite3.Error as e:
+                    if self.on_error:
+                        self.on_error(f"History write error: {e}")
+                    else:
+                        print(f"History write error: {e}")
+                finally:
+                    for _ in ops:
+                        self._queue.task_done()
+
+                if ops[-1][0] == 'stop':
+                    return
+        finally:
+            db.close()
+
+    def _apply(self, db, ops):
+        # The statements run outside the lock: readers use their own
+        # connection and see none of it before the commit. Only the commit
+        # and trimming _pending are done under it, together, so a record is
+        # never read both from the table and from _pending.
+        inserts = [entry for op, entry in ops if op == 'insert']
+        try:
+            if inserts:
+                db.executemany(
+                    'INSERT INTO history (ts, mode, duration, trigger, status, notes, litres) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(e['datetime'].timestamp(), e['mode'], e['duration'],
+                      e['trigger'], e['status'], e['notes'] or '', e['litres'])
+                     for e in inserts]
+                )
+                db.executemany(
+                    'INSERT INTO daily_totals (day, sessions, minutes, litres) '
+                    'VALUES (?, 1, ?, ?) ON CONFLICT (day) DO UPDATE SET '
+                    'sessions = sessions + 1, minutes = minutes + excluded.minutes, '
+                    'litres = litres + excluded.litres',
+                    [(e['datetime'].date().isoformat(), e['duration'], e['litres'])
+                     for e in inserts]
+                )
+            if any(op == 'clear' for op, _ in ops):
+                db.execute('DELETE FROM history')
+                db.execute('DELETE FROM daily_totals')
+            with self._lock:
+                db.commit()
+                committed = {id(e) for e in inserts}
+                self._pending = [e for e in self._pending if id(e) not in committed]
+        except sqlite3.Error:
+            db.rollback()
+            raise
+
+    # Reads
+    def _where(self, start=None, end=None, mode=None, trigger=None):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(start.timestamp())
+        if end is not None:
+            clauses.append('ts < ?')
+            params.append(end.timestamp())
+        if mode is not None:
+            clauses.append('mode = ?')
+            params.append(mode)
+        if trigger is not None:
+            clauses.append('trigger = ?')
+            params.append(trigger)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        return where, params
+
+    def query(self, start=None, end=None, mode=None, trigger=None):
+        where, params = self._where(start, end, mode, trigger)
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT ts, mode, duration, trigger, status, notes, litres FROM history'
+                f'{where} ORDER BY ts, id', params
+            ).fetchall()
+            pending = list(self._pending)
+
+        entries = [self._entry(*row) for row in rows]
+        entries.extend(
+            e for e in pending
+            if in_range(e, start, end) and
+               (mode is None or e['mode'] == mode) and
+               (trigger is None or e['trigger'] == trigger)
+        )
+        return entries
+
+    def _entry(self, ts, mode, duration, trigger, status, notes, litres):
+        return {
+            'datetime': datetime.fromtimestamp(ts),
+            'mode': mode,
+            'duration': duration,
+            'trigger': trigger,
+            'status': status,
+            'notes': notes,
+            'litres': litres
+        }
+
+    def between(self, start=None, end=None):
+        where, params = self._where(start, end)
+        with self._lock:
+            cursor = self._db.execute(f'SELECT id FROM history{where} ORDER BY ts, id', params)
+            ids = array('q', (row[0] for row in cursor))
+            pending = [e for e in self._pending if in_range(e, start, end)]
+        return SqliteHistoryView(self, ids, pending)
+
+    def fetch(self, ids):
+        # Records for the given row ids, in the same order; rows cleared
+        # since the ids were read are left out
+        marks = ','.join('?' * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, ts, mode, duration, trigger, status, notes, litres FROM history '
+                f'WHERE id IN ({marks})', list(ids)
+            ).fetchall()
+        by_id = {row[0]: self._entry(*row[1:]) for row in rows}
+        return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+    @property
+    def entries(self):
+        return self.between()
+
+    def filter(self, filter_text, now=None):
+        return self.between(*filter_range(filter_text, now))
+
+    def __len__(self):
+        return self.rollup.total.sessions
+
+    def statistics(self, now=None):
+        return self.rollup.summary(now)
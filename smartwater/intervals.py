@@ -0,0 +1,107 @@
+# Interval tree สำหรับตรวจช่วงเวลาที่ซ้อนกัน (นาทีในสัปดาห์)
+#
+# A centered interval tree over a fixed integer domain such as the minutes of
+# a week. Every node owns the midpoint of its range and keeps the intervals
+# that contain that midpoint, sorted by start and by end. Because the node
+# ranges are fixed, inserts and removals never rebalance anything: an
+# interval goes to the first node whose midpoint it covers, at most
+# log2(domain) levels down. Queries return (start, end, key) tuples;
+# intervals are half-open.
+
+from bisect import bisect_left, bisect_right, insort
+
+
+class _Node:
+    __slots__ = ('lo', 'hi', 'mid', 'by_start', 'by_end', 'left', 'right')
+
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+        self.mid = (lo + hi) // 2
+        self.by_start = []  # (start, end, key)
+        self.by_end = []    # (end, start, key)
+        self.left = None
+        self.right = None
+
+
+class IntervalTree:
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+        self._root = _Node(lo, hi)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, start, end, key):
+        node = self._node_for(start, end, create=True)
+        insort(node.by_start, (start, end, key))
+        insort(node.by_end, (end, start, key))
+        self._size += 1
+
+    def remove(self, start, end, key):
+        node = self._node_for(start, end, create=False)
+        if node is None:
+            return False
+        i = bisect_left(node.by_start, (start, end, key))
+        if i == len(node.by_start) or node.by_start[i] != (start, end, key):
+            return False
+        del node.by_start[i]
+        del node.by_end[bisect_left(node.by_end, (end, start, key))]
+        self._size -= 1
+        return True
+
+    def clear(self):
+        self._root = _Node(self.lo, self.hi)
+        self._size = 0
+
+    def overlap(self, start, end):
+        # Every interval sharing at least one point with [start, end)
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            mid = node.mid
+            if end <= mid:
+                # Query left of the midpoint: stored intervals overlap if they
+                # start before the query ends
+                items = node.by_start
+                found.extend(items[:bisect_left(items, (end,))])
+                if node.left is not None:
+                    stack.append(node.left)
+            elif start > mid:
+                # Right of the midpoint: they overlap if they end after it starts
+                items = node.by_end
+                found.extend((s, e, k) for e, s, k in items[bisect_right(items, (start, float('inf'))):])
+                if node.right is not None:
+                    stack.append(node.right)
+            else:
+                found.extend(node.by_start)
+                if node.left is not None:
+                    stack.append(node.left)
+                if node.right is not None:
+                    stack.append(node.right)
+        return found
+
+    def stab(self, point):
+        return self.overlap(point, point + 1)
+
+    def _node_for(self, start, end, create):
+        if not (self.lo <= start < end <= self.hi):
+            raise ValueError(f"interval [{start}, {end}) outside [{self.lo}, {self.hi})")
+        node = self._root
+        while True:
+            if end <= node.mid:
+                child, lo, hi = node.left, node.lo, node.mid
+                if child is None and create:
+                    child = node.left = _Node(lo, hi)
+            elif start > node.mid:
+                child, lo, hi = node.right, node.mid + 1, node.hi
+                if child is None and create:
+                    child = node.right = _Node(lo, hi)
+            else:
+                return node
+            if child is None:
+                return None
+            node = child
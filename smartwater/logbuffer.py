@@ -0,0 +1,54 @@
+# บันทึกระบบแบบ ring buffer (ขนาดคงที่)
+#
+# Records are small tuples in a deque with a fixed capacity, so the oldest
+# ones fall off instead of memory growing with uptime. Every record gets a
+# sequence number; a reader remembers the last one it saw and asks for what
+# came after, learning how many it missed if it fell more than a buffer behind.
+
+import itertools
+import threading
+import time
+from collections import deque, namedtuple
+
+LOG_CAPACITY = 2000
+
+LogRecord = namedtuple('LogRecord', ['seq', 'time', 'level', 'message'])
+
+
+class LogBuffer:
+    def __init__(self, capacity=LOG_CAPACITY):
+        self.capacity = capacity
+        self._records = deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def append(self, message, level="info", when=None):
+        with self._lock:
+            self._seq += 1
+            record = LogRecord(self._seq, when or time.time(), level, message)
+            self._records.append(record)
+        return record
+
+    def since(self, seq):
+        # (records newer than `seq`, number of them already overwritten)
+        with self._lock:
+            wanted = self._seq - seq
+            available = min(wanted, len(self._records))
+            records = list(itertools.islice(reversed(self._records), available))
+        records.reverse()
+        return records, wanted - available
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
@@ -0,0 +1,242 @@
+# ตัวชี้วัดการทำงาน (latency, lag, jitter, ขนาดข้อมูล) และ endpoint แบบ Prometheus
+#
+# Histograms count observations into fixed buckets, so recording is a
+# bisect and a few increments under a lock whichever thread it runs on, and
+# memory does not grow with traffic. The objects that see the events own
+# their histograms (a fleet device its reply round trips, the controller its
+# schedule jitter, ...). A MetricsRegistry only holds names and callables
+# that find them, so devices can come and go. render() produces the
+# Prometheus text format; MetricsServer serves it on 127.0.0.1 from its own
+# thread, independent of the GUI and fleet loops it is measuring.
+
+import os
+import threading
+from bisect import bisect_left
+
+METRICS_PORT = 9464
+
+# Upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JITTER_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value, times=1):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += times
+            self._count += times
+            self._sum += value * times
+            if value > self._max:
+                self._max = value
+
+    def snapshot(self):
+        # (cumulative bucket counts, count, sum, max)
+        with self._lock:
+            counts = list(self._counts)
+            count, total, largest = self._count, self._sum, self._max
+        cumulative = []
+        running = 0
+        for n in counts:
+            running += n
+            cumulative.append(running)
+        return cumulative, count, total, largest
+
+    def quantile(self, q):
+        # Interpolated within the bucket, like Prometheus' histogram_quantile
+        cumulative, count, _, largest = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        i = bisect_left(cumulative, rank)
+        lower = self.buckets[i - 1] if i > 0 else 0.0
+        upper = self.buckets[i] if i < len(self.buckets) else largest
+        below = cumulative[i - 1] if i > 0 else 0
+        in_bucket = cumulative[i] - below
+        value = lower + (upper - lower) * ((rank - below) / in_bucket if in_bucket else 1.0)
+        return min(value, largest)
+
+    def summary(self):
+        _, count, total, largest = self.snapshot()
+        return {'count': count, 'sum': total, 'max': largest,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95)}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families = []  # (name, type, help, source, label)
+
+    def histogram(self, name, help_text, source, label=None):
+        # source: a Histogram, or with `label` a callable returning
+        # {label value: Histogram}
+        self._families.append((name, 'histogram', help_text, source, label))
+
+    def gauge(self, name, help_text, source, label=None):
+        # source: a callable returning a number, or {label value: number}
+        self._families.append((name, 'gauge', help_text, source, label))
+
+    def counter(self, name, help_text, source, label=None):
+        self._families.append((name, 'counter', help_text, source, label))
+
+    def collect(self):
+        # [(name, type, help, [(label pairs, Histogram or number)])]
+        families = []
+        for name, kind, help_text, source, label in self._families:
+            try:
+                value = source() if callable(source) else source
+            except Exception:
+                # A collector that fails leaves its family out of this scrape
+                continue
+            if label is None:
+                samples = [((), value)]
+            else:
+                samples = [(((label, key),), item) for key, item in sorted(value.items())]
+            families.append((name, kind, help_text, samples))
+        return families
+
+    def render(self):
+        lines = []
+        for name, kind, help_text, samples in self.collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for pairs, value in samples:
+                if kind != 'histogram':
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative, count, total, _ = value.snapshot()
+                for bound, n in zip(value.buckets, cumulative):
+                    lines.append(f"{name}_bucket{_labels(pairs + (('le', repr(bound)),))} {n}")
+                lines.append(f"{name}_bucket{_labels(pairs + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(pairs)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def file_size(*paths):
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def register_core(registry, controller):
+    # What the Qt-free engine can measure on its own; views add their own
+    fleet = controller.fleet
+    registry.histogram('smartwater_command_rtt_seconds',
+                       'Command written until the device acknowledged it',
+                       lambda: {device_id: device.reply_rtt
+                                for device_id, device in list(fleet.devices.items())},
+                       label='device')
+    registry.histogram('smartwater_fleet_loop_lag_seconds',
+                       'How late the fleet event loop ran a timer', fleet.loop_lag)
+    registry.histogram('smartwater_read_lag_seconds',
+                       'Device reply read until the controller handled it', controller.read_lag)
+    registry.histogram('smartwater_schedule_jitter_seconds',
+                       'Schedule start minus its scheduled time', controller.trigger_jitter)
+    registry.gauge('smartwater_command_queue', 'Commands waiting to be written',
+                   lambda: {device_id: len(device.commands)
+                            for device_id, device in list(fleet.devices.items())
+                            if device.commands is not None},
+                   label='device')
+    registry.counter('smartwater_commands_coalesced_total',
+                     'Queued commands merged into or superseded by a later one',
+                     lambda: {device_id: device.commands.coalesced
+                              for device_id, device in list(fleet.devices.items())
+                              if device.commands is not None},
+                     label='device')
+    registry.gauge('smartwater_device_connected', 'Whether the device link is up',
+                   lambda: {device_id: int(fleet.is_connected(device_id))
+                            for device_id in list(fleet.devices)},
+                   label='device')
+    registry.gauge('smartwater_schedules', 'Schedules defined',
+                   lambda: len(controller.scheduler.schedules))
+    registry.gauge('smartwater_history_records', 'Watering sessions in the history',
+                   lambda: len(controller.history))
+    history_path = getattr(controller.history, 'path', None)
+    if history_path:
+        registry.gauge('smartwater_history_bytes', 'History database size on disk',
+                       lambda: file_size(history_path, history_path + '-wal'))
+    store = controller.schedule_store
+    if store is not None:
+        registry.gauge('smartwater_schedule_store_bytes', 'Schedule file size on disk',
+                       lambda: file_size(store.path))
+        registry.counter('smartwater_schedule_store_writes_total', 'Schedule file writes',
+                         lambda: store.writes)
+    return registry
+
+
+class MetricsServer:
+    def __init__(self, registry, port=METRICS_PORT, host='127.0.0.1'):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def start(self):
+        # OSError if the port is taken
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsServer',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = self._thread = None
@@ -0,0 +1,260 @@
+# บันทึกตารางเวลาลงดิสก์แบบ write-behind (ไม่ขึ้นกับ Qt)
+#
+# ScheduleStore is told about every change to the schedule list and writes
+# it from a background thread once the changes stop for SAVE_DELAY seconds
+# (or after MAX_SAVE_DELAY at the latest), so a burst of edits costs one
+# write. Only a shallow copy of the list is taken on the caller's thread.
+# The file is written to a temporary name, fsynced and renamed over the old
+# one: a crash leaves either the previous or the new list, never half of one.
+#
+# The file keeps each field in its own little-endian column instead of JSON,
+# which loads a few times faster and is a fraction of the size. Layout:
+#
+#   header    MAGIC, uint16 version, uint16 0, uint32 count, uint32 meta length
+#   meta      JSON: {"strings": [modes and zones], "extras": {index: {key: value}}}
+#   columns   minute of day <u2, duration <u2, mode <u2, zone <u2 (0xffff = none),
+#             days mask u1 (bit 0 = Mon), flags u1 (1 = repeat, 2 = active)
+#   trailer   uint32 CRC-32 of everything before it
+
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+from .scheduler import DAYS, days_mask, parse_time
+
+MAGIC = b'SWSC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+TRAILER = struct.Struct('<I')
+NO_ZONE = 0xFFFF
+
+SAVE_DELAY = 1.0
+MAX_SAVE_DELAY = 5.0
+
+# Keys stored in columns; anything else goes to the meta extras
+_COLUMN_KEYS = frozenset(('time', 'duration', 'days', 'mode', 'repeat', 'active', 'zone'))
+_TIMES = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)]
+_DAY_LISTS = [tuple(day for i, day in enumerate(DAYS) if mask >> i & 1) for mask in range(128)]
+_SWAP = sys.byteorder == 'big'
+
+
+def encode_schedules(schedules):
+    strings, index = [], {}
+
+    def intern(text):
+        code = index.get(text)
+        if code is None:
+            code = index[text] = len(strings)
+            strings.append(text)
+        return code
+
+    minutes, durations, modes, zones = array('H'), array('H'), array('H'), array('H')
+    masks, flags = bytearray(), bytearray()
+    extras = {}
+    for i, schedule in enumerate(schedules):
+        minutes.append(parse_time(schedule['time']) // 60 % len(_TIMES))
+        durations.append(min(max(int(schedule['duration']), 0), 0xFFFF))
+        modes.append(intern(schedule['mode']))
+        zone = schedule.get('zone')
+        zones.append(NO_ZONE if zone is None else intern(str(zone)))
+        masks.append(days_mask(schedule['days']))
+        flags.append(bool(schedule.get('repeat', True)) | bool(schedule.get('active', True)) << 1)
+        extra = {key: value for key, value in schedule.items() if key not in _COLUMN_KEYS}
+        if extra:
+            extras[str(i)] = extra
+
+    meta = json.dumps({'strings': strings, 'extras': extras}, separators=(',', ':')).encode()
+    columns = [minutes, durations, modes, zones]
+    if _SWAP:
+        for column in columns:
+            column.byteswap()
+    body = b''.join([HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(schedules), len(meta)), meta,
+                     *(column.tobytes() for column in columns), masks, flags])
+    return body + TRAILER.pack(zlib.crc32(body))
+
+
+def decode_schedules(data):
+    # ValueError if the data is not a schedule file this version can read
+    if len(data) < HEADER.size + TRAILER.size:
+        raise ValueError("schedule file too short")
+    magic, version, _, count, meta_length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a schedule file")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"schedule file version {version} is newer than {FORMAT_VERSION}")
+    body = len(data) - TRAILER.size
+    if body != HEADER.size + meta_length + 10 * count:
+        raise ValueError("schedule file size does not match its header")
+    if zlib.crc32(memoryview(data)[:body]) != TRAILER.unpack_from(data, body)[0]:
+        raise ValueError("schedule file checksum mismatch")
+
+    pos = HEADER.size + meta_length
+    meta = json.loads(data[HEADER.size:pos])
+    strings = meta['strings']
+    columns = []
+    for _ in range(4):
+        column = array('H')
+        column.frombytes(data[pos:pos + 2 * count])
+        if _SWAP:
+            column.byteswap()
+        columns.append(column)
+        pos += 2 * count
+    minutes, durations, modes, zones = columns
+    masks = data[pos:pos + count]
+    flags = data[pos + count:pos + 2 * count]
+
+    times, day_lists = _TIMES, _DAY_LISTS
+    schedules = [
+        {'time': times[minute], 'duration': duration, 'days': list(day_lists[mask & 127]),
+         'mode': strings[mode], 'repeat': bool(flag & 1), 'active': bool(flag & 2)}
+        for minute, duration, mode, mask, flag in zip(minutes, durations, modes, masks, flags)
+    ]
+    if zones.count(NO_ZONE) != count:
+        for schedule, zone in zip(schedules, zones):
+            if zone != NO_ZONE:
+                schedule['zone'] = strings[zone]
+    for i, extra in meta.get('extras', {}).items():
+        schedules[int(i)].update(extra)
+    return schedules
+
+
+def atomic_write(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if os.name == 'posix':
+        # Make the rename itself durable
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class ScheduleStore:
+    def __init__(self, path, delay=SAVE_DELAY, max_delay=MAX_SAVE_DELAY, on_error=None):
+        self.path = path
+        self.delay = delay
+        self.max_delay = max_delay
+        # Called with a message when the file cannot be read or written; from
+        # the writer thread for writes
+        self.on_error = on_error
+        self.writes = 0
+        self.last_error = None
+        self._cond = threading.Condition()
+        self._pending = None   # newest unsaved snapshot
+        self._first_mark = 0.0
+        self._last_mark = 0.0
+        self._writing = False
+        self._flushing = False
+        self._closing = False
+        self._writer = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        # The saved list, or None if there is no readable file
+        try:
+            with open(self.path, 'rb') as f:
+                return decode_schedules(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            self.last_error = str(e)
+            self._report(f"Schedule file {self.path} ignored: {e}")
+            return None
+
+    def save(self, schedules):
+        # Mark the list dirty; returns at once, the write happens later
+        snapshot = [dict(schedule) for schedule in schedules]
+        with self._cond:
+            if self._closing:
+                # Nothing left to batch with once closed
+                self._write(snapshot)
+                return
+            now = time.monotonic()
+            if self._pending is None:
+                self._first_mark = now
+            self._pending = snapshot
+            self._last_mark = now
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='ScheduleWriter',
+                                                daemon=True)
+                self._writer.start()
+            self._cond.notify_all()
+
+    @property
+    def dirty(self):
+        with self._cond:
+            return self._pending is not None or self._writing
+
+    def flush(self):
+        # Write anything pending now and wait for it
+        with self._cond:
+            if self._writer is None:
+                return
+            self._flushing = True
+            self._cond.notify_all()
+            while self._pending is not None or self._writing:
+                self._cond.wait()
+            self._flushing = False
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join()
+
+    def _write_loop(self):
+        with self._cond:
+            while True:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+
+                # Debounce: wait for a quiet spell, but not forever
+                while not (self._flushing or self._closing):
+                    deadline = min(self._last_mark + self.delay, self._first_mark + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                snapshot, self._pending = self._pending, None
+                self._writing = True
+                self._cond.release()
+                try:
+                    self._write(snapshot)
+                finally:
+                    self._cond.acquire()
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, snapshot):
+        try:
+            atomic_write(self.path, encode_schedules(snapshot))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.last_error = str(e)
+            self._report(f"Schedule write error: {e}")
+        else:
+            self.writes += 1
+            self.last_error = None
+
+    def _report(self, message):
+        if self.on_error:
+            self.on_error(message)
+        else:
+            print(message)
@@ -0,0 +1,298 @@
+# วางแผนรดน้ำหลายโซนให้พอดีกับกำลังปั๊มภายในหนึ่งสัปดาห์ (ไม่ขึ้นกับ Qt)
+#
+#   python -m smartwater.planner zones.csv --pump-flow 20 --window 05:00-09:00 --window 17:00-19:00
+#   python -m smartwater.planner --generate 5000 --pump-flow 40
+#
+# Every zone needs a volume of water per week and draws its own flow, by
+# default the pump's whole flow rate (one zone at a time). Each zone is cut
+# into sessions no longer than the maximum duration, and the sessions are
+# packed into the allowed watering windows. At no minute may the running
+# zones need more than the pump delivers. Placed sessions sit in an
+# IntervalTree, so checking a start time is a stabbing query plus a sweep
+# over the few sessions it overlaps. Zones go in largest first, first fit.
+# For every flow rate the planner remembers the earliest start that can
+# still have room and the shortest session that found none. Load only grows
+# while planning, so both stay valid and a full week is not rescanned for
+# every remaining zone.
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from .intervals import IntervalTree
+from .scheduler import DAY_MINUTES, DAYS, WEEK_MINUTES, days_mask, make_schedule, parse_time, week_spans
+
+Zone = namedtuple('Zone', ['name', 'volume', 'flow', 'mode'], defaults=(None, None))
+Session = namedtuple('Session', ['zone', 'start', 'duration', 'flow'])
+
+# Flow comparisons tolerate float rounding
+EPSILON = 1e-9
+
+
+def parse_windows(windows):
+    # [(days, "HH:MM", "HH:MM"), ...] -> sorted, merged [start, end) minutes of
+    # the week; an end at or before the start runs past midnight
+    spans = []
+    for days, start_text, end_text in windows:
+        start = parse_time(start_text) // 60
+        end = parse_time(end_text) // 60 if end_text != '24:00' else DAY_MINUTES
+        length = (end - start) % DAY_MINUTES or DAY_MINUTES
+        spans.extend(week_spans(start, days_mask(days), length))
+    spans.sort()
+
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def format_minute(minute):
+    day, minute = divmod(minute, DAY_MINUTES)
+    return DAYS[day], f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class Plan:
+    def __init__(self, pump_flow, sessions, unplaced, conflicts, elapsed):
+        self.pump_flow = pump_flow
+        self.sessions = sessions
+        self.unplaced = unplaced      # zone name -> minutes that did not fit
+        self.conflicts = conflicts    # (session, [sessions it overloads the pump with])
+        self.elapsed = elapsed
+
+    def utilization(self, window_minutes):
+        # Share of the pump's capacity used inside the watering windows
+        used = sum(s.duration * s.flow for s in self.sessions)
+        return used / (window_minutes * self.pump_flow) if window_minutes else 0.0
+
+    def schedules(self, default_mode):
+        # One weekly schedule per session, tagged with its zone
+        schedules = []
+        for session in sorted(self.sessions, key=lambda s: s.start):
+            day, time_text = format_minute(session.start)
+            schedule = make_schedule(time_text, session.duration, [day],
+                                     session.zone.mode or default_mode)
+            schedule['zone'] = session.zone.name
+            schedules.append(schedule)
+        return schedules
+
+
+class ZonePlanner:
+    def __init__(self, pump_flow, windows=None, max_session=60):
+        self.pump_flow = float(pump_flow)
+        self.windows = parse_windows(windows or [(DAYS, '00:00', '24:00')])
+        self.max_session = max(1, int(max_session))
+        self.sessions = {}
+        self.conflicts = []
+        self._tree = IntervalTree(0, WEEK_MINUTES)
+        self._keys = itertools.count()
+        self._window_starts = [start for start, _ in self.windows]
+        self._window_ends = [end for _, end in self.windows]
+        # Candidate starts: window starts and session ends
+        self._points = list(self._window_starts)
+        self._hint = {}
+        self._failed = {}
+
+    def window_minutes(self):
+        return sum(end - start for start, end in self.windows)
+
+    # Capacity
+    def load_at(self, minute):
+        sessions = self.sessions
+        return sum(sessions[key].flow for _, _, key in self._tree.stab(minute))
+
+    def peak_load(self, start, end):
+        # Highest total flow of the sessions running somewhere in [start, end)
+        overlapping = self._tree.overlap(start, end)
+        if not overlapping:
+            return 0.0
+        events = []
+        for s, e, key in overlapping:
+            flow = self.sessions[key].flow
+            events.append((max(s, start), flow))
+            if e < end:
+                events.append((e, -flow))
+        events.sort()
+        load = peak = 0.0
+        for _, delta in events:
+            load += delta
+            peak = max(peak, load)
+        return peak
+
+    def insert(self, zone, start, duration, flow=None):
+        # Put a session at a fixed time; returns the sessions it overloads
+        # the pump with (empty if it fits), and keeps it either way
+        flow = self.pump_flow if flow is None else flow
+        end = min(start + duration, WEEK_MINUTES)
+        conflicts = []
+        if self.peak_load(start, end) + flow > self.pump_flow + EPSILON:
+            conflicts = [self.sessions[key] for _, _, key in self._tree.overlap(start, end)]
+        session = Session(zone, start, end - start, flow)
+        self._add(session)
+        if conflicts:
+            self.conflicts.append((session, conflicts))
+        return conflicts
+
+    def reserve_schedules(self, schedules, flow=None):
+        # Existing active schedules take their share of the pump first
+        for schedule in schedules:
+            if not schedule.get('active', True):
+                continue
+            zone = Zone(schedule.get('zone', schedule['time']), 0, flow, schedule['mode'])
+            minute = parse_time(schedule['time']) // 60
+            for start, end in week_spans(minute, days_mask(schedule['days']), schedule['duration']):
+                self.insert(zone, start, end - start, flow)
+
+    # Packing
+    def find_start(self, duration, flow, after=0):
+        # Earliest start >= after where a session fits, or None
+        limit = self.pump_flow - flow + EPSILON
+        if limit < 0:
+            return None
+        hint = self._hint.get(flow, 0)
+        unconstrained = after <= hint
+        failed = self._failed.get(flow)
+        if failed is not None and duration >= failed:
+            return None
+
+        points = self._points
+        window_starts = self._window_starts
+        window_ends = self._window_ends
+        advancing = unconstrained
+        i = bisect_left(points, max(hint, after))
+        while i < len(points):
+            start = points[i]
+            i += 1
+            w = bisect_right(window_starts, start) - 1
+            if w < 0 or start >= window_ends[w] or self.load_at(start) > limit:
+                # Never usable again: windows are fixed and load only grows
+                if advancing:
+                    self._hint[flow] = points[i] if i < len(points) else WEEK_MINUTES
+                continue
+            advancing = False
+            end = start + duration
+            if end <= window_ends[w] and self.peak_load(start, end) <= limit:
+                return start
+
+        if unconstrained:
+            self._failed[flow] = duration if failed is None else min(failed, duration)
+        return None
+
+    def add_zone(self, zone):
+        # Place one zone's sessions; returns the minutes that did not fit
+        flow = float(zone.flow) if zone.flow else self.pump_flow
+        total = math.ceil(zone.volume / flow - EPSILON) if zone.volume > 0 else 0
+        if not total:
+            return 0
+        count = math.ceil(total / self.max_session)
+        base, extra = divmod(total, count)
+
+        after = 0
+        missing = 0
+        for i in range(count):
+            duration = base + (i < extra)
+            start = self.find_start(duration, flow, after)
+            if start is None:
+                missing += duration
+                continue
+            self._add(Session(zone, start, duration, flow))
+            # A zone's own sessions never overlap
+            after = start + duration
+        return missing
+
+    def plan(self, zones):
+        started = time.perf_counter()
+        unplaced = {}
+        for zone in sorted(zones, key=lambda z: (-(z.flow or self.pump_flow),
+                                                  -z.volume / (z.flow or self.pump_flow))):
+            missing = self.add_zone(zone)
+            if missing:
+                unplaced[zone.name] = missing
+        sessions = [s for s in self.sessions.values() if s.zone.volume > 0]
+        return Plan(self.pump_flow, sessions, unplaced, list(self.conflicts),
+                    time.perf_counter() - started)
+
+    def _add(self, session):
+        key = next(self._keys)
+        self.sessions[key] = session
+        end = session.start + session.duration
+        self._tree.insert(session.start, end, key)
+        if end < WEEK_MINUTES:
+            insort(self._points, end)
+
+
+# Command line
+def load_zones(path):
+    # CSV (name,volume[,flow][,mode]) or a JSON list of objects
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    zones = []
+    for row in rows:
+        flow = row.get('flow')
+        zones.append(Zone(str(row['name']), float(row['volume']),
+                          float(flow) if flow not in (None, '') else None, row.get('mode') or None))
+    return zones
+
+
+def random_zones(count, pump_flow, seed=1):
+    rng = random.Random(seed)
+    shares = [1, 1 / 2, 1 / 4]
+    return [Zone(f"zone-{i + 1}", rng.randint(20, 400), pump_flow * rng.choice(shares))
+            for i in range(count)]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='smartwater.planner',
+                                     description='Pack zone watering into a weekly plan')
+    parser.add_argument('zones', nargs='?', help='CSV or JSON file with name, volume[, flow, mode]')
+    parser.add_argument('--generate', type=int, metavar='N', help='plan N random zones instead')
+    parser.add_argument('--pump-flow', type=float, default=1, help='pump flow rate (L/min)')
+    parser.add_argument('--max-session', type=int, default=60, help='longest session (min)')
+    parser.add_argument('--window', action='append', default=[], metavar='HH:MM-HH:MM',
+                        help='allowed watering window (repeatable, default all day)')
+    parser.add_argument('--days', default=','.join(DAYS), help='days the windows apply to')
+    parser.add_argument('--json', metavar='PATH', help='write the plan as schedules to PATH')
+    args = parser.parse_args(argv)
+    if not args.zones and not args.generate:
+        parser.error('give a zones file or --generate')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    days = [day.strip() for day in args.days.split(',') if day.strip()]
+    windows = [(days, *window.split('-', 1)) for window in args.window] or [(days, '00:00', '24:00')]
+    zones = load_zones(args.zones) if args.zones else random_zones(args.generate, args.pump_flow)
+
+    planner = ZonePlanner(args.pump_flow, windows, args.max_session)
+    plan = planner.plan(zones)
+
+    print(f"{len(zones)} zones -> {len(plan.sessions)} sessions in {plan.elapsed * 1000:.1f} ms, "
+          f"pump use {plan.utilization(planner.window_minutes()):.0%}")
+    if plan.unplaced:
+        print(f"{len(plan.unplaced)} zones did not fit "
+              f"({sum(plan.unplaced.values())} min missing)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(plan.schedules("Water Only"), f, indent=2)
+    elif len(plan.sessions) <= 200:
+        for session in sorted(plan.sessions, key=lambda s: s.start):
+            day, time_text = format_minute(session.start)
+            print(f"{day} {time_text}  {session.duration:>3} min  {session.flow:g} L/min  {session.zone.name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# ค้นหา Serial port โดยไม่ต้องเปิดพอร์ต + ตรวจจับการเสียบ/ถอด
+#
+# Ports are enumerated with pyserial's list_ports (sysfs on Linux, SetupAPI on
+# Windows, IOKit on macOS), which never opens a device. Opening a port to see
+# whether it is free is only done on request, in parallel on a small shared
+# thread pool, and the answers are cached for a short while. PortWatcher polls
+# the enumeration in the background and reports only what was added/removed.
+
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+from serial.tools import list_ports as _list_ports
+
+PortInfo = namedtuple('PortInfo', ['device', 'description', 'hwid'])
+
+LIST_TTL = 2.0
+PROBE_TTL = 10.0
+PROBE_WORKERS = 8
+WATCH_INTERVAL = 1.0
+# How long stop() waits for a listing that is under way
+STOP_TIMEOUT = 2.0
+
+
+def list_ports():
+    ports = []
+    for port in _list_ports.comports():
+        description = port.description if port.description not in (None, 'n/a') else ''
+        hwid = port.hwid if port.hwid not in (None, 'n/a') else ''
+        ports.append(PortInfo(port.device, description, hwid))
+    ports.sort(key=lambda p: p.device)
+    return ports
+
+
+def probe_port(device):
+    # True if the port can be opened right now (i.e. not in use elsewhere)
+    try:
+        serial.Serial(device).close()
+        return True
+    except (serial.SerialException, OSError, ValueError):
+        return False
+
+
+class PortScanner:
+    def __init__(self, list_ttl=LIST_TTL, probe_ttl=PROBE_TTL, max_workers=PROBE_WORKERS):
+        self.list_ttl = list_ttl
+        self.probe_ttl = probe_ttl
+        self.max_workers = max_workers
+        self._ports = None
+        self._listed_at = 0.0
+        self._probes = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def ports(self, refresh=False):
+        now = time.monotonic()
+        with self._lock:
+            if refresh or self._ports is None or now - self._listed_at > self.list_ttl:
+                self._ports = list_ports()
+                self._listed_at = now
+            return list(self._ports)
+
+    def update(self, ports):
+        # Accept a fresh listing from PortWatcher so ports() stays warm
+        with self._lock:
+            self._ports = list(ports)
+            self._listed_at = time.monotonic()
+            known = {p.device for p in ports}
+            for device in list(self._probes):
+                if device not in known:
+                    del self._probes[device]
+
+    def cached_probe(self, device):
+        result = self._probes.get(device)
+        if result is not None and time.monotonic() - result[1] <= self.probe_ttl:
+            return result[0]
+        return None
+
+    def probe(self, devices, callback, refresh=False, in_use=()):
+        # Probe every device on the pool; callback(device, available) runs on a
+        # pool thread (or inline for cached answers). Ports in `in_use` belong
+        # to this app and are reported busy without being opened.
+        for device in devices:
+            if device in in_use:
+                callback(device, False)
+                continue
+            cached = None if refresh else self.cached_probe(device)
+            if cached is not None:
+                callback(device, cached)
+                continue
+            future = self._executor().submit(probe_port, device)
+            future.add_done_callback(
+                lambda f, device=device: self._probe_done(device, f, callback))
+
+    def _probe_done(self, device, future, callback):
+        available = not future.exception() and future.result()
+        self._probes[device] = (available, time.monotonic())
+        callback(device, available)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='port-probe')
+            return self._pool
+
+
+class PortWatcher:
+    def __init__(self, on_change, interval=WATCH_INTERVAL, scanner=None, on_error=None):
+        # Both callbacks run on the watcher thread
+        self.on_change = on_change
+        self.interval = interval
+        self.scanner = scanner
+        self.on_error = on_error
+        self._known = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, initial=None):
+        if initial is not None:
+            self._known = {p.device: p for p in initial}
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='PortWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        # No callback runs once this returns (unless the listing outlasts
+        # `timeout`, in which case its result is dropped)
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                if self.on_error:
+                    self.on_error(f"Port watcher error: {e}")
+                else:
+                    print(f"Port watcher error: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def poll(self):
+        ports = list_ports()
+        current = {p.device: p for p in ports}
+        added = [p for device, p in current.items() if device not in self._known]
+        removed = [p for device, p in self._known.items() if device not in current]
+        self._known = current
+        if self.scanner is not None:
+            self.scanner.update(ports)
+        if (added or removed) and not self._stop.is_set():
+            self.on_change(added, removed)
+
+
+# Shared by every ConnectionDialog so reopening it is instant
+default_scanner = PortScanner()
@@ -0,0 +1,189 @@
+# เก็บ profile การทำงานและการจองหน่วยความจำช่วงสั้น ๆ ตามสั่ง (ไม่ขึ้นกับ Qt)
+#
+# A ProfileSession is started and stopped on the thread that runs the event
+# loop (the Qt GUI thread, the headless runner's main loop), and that thread
+# is profiled with cProfile, which sees every call. cProfile only hooks the
+# thread that enables it, and the fleet loop and the writer threads are
+# already running when a capture starts, so a sampler thread reads every
+# thread's stack from sys._current_frames() every few milliseconds as well.
+# tracemalloc snapshots at both ends give the memory that was allocated in
+# between and not freed. stop() writes everything under one timestamp:
+#
+#   profile-YYYYmmdd-HHMMSS.pstats             cProfile data (pstats, snakeviz)
+#   profile-YYYYmmdd-HHMMSS-samples.txt        collapsed stacks (flamegraph.pl, speedscope)
+#   profile-YYYYmmdd-HHMMSS-allocations.txt    tracemalloc growth by line
+#   profile-YYYYmmdd-HHMMSS-summary.txt        the top of each, readable
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+from datetime import datetime
+
+PROFILE_SECONDS = 30
+SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 64
+TOP_COUNT = 25
+
+FunctionStat = namedtuple('FunctionStat', ['function', 'calls', 'own', 'total'])
+ThreadHotspot = namedtuple('ThreadHotspot', ['thread', 'function', 'share'])
+AllocationStat = namedtuple('AllocationStat', ['location', 'size', 'blocks'])
+
+
+def function_name(filename, line, name):
+    if filename == '~':
+        # Built-ins have no file
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class ProfileReport:
+    def __init__(self, duration, functions, hotspots, allocations, paths):
+        self.duration = duration
+        self.functions = functions        # FunctionStat, most own time first
+        self.hotspots = hotspots          # ThreadHotspot, busiest first
+        self.allocations = allocations    # AllocationStat, largest growth first
+        self.paths = paths                # kind -> file written
+
+    def summary(self, count=10):
+        lines = [f"Profile of {self.duration:.1f} s"]
+        if self.functions:
+            lines.append("Hottest functions on the profiled thread (own time):")
+            for stat in self.functions[:count]:
+                lines.append(f"  {stat.own * 1000:9.1f} ms {stat.calls:9d} calls  {stat.function}")
+        if self.hotspots:
+            lines.append("Sampled stacks (share of each thread's samples):")
+            for hotspot in self.hotspots[:count]:
+                lines.append(f"  {hotspot.share:6.1%}  {hotspot.thread}: {hotspot.function}")
+        if self.allocations:
+            lines.append("Memory allocated and not freed:")
+            for stat in self.allocations[:count]:
+                lines.append(f"  {stat.size / 1024:+10.1f} KiB {stat.blocks:+8d} blocks  {stat.location}")
+        return '\n'.join(lines)
+
+
+class ProfileSession:
+    def __init__(self, directory, duration=PROFILE_SECONDS, sample_interval=SAMPLE_INTERVAL,
+                 allocations=True):
+        self.directory = directory
+        self.duration = duration
+        self.sample_interval = sample_interval
+        self.allocations = allocations
+        self.started_at = None
+        self._profile = None
+        self._sampler = None
+        self._done = threading.Event()
+        self._stacks = Counter()     # (thread name, frames root first) -> samples
+        self._names = {}             # code object -> display name
+        self._snapshot = None
+        self._tracing = False
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def remaining(self, now=None):
+        if self.started_at is None:
+            return self.duration
+        return max(0.0, self.started_at + self.duration - (now or time.monotonic()))
+
+    def start(self):
+        # Call on the thread to profile with cProfile
+        if self.allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            self._snapshot = tracemalloc.take_snapshot()
+        self._sampler = threading.Thread(target=self._sample_loop, name='ProfileSampler', daemon=True)
+        self._sampler.start()
+        self.started_at = time.monotonic()
+        # Last, so the setup above is not in the profile
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        # Call on the thread that started it; returns a ProfileReport once the
+        # files are written (OSError if they cannot be)
+        profile, self._profile = self._profile, None
+        profile.disable()
+        duration = time.monotonic() - self.started_at
+        self._done.set()
+        self._sampler.join()
+
+        growth = []
+        if self._snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            if self._tracing:
+                tracemalloc.stop()
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            growth = [stat for stat in snapshot.filter_traces(ignore).compare_to(
+                self._snapshot.filter_traces(ignore), 'lineno') if stat.size_diff > 0]
+            self._snapshot = None
+
+        return self._write(profile, duration, growth)
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        stacks = self._stacks
+        while not self._done.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(self._code_name(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[names.get(ident, str(ident)), tuple(stack)] += 1
+
+    def _code_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            name = self._names[code] = function_name(
+                code.co_filename, code.co_firstlineno, getattr(code, 'co_qualname', code.co_name))
+        return name
+
+    def _write(self, profile, duration, growth):
+        stats = pstats.Stats(profile)
+        functions = sorted((FunctionStat(function_name(*key), calls, own, total)
+                            for key, (_, calls, own, total, _) in stats.stats.items()
+                            if key[0] != __file__ and '_lsprof' not in key[2]),
+                           key=lambda stat: stat.own, reverse=True)
+
+        # Where each thread spent its samples, by innermost function
+        per_thread, leaves = Counter(), Counter()
+        for (thread, stack), count in self._stacks.items():
+            per_thread[thread] += count
+            if stack:
+                leaves[thread, stack[-1]] += count
+        hotspots = [ThreadHotspot(thread, function, count / per_thread[thread])
+                    for (thread, function), count in leaves.most_common()]
+
+        allocations = [AllocationStat(str(stat.traceback[0]), stat.size_diff, stat.count_diff)
+                       for stat in growth]
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = base = os.path.join(self.directory, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        suffix = 1
+        while os.path.exists(base + '.pstats'):
+            suffix += 1
+            base = f"{stamp}-{suffix}"
+        paths = {'pstats': base + '.pstats', 'samples': base + '-samples.txt',
+                 'allocations': base + '-allocations.txt', 'summary': base + '-summary.txt'}
+        report = ProfileReport(duration, functions[:TOP_COUNT], hotspots[:TOP_COUNT],
+                               allocations[:TOP_COUNT], paths)
+
+        stats.dump_stats(paths['pstats'])
+        with open(paths['samples'], 'w', encoding='utf-8') as f:
+            for (thread, stack), count in self._stacks.most_common():
+                f.write(';'.join((thread,) + stack) + f" {count}\n")
+        with open(paths['allocations'], 'w', encoding='utf-8') as f:
+            for stat in growth:
+                f.write(f"{stat}\n")
+        with open(paths['summary'], 'w', encoding='utf-8') as f:
+            f.write(report.summary(TOP_COUNT) + '\n')
+        return report
@@ -0,0 +1,219 @@
+# ตารางเวลารดน้ำอัตโนมัติ (ไม่ขึ้นกับ Qt)
+#
+# Schedules stay plain dicts (that is what the UI shows and what gets saved),
+# but each one is also compiled to a minute-of-day int and a weekday bitmask.
+# The next occurrence of every active schedule sits in a heap, so finding what
+# is due is a peek at the top instead of a scan of all schedules, and the host
+# only needs one timer armed for next_fire_time(). Edits push a new heap entry
+# and bump the schedule's version; stale entries are skipped when they surface.
+# Active schedules' weekly occurrences also sit in an interval tree, so a new
+# schedule's overlaps with the existing ones are found when it is added.
+
+import heapq
+import itertools
+from datetime import datetime, timedelta
+
+from .intervals import IntervalTree
+
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# A schedule added or enabled up to this long after its start time still fires
+TRIGGER_WINDOW = 60
+
+MINUTE = timedelta(minutes=1)
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+
+
+def make_schedule(time_text, duration, days, mode, repeat=True, active=True):
+    return {
+        'time': time_text,
+        'duration': duration,
+        'days': list(days),
+        'mode': mode,
+        'repeat': repeat,
+        'active': active
+    }
+
+
+def parse_time(time_text):
+    hours, minutes = time_text.split(':')
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+def week_spans(minute, days_mask, duration):
+    # [start, end) minutes of the week, Monday 00:00 = 0; a session running
+    # past Sunday midnight is split in two
+    spans = []
+    for day in range(7):
+        if days_mask & (1 << day):
+            start = day * DAY_MINUTES + minute
+            end = start + max(1, int(duration))
+            if end <= WEEK_MINUTES:
+                spans.append((start, end))
+            else:
+                spans.append((start, WEEK_MINUTES))
+                spans.append((0, end - WEEK_MINUTES))
+    return spans
+
+
+def days_mask(days):
+    mask = 0
+    for day in days:
+        if day in DAYS:
+            mask |= 1 << DAYS.index(day)
+    return mask
+
+
+class CompiledSchedule:
+    __slots__ = ('minute', 'days_mask', 'schedule', 'version', 'spans')
+
+    def __init__(self, schedule):
+        self.minute = parse_time(schedule['time']) // 60
+        self.days_mask = days_mask(schedule['days'])
+        self.schedule = schedule
+        self.version = 0
+        self.spans = week_spans(self.minute, self.days_mask, schedule['duration'])
+
+    def next_fire(self, start):
+        # First occurrence at or after `start`
+        if not self.days_mask:
+            return None
+        day_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        weekday = start.weekday()
+        for offset in range(8):
+            if self.days_mask & (1 << ((weekday + offset) % 7)):
+                fire = day_start + timedelta(days=offset, minutes=self.minute)
+                if fire >= start:
+                    return fire
+        return None
+
+
+class Scheduler:
+    def __init__(self, schedules=None, now=None):
+        self.schedules = schedules if schedules is not None else []
+        self._keys = []
+        self._entries = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._index = IntervalTree(0, WEEK_MINUTES)
+        self._rebuild(now)
+
+    def add(self, schedule, now=None):
+        self.schedules.append(schedule)
+        key = next(self._counter)
+        self._keys.append(key)
+        self._entries[key] = CompiledSchedule(schedule)
+        if schedule['active']:
+            self._arm(key, self._window_start(now))
+            self._index_add(key)
+
+    def conflicts(self, schedule):
+        # Active schedules whose weekly occurrences overlap `schedule`'s
+        entry = CompiledSchedule(schedule)
+        keys = set()
+        for start, end in entry.spans:
+            keys.update(key for _, _, key in self._index.overlap(start, end))
+        return [self._entries[key].schedule for key in self._keys
+                if key in keys and self._entries[key].schedule is not schedule]
+
+    def toggle(self, index, now=None):
+        schedule = self.schedules[index]
+        schedule['active'] = not schedule['active']
+        key = self._keys[index]
+        entry = self._entries[key]
+        entry.version += 1
+        if schedule['active']:
+            self._arm(key, self._window_start(now))
+            self._index_add(key)
+        else:
+            self._index_remove(key)
+        self._compact()
+
+    def delete(self, index):
+        del self.schedules[index]
+        key = self._keys.pop(index)
+        self._index_remove(key)
+        del self._entries[key]
+        self._compact()
+
+    def clear(self):
+        self.schedules.clear()
+        self._keys.clear()
+        self._entries.clear()
+        self._heap.clear()
+        self._index.clear()
+
+    def replace(self, schedules, now=None):
+        self.schedules[:] = schedules
+        self._rebuild(now)
+
+    def next_fire_time(self):
+        heap = self._heap
+        while heap:
+            fire_time, _, key, version = heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                return fire_time
+            heapq.heappop(heap)
+        return None
+
+    def pop_due(self, now):
+        # Every (fire_time, schedule) due at `now`, oldest first; repeating
+        # schedules are re-armed for their next occurrence
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            fire_time, _, key, version = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                continue
+
+            due.append((fire_time, entry.schedule))
+            if entry.schedule.get('repeat', True):
+                # Collapse occurrences missed while the host was asleep
+                self._arm(key, max(fire_time + MINUTE, self._window_start(now)))
+            else:
+                entry.schedule['active'] = False
+                entry.version += 1
+                self._index_remove(key)
+        return due
+
+    def _window_start(self, now):
+        return (now or datetime.now()) - timedelta(seconds=TRIGGER_WINDOW)
+
+    def _arm(self, key, start):
+        entry = self._entries[key]
+        fire_time = entry.next_fire(start)
+        if fire_time is not None:
+            heapq.heappush(self._heap, (fire_time, next(self._counter), key, entry.version))
+
+    def _rebuild(self, now):
+        self._keys = []
+        self._entries = {}
+        self._heap = []
+        self._index.clear()
+        start = self._window_start(now)
+        for schedule in self.schedules:
+            key = next(self._counter)
+            self._keys.append(key)
+            self._entries[key] = CompiledSchedule(schedule)
+            if schedule['active']:
+                self._arm(key, start)
+                self._index_add(key)
+
+    def _index_add(self, key):
+        for start, end in self._entries[key].spans:
+            self._index.insert(start, end, key)
+
+    def _index_remove(self, key):
+        for start, end in self._entries[key].spans:
+            self._index.remove(start, end, key)
+
+    def _compact(self):
+        # Drop dead heap entries once they outnumber the live ones
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._heap = [item for item in self._heap
+                          if item[2] in self._entries and
+                          self._entries[item[2]].version == item[3]]
+            heapq.heapify(self._heap)
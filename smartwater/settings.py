@@ -0,0 +1,101 @@
+# การตั้งค่าระบบ (ไม่ขึ้นกับ Qt)
+#
+# Settings are read from and written to any store with the QSettings-style
+# value()/setValue() interface: QSettings in the GUI, JsonSettingsStore on
+# headless nodes.
+#
+# Schedules can instead live in a ScheduleStore (see persist.py). A list
+# still held as JSON in the settings store is moved there on first load and
+# the JSON is dropped once the file is written, so it cannot come back later.
+
+import json
+import os
+
+from .metrics import METRICS_PORT
+
+DEFAULTS = {
+    'flow_rate': 1,
+    'default_duration': 10,
+    'max_duration': 60,
+    'sound_alert': True,
+    'auto_stop': True,
+    # Prometheus text endpoint on 127.0.0.1
+    'metrics_enabled': False,
+    'metrics_port': METRICS_PORT,
+    # Length of an on-demand profile capture (seconds)
+    'profile_seconds': 30
+}
+
+
+class Settings:
+    def __init__(self, **values):
+        for key, default in DEFAULTS.items():
+            setattr(self, key, values.get(key, default))
+        self.schedules = list(values.get('schedules', []))
+
+    def as_dict(self):
+        values = {key: getattr(self, key) for key in DEFAULTS}
+        values['schedules'] = self.schedules
+        return values
+
+
+def load_settings(store, schedule_store=None):
+    values = {
+        key: store.value(key, default, type=type(default))
+        for key, default in DEFAULTS.items()
+    }
+
+    schedules = schedule_store.load() if schedule_store is not None else None
+    if schedules is None:
+        try:
+            schedules = json.loads(store.value('schedules', '[]'))
+        except (TypeError, ValueError):
+            schedules = []
+        # Move the JSON list over, or replace a file that could not be read
+        if schedule_store is not None and (schedules or schedule_store.exists()):
+            schedule_store.save(schedules)
+            schedule_store.flush()
+            if schedule_store.last_error is None and store.value('schedules') is not None:
+                store.remove('schedules')
+                store.sync()
+    values['schedules'] = schedules
+
+    return Settings(**values)
+
+
+def save_settings(store, settings, schedule_store=None):
+    for key in DEFAULTS:
+        store.setValue(key, getattr(settings, key))
+    if schedule_store is not None:
+        schedule_store.save(settings.schedules)
+    else:
+        save_schedules(store, settings.schedules)
+
+
+def save_schedules(store, schedules):
+    store.setValue('schedules', json.dumps(schedules))
+
+
+class JsonSettingsStore:
+    def __init__(self, path):
+        self.path = path
+        self._values = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._values = json.load(f)
+
+    def value(self, key, default=None, type=None):
+        value = self._values.get(key, default)
+        if type is not None and value is not None and not isinstance(value, type):
+            value = type(value)
+        return value
+
+    def setValue(self, key, value):
+        self._values[key] = value
+
+    def remove(self, key):
+        self._values.pop(key, None)
+
+    def sync(self):
+        with open(self.path, 'w') as f:
+            json.dump(self._values, f, indent=2)
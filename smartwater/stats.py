@@ -0,0 +1,85 @@
+# สถิติการรดน้ำแบบสะสม (ไม่ต้องคำนวณใหม่ทั้งประวัติ)
+#
+# Every session is added once to running totals for all time and for its day,
+# week (starting Monday, like the history filter) and month bucket, so each
+# update is O(1) and Today / This Week / This Month are dictionary lookups.
+
+from datetime import datetime, timedelta
+
+
+class Totals:
+    __slots__ = ('sessions', 'minutes', 'litres')
+
+    def __init__(self, sessions=0, minutes=0, litres=0.0):
+        self.sessions = sessions
+        self.minutes = minutes
+        self.litres = litres
+
+    def add(self, sessions, minutes, litres):
+        self.sessions += sessions
+        self.minutes += minutes
+        self.litres += litres
+
+    def as_dict(self):
+        return {
+            'sessions': self.sessions,
+            'minutes': self.minutes,
+            'litres': self.litres,
+            'avg_minutes': self.minutes / self.sessions if self.sessions else 0
+        }
+
+
+EMPTY = Totals()
+
+
+def week_key(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_key(day):
+    return (day.year, day.month)
+
+
+class StatsRollup:
+    def __init__(self):
+        self.total = Totals()
+        self.days = {}
+        self.weeks = {}
+        self.months = {}
+
+    def add(self, when, minutes, litres):
+        self.add_bucket(when.date(), 1, minutes, litres)
+
+    def add_bucket(self, day, sessions, minutes, litres):
+        # Merge pre-aggregated totals for one day (used when loading from disk)
+        self.total.add(sessions, minutes, litres)
+        for buckets, key in ((self.days, day), (self.weeks, week_key(day)),
+                             (self.months, month_key(day))):
+            totals = buckets.get(key)
+            if totals is None:
+                totals = buckets[key] = Totals()
+            totals.add(sessions, minutes, litres)
+
+    def clear(self):
+        self.total = Totals()
+        self.days.clear()
+        self.weeks.clear()
+        self.months.clear()
+
+    def day(self, day):
+        return self.days.get(day, EMPTY)
+
+    def week(self, day):
+        return self.weeks.get(week_key(day), EMPTY)
+
+    def month(self, day):
+        return self.months.get(month_key(day), EMPTY)
+
+    def summary(self, now=None):
+        today = (now or datetime.now()).date()
+        return {
+            'all': self.total.as_dict(),
+            'today': self.day(today).as_dict(),
+            'week': self.week(today).as_dict(),
+            'month': self.month(today).as_dict()
+        }
@@ -0,0 +1,195 @@
+# อ่านสถานะอุปกรณ์ผ่าน HTTP /status (keep-alive + cache)
+#
+# Every device gets one persistent HTTP/1.1 connection, used for one request
+# at a time; a semaphore caps how many devices are being asked at once.
+# Answers go into a cache keyed by device id. Readers inside the TTL get the
+# cached dict without touching the network, and concurrent readers of a stale
+# entry all wait on the same request. Everything runs on the FleetManager's
+# event loop; the public methods are safe to call from any thread.
+
+import asyncio
+import json
+import time
+
+POLL_INTERVAL = 5.0
+MAX_CONCURRENCY = 32
+REQUEST_TIMEOUT = 3.0
+# A polled answer stays fresh until the next poll has had time to land
+STATUS_TTL = POLL_INTERVAL + REQUEST_TIMEOUT
+HTTP_PORT = 80
+
+
+class HttpStatusError(Exception):
+    pass
+
+
+class HttpConnection:
+    def __init__(self, host, port=HTTP_PORT, timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.requests = 0
+        self._reader = None
+        self._writer = None
+
+    async def get(self, path):
+        # A kept-alive connection may have been closed by the device while
+        # idle; that earns one retry on a fresh connection
+        reused = self._writer is not None
+        try:
+            return await asyncio.wait_for(self._get(path), self.timeout)
+        except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            self.close()
+            if not reused:
+                raise
+        return await asyncio.wait_for(self._get(path), self.timeout)
+
+    async def _get(self, path):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+        self._writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           "Connection: keep-alive\r\n\r\n".encode('latin-1'))
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise EOFError("connection closed")
+        parts = status_line.split(None, 2)
+        code = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', '0') or 0)
+        body = await self._reader.readexactly(length) if length else b''
+        self.requests += 1
+
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        if code != 200:
+            raise HttpStatusError(f"HTTP {code}")
+        return body
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class StatusPoller:
+    def __init__(self, fleet, on_status=None, ttl=None, interval=POLL_INTERVAL,
+                 max_concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT):
+        self.fleet = fleet
+        self.on_status = on_status
+        # By default cached() answers from one poll until the next one
+        if ttl is None:
+            ttl = interval + timeout if interval else STATUS_TTL
+        self.ttl = ttl
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.errors = {}
+        self._connections = {}
+        self._cache = {}  # device_id -> (monotonic time, status)
+        self._inflight = {}
+        self._semaphore = None
+        self._task = None
+
+    # Public API - safe to call from any thread
+    def start(self):
+        asyncio.run_coroutine_threadsafe(self._start(), self.fleet.loop).result()
+
+    def stop(self, timeout=5):
+        if self.fleet.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._stop(), self.fleet.loop).result(timeout)
+
+    def add_device(self, device_id, host, port=HTTP_PORT):
+        self.fleet.loop.call_soon_threadsafe(self._add, device_id, host, port)
+
+    def remove_device(self, device_id):
+        self.fleet.loop.call_soon_threadsafe(self._remove, device_id)
+
+    def cached(self, device_id, max_age=None):
+        # Last status if it is recent enough, else None; never does I/O
+        entry = self._cache.get(device_id)
+        if entry is None:
+            return None
+        max_age = self.ttl if max_age is None else max_age
+        return entry[1] if time.monotonic() - entry[0] <= max_age else None
+
+    def refresh(self, device_ids=None, max_age=None):
+        # concurrent.futures.Future of {device_id: status or None}
+        return asyncio.run_coroutine_threadsafe(self.fetch_all(device_ids, max_age), self.fleet.loop)
+
+    # Loop side
+    async def fetch(self, device_id, max_age=None):
+        status = self.cached(device_id, max_age)
+        if status is not None:
+            return status
+        inflight = self._inflight.get(device_id)
+        if inflight is None:
+            inflight = self._inflight[device_id] = asyncio.ensure_future(self._request(device_id))
+            inflight.add_done_callback(lambda f, device_id=device_id: self._inflight.pop(device_id, None))
+        return await asyncio.shield(inflight)
+
+    async def fetch_all(self, device_ids=None, max_age=None):
+        device_ids = list(self._connections if device_ids is None else device_ids)
+        results = await asyncio.gather(*(self.fetch(d, max_age) for d in device_ids))
+        return dict(zip(device_ids, results))
+
+    async def _request(self, device_id):
+        connection = self._connections.get(device_id)
+        if connection is None:
+            return None
+        async with self._semaphore:
+            try:
+                status = json.loads(await connection.get('/status'))
+            except (OSError, EOFError, ValueError, HttpStatusError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError) as e:
+                self.errors[device_id] = str(e) or e.__class__.__name__
+                return None
+
+        self.errors.pop(device_id, None)
+        previous = self._cache.get(device_id)
+        self._cache[device_id] = (time.monotonic(), status)
+        if self.on_status and (previous is None or previous[1] != status):
+            self.on_status(device_id, status)
+        return status
+
+    async def _start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.interval:
+            self._task = asyncio.ensure_future(self._poll_loop())
+
+    async def _stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+    async def _poll_loop(self):
+        while True:
+            started = time.monotonic()
+            # Ask for anything older than one interval; fresher entries
+            # were already fetched for someone else
+            await self.fetch_all(max_age=self.interval / 2)
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _add(self, device_id, host, port):
+        if device_id not in self._connections:
+            self._connections[device_id] = HttpConnection(host, port, self.timeout)
+
+    def _remove(self, device_id):
+        connection = self._connections.pop(device_id, None)
+        if connection is not None:
+            connection.close()
+        self._cache.pop(device_id, None)
+        self.errors.pop(device_id, None)
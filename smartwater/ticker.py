@@ -0,0 +1,73 @@
+# ตัวจับเวลากลาง (ใช้ timer ตัวเดียวทั้งระบบ)
+#
+# Jobs register here instead of owning timers: periodic ones at the interval
+# they actually need, one-shots with a delay. The host keeps a single timer
+# armed for next_delay() and calls run_due() when it fires. Periodic jobs run
+# on a phase grid (wall-clock seconds, the start of a watering session, ...)
+# so each tick lands right after the value it shows has changed. With no jobs
+# left next_delay() is None and the host timer can stop altogether.
+
+import time
+
+
+class TickService:
+    def __init__(self, on_change=None, clock=time.monotonic):
+        self.on_change = on_change
+        self.clock = clock
+        self._jobs = {}  # name -> [deadline, interval, phase, callback]
+        self._running = False
+
+    def __contains__(self, name):
+        return name in self._jobs
+
+    def every(self, name, interval, callback, phase=None):
+        now = self.clock()
+        phase = now if phase is None else phase
+        self._jobs[name] = [self._next(now, interval, phase), interval, phase, callback]
+        self._changed()
+
+    def after(self, name, delay, callback):
+        self._jobs[name] = [self.clock() + delay, None, None, callback]
+        self._changed()
+
+    def cancel(self, name):
+        if self._jobs.pop(name, None) is not None:
+            self._changed()
+
+    def wall_phase(self):
+        # A phase that puts ticks on whole wall-clock seconds
+        return self.clock() - time.time() % 1.0
+
+    def next_delay(self, now=None):
+        if not self._jobs:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, min(job[0] for job in self._jobs.values()) - now)
+
+    def run_due(self, now=None):
+        now = self.clock() if now is None else now
+        due = sorted(((job[0], name, job) for name, job in self._jobs.items() if job[0] <= now),
+                     key=lambda item: item[0])
+        self._running = True
+        try:
+            for _, name, job in due:
+                # An earlier callback may have replaced or cancelled this one
+                if self._jobs.get(name) is not job:
+                    continue
+                if job[1] is None:
+                    del self._jobs[name]
+                else:
+                    job[0] = self._next(now, job[1], job[2])
+                job[3]()
+        finally:
+            self._running = False
+        self._changed()
+        return len(due)
+
+    def _next(self, now, interval, phase):
+        # First point of the grid strictly after `now` (missed ticks collapse)
+        return phase + ((now - phase) // interval + 1) * interval
+
+    def _changed(self):
+        if not self._running and self.on_change:
+            self.on_change()
@@ -0,0 +1,25 @@
+# จับเวลาแต่ละช่วงของการเริ่มโปรแกรม
+#
+# PhaseTimer splits a stretch of work into consecutive named phases: mark()
+# closes the phase that ran since the previous mark (or since `started`).
+
+import time
+
+
+class PhaseTimer:
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = []  # (name, seconds)
+        self._last = self.started
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def total(self):
+        return self._last - self.started
+
+    def summary(self):
+        parts = [f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases]
+        return f"{self.total() * 1000:.0f} ms (" + ", ".join(parts) + ")"
@@ -33,6 +33,43 @@ unsigned long wateringDuration = 0;
 // Serial command buffer
 String inputString = "";
 
+// Binary framing (optional, the app offers it with "PROTO:BIN1")
+//   0xA5 | type | seq | len | payload | CRC-16/CCITT-FALSE (LE) over type..payload
+#define PROTO_HELLO  "PROTO:BIN1"
+#define FRAME_SYNC   0xA5
+#define FRAME_CMD    0x01
+#define FRAME_ACK    0x81
+#define FRAME_EVENT  0x82
+#define FRAME_STATUS 0x83
+#define MAX_PAYLOAD  255
+
+// CMD opcodes
+#define OP_DURATION  0x07
+#define OP_TEXT      0x7F
+const char* OPCODE_NAMES[] = {"", "LED1_ON", "LED2_ON", "LED1_OFF", "LED2_OFF", "STOP", "STATUS"};
+
+// EVENT codes, one per Serial message
+#define EVT_WATER_ON       0x01
+#define EVT_FERTILIZER_ON  0x02
+#define EVT_WATER_OFF      0x03
+#define EVT_FERTILIZER_OFF 0x04
+#define EVT_ALL_OFF        0x05
+#define EVT_AUTO_STOP      0x06
+
+struct BinaryLink {
+  Stream* out;              // NULL while the link speaks text
+  uint8_t seq;
+  uint8_t frame[4 + MAX_PAYLOAD + 2];
+  uint16_t fill;
+  String text;              // text line received in binary mode
+  uint8_t events[16];       // events waiting for the next EVENT frame
+  uint8_t eventCount;
+  bool statusDue;
+};
+
+BinaryLink serialLink;
+BinaryLink tcpLink;
+
 void setup() {
   Serial.begin(9600);
   Serial.println("ESP32 Smart Irrigation System Starting...");
@@ -71,8 +108,15 @@ void loop() {
   // Handle Serial Commands
   while (Serial.available()) {
     char inChar = (char)Serial.read();
-    if (inChar == '\n') {
-      handleCommand(inputString);
+    if (serialLink.out != NULL) {
+      binaryFeed(&serialLink, inChar);
+    } else if (inChar == '\n') {
+      inputString.trim();
+      if (inputString == PROTO_HELLO) {
+        startBinary(&serialLink, &Serial);
+      } else {
+        handleCommand(inputString);
+      }
       inputString = "";
     } else {
       inputString += inChar;
@@ -89,10 +133,13 @@ void loop() {
   if (isWatering && wateringDuration > 0) {
     if (millis() - wateringStartTime > wateringDuration) {
       stopAll();
-      Serial.println("Auto stop - duration reached");
+      report(EVT_AUTO_STOP, "Auto stop - duration reached");
     }
   }
   
+  // Send what this pass printed to the binary links
+  flushReports();
+  
   delay(10);
 }
 
@@ -282,16 +329,21 @@ void handleTCPClients() {
   WiFiClient client = tcpServer.available();
   
   if (client) {
-    Serial.println("New TCP client connected");
+    serialPrintln("New TCP client connected");
     
     while (client.connected()) {
-      if (client.available()) {
+      if (tcpLink.out != NULL) {
+        while (client.available()) {
+          binaryFeed(&tcpLink, client.read());
+        }
+      } else if (client.available()) {
         String command = client.readStringUntil('\n');
         command.trim();
         
-        if (command.length() > 0) {
-          Serial.print("TCP Command: ");
-          Serial.println(command);
+        if (command == PROTO_HELLO) {
+          startBinary(&tcpLink, &client);
+        } else if (command.length() > 0) {
+          serialPrintln("TCP Command: " + command);
           
           handleCommand(command);
           
@@ -299,19 +351,24 @@ void handleTCPClients() {
           client.println("OK");
         }
       }
+      flushReports();
+      
+      // Keep answering HTTP (/status, /control) while this client holds
+      // the connection, or the status poller times out until it leaves
+      server.handleClient();
       
       // Small delay to prevent CPU hogging
       delay(10);
     }
     
-    Serial.println("TCP client disconnected");
+    tcpLink.out = NULL;
+    serialPrintln("TCP client disconnected");
   }
 }
 
 void handleCommand(String cmd) {
   cmd.trim();
-  Serial.print("Executing command: ");
-  Serial.println(cmd);
+  serialPrintln("Executing command: " + cmd);
   
   if (cmd == "LED1_ON") {
     // Water mode - turn on water valve and pump
@@ -321,7 +378,7 @@ void handleCommand(String cmd) {
     waterMode = true;
     fertilizerMode = false;
     wateringStartTime = millis();
-    Serial.println("Water mode ON");
+    report(EVT_WATER_ON, "Water mode ON");
     
   } else if (cmd == "LED2_ON") {
     // Fertilizer mode - turn on both valves and pump
@@ -332,7 +389,7 @@ void handleCommand(String cmd) {
     waterMode = false;
     fertilizerMode = true;
     wateringStartTime = millis();
-    Serial.println("Fertilizer mode ON");
+    report(EVT_FERTILIZER_ON, "Fertilizer mode ON");
     
   } else if (cmd == "LED1_OFF") {
     digitalWrite(LED1, LOW);
@@ -341,7 +398,7 @@ void handleCommand(String cmd) {
       digitalWrite(PUMP, LOW);
       isWatering = false;
     }
-    Serial.println("Water valve OFF");
+    report(EVT_WATER_OFF, "Water valve OFF");
     
   } else if (cmd == "LED2_OFF") {
     digitalWrite(LED2, LOW);
@@ -350,7 +407,7 @@ void handleCommand(String cmd) {
       digitalWrite(PUMP, LOW);
       isWatering = false;
     }
-    Serial.println("Fertilizer valve OFF");
+    report(EVT_FERTILIZER_OFF, "Fertilizer valve OFF");
     
   } else if (cmd == "LED_OFF" || cmd == "STOP") {
     stopAll();
@@ -358,16 +415,16 @@ void handleCommand(String cmd) {
   } else if (cmd.startsWith("DURATION:")) {
     // Set watering duration (in seconds)
     wateringDuration = cmd.substring(9).toInt() * 1000;
-    Serial.print("Duration set to: ");
-    Serial.print(wateringDuration / 1000);
-    Serial.println(" seconds");
+    serialPrintln("Duration set to: " + String(wateringDuration / 1000) + " seconds");
+    reportStatus();
     
   } else if (cmd == "STATUS") {
     // Send status
     String status = "LED1:" + String(digitalRead(LED1)) + 
                    ",LED2:" + String(digitalRead(LED2)) + 
                    ",PUMP:" + String(digitalRead(PUMP));
-    Serial.println(status);
+    serialPrintln(status);
+    reportStatus();
   }
 }
 
@@ -379,7 +436,155 @@ void stopAll() {
   waterMode = false;
   fertilizerMode = false;
   wateringDuration = 0;
-  Serial.println("All systems OFF");
+  report(EVT_ALL_OFF, "All systems OFF");
+}
+
+// ---------- Binary framing ----------
+
+// Text on Serial, unless Serial itself carries frames
+void serialPrintln(const String& line) {
+  if (serialLink.out == NULL) {
+    Serial.println(line);
+  }
+}
+
+void report(uint8_t event, const char* line) {
+  serialPrintln(line);
+  queueEvent(&serialLink, event);
+  queueEvent(&tcpLink, event);
+}
+
+void reportStatus() {
+  serialLink.statusDue = serialLink.out != NULL;
+  tcpLink.statusDue = tcpLink.out != NULL;
+}
+
+void queueEvent(BinaryLink* link, uint8_t event) {
+  if (link->out == NULL) {
+    return;
+  }
+  if (link->eventCount == sizeof(link->events)) {
+    flushLink(link);
+  }
+  link->events[link->eventCount++] = event;
+}
+
+void flushReports() {
+  flushLink(&serialLink);
+  flushLink(&tcpLink);
+}
+
+void flushLink(BinaryLink* link) {
+  if (link->out == NULL) {
+    return;
+  }
+  if (link->eventCount > 0) {
+    sendFrame(link, FRAME_EVENT, link->events, link->eventCount);
+    link->eventCount = 0;
+  }
+  if (link->statusDue) {
+    uint8_t flags = digitalRead(LED1) | digitalRead(LED2) << 1 | digitalRead(PUMP) << 2 | isWatering << 3;
+    uint16_t seconds = wateringDuration / 1000;
+    uint8_t status[4] = {flags, (uint8_t)(waterMode ? 1 : (fertilizerMode ? 2 : 0)),
+                         (uint8_t)(seconds & 0xFF), (uint8_t)(seconds >> 8)};
+    sendFrame(link, FRAME_STATUS, status, sizeof(status));
+    link->statusDue = false;
+  }
+}
+
+uint16_t crc16(uint16_t crc, const uint8_t* data, uint16_t len) {
+  while (len--) {
+    crc ^= (uint16_t)(*data++) << 8;
+    for (uint8_t i = 0; i < 8; i++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendFrame(BinaryLink* link, uint8_t type, const uint8_t* payload, uint8_t len) {
+  uint8_t head[4] = {FRAME_SYNC, type, link->seq++, len};
+  uint16_t crc = crc16(crc16(0xFFFF, head + 1, 3), payload, len);
+  uint8_t tail[2] = {(uint8_t)(crc & 0xFF), (uint8_t)(crc >> 8)};
+  link->out->write(head, sizeof(head));
+  link->out->write(payload, len);
+  link->out->write(tail, sizeof(tail));
+}
+
+void startBinary(BinaryLink* link, Stream* out) {
+  out->println(PROTO_HELLO " OK");
+  link->out = out;
+  link->seq = 0;
+  link->fill = 0;
+  link->text = "";
+  link->eventCount = 0;
+  link->statusDue = false;
+}
+
+void binaryFeed(BinaryLink* link, uint8_t b) {
+  // Bytes outside a frame are a text line: the app offering framing again
+  // after a reconnect, or an old client that only speaks text
+  if (link->fill == 0 && b != FRAME_SYNC) {
+    if (b != '\n') {
+      link->text += (char)b;
+      return;
+    }
+    String line = link->text;
+    line.trim();
+    link->text = "";
+    if (line == PROTO_HELLO) {
+      startBinary(link, link->out);
+    } else if (line.length() > 0) {
+      Stream* out = link->out;
+      link->out = NULL;
+      handleCommand(line);
+      if (link == &tcpLink) {
+        out->println("OK");
+      }
+    }
+    return;
+  }
+
+  link->frame[link->fill++] = b;
+  if (link->fill < 4 || link->fill < 4 + link->frame[3] + 2) {
+    return;
+  }
+
+  uint16_t len = link->frame[3];
+  uint16_t crc = link->frame[4 + len] | link->frame[5 + len] << 8;
+  link->fill = 0;
+  if (link->frame[1] == FRAME_CMD && crc16(0xFFFF, link->frame + 1, 3 + len) == crc) {
+    runCommands(link, link->frame[2], link->frame + 4, len);
+  }
+}
+
+void runCommands(BinaryLink* link, uint8_t seq, const uint8_t* p, uint16_t len) {
+  uint8_t count = 0;
+  uint16_t i = 0;
+  while (i < len) {
+    uint8_t op = p[i++];
+    if (op == OP_DURATION && i + 2 <= len) {
+      handleCommand("DURATION:" + String(p[i] | p[i + 1] << 8));
+      i += 2;
+    } else if (op == OP_TEXT && i < len && i + 1 + p[i] <= len) {
+      String cmd = "";
+      for (uint8_t k = 0; k < p[i]; k++) {
+        cmd += (char)p[i + 1 + k];
+      }
+      i += 1 + p[i];
+      handleCommand(cmd);
+    } else if (op >= 1 && op <= 6) {
+      handleCommand(OPCODE_NAMES[op]);
+    } else {
+      break;
+    }
+    count++;
+  }
+
+  // Everything the batch printed, then the ACK
+  flushReports();
+  uint8_t ack[2] = {seq, count};
+  sendFrame(link, FRAME_ACK, ack, sizeof(ack));
 }
 
 void saveWiFiSettings() {
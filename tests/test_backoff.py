@@ -0,0 +1,30 @@
+# ทดสอบ exponential backoff
+
+import unittest
+
+from smartwater.backoff import Backoff
+
+
+class BackoffTest(unittest.TestCase):
+    def test_grows_to_cap(self):
+        backoff = Backoff(base=1.0, cap=60.0, jitter=0.0)
+        delays = [backoff.next_delay() for _ in range(8)]
+        self.assertEqual(delays, [1, 2, 4, 8, 16, 32, 60, 60])
+
+    def test_long_outage_does_not_overflow(self):
+        backoff = Backoff(base=1.0, cap=60.0)
+        for _ in range(5000):
+            delay = backoff.next_delay()
+        self.assertLessEqual(delay, 60.0)
+        self.assertGreaterEqual(delay, 30.0)
+
+    def test_reset(self):
+        backoff = Backoff(base=1.0, cap=60.0, jitter=0.0)
+        for _ in range(3000):
+            backoff.next_delay()
+        backoff.reset()
+        self.assertEqual(backoff.next_delay(), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# ทดสอบการเริ่มรดน้ำเมื่ออุปกรณ์ไม่ตอบรับคำสั่ง
+
+import concurrent.futures
+import threading
+import unittest
+
+from smartwater.controller import WATER_ONLY, IrrigationController
+from smartwater.fleet import CommandError, CommandSuperseded, FleetManager, ManagedDevice
+
+
+class FakeFleet:
+    # Connected, and hands back a future per command for the test to settle
+    def __init__(self):
+        self.sent = []
+
+    def is_connected(self, device_id):
+        return True
+
+    def send(self, device_id, command):
+        future = concurrent.futures.Future()
+        self.sent.append((command, future))
+        return future
+
+
+def settle_on_thread(future, error=None):
+    # The fleet settles futures on its own thread
+    if error is None:
+        thread = threading.Thread(target=future.set_result, args=(None,))
+    else:
+        thread = threading.Thread(target=future.set_exception, args=(error,))
+    thread.start()
+    thread.join()
+
+
+class StartWateringTest(unittest.TestCase):
+    def setUp(self):
+        self.fleet = FakeFleet()
+        self.stopped = []
+        self.logs = []
+        self.controller = IrrigationController(
+            self.fleet, on_log=lambda message, level: self.logs.append((message, level)),
+            on_watering_stopped=lambda: self.stopped.append(True))
+        self.controller.active_device = 'dev1'
+
+    def test_acknowledged_start_keeps_running(self):
+        self.assertTrue(self.controller.start_watering(WATER_ONLY, 5))
+        settle_on_thread(self.fleet.sent[0][1])
+        self.controller.check_completion()
+        self.assertTrue(self.controller.is_running)
+        self.assertEqual(self.stopped, [])
+
+    def test_failed_start_ends_session_on_check(self):
+        self.controller.start_watering(WATER_ONLY, 5)
+        settle_on_thread(self.fleet.sent[0][1], CommandError("no acknowledgement"))
+        # Nothing changes on the fleet thread
+        self.assertTrue(self.controller.is_running)
+        self.controller.check_completion()
+        self.assertFalse(self.controller.is_running)
+        self.assertEqual(self.stopped, [True])
+        self.assertIn("error", [level for _, level in self.logs])
+
+    def test_failed_start_ends_session_on_command_failed(self):
+        self.controller.start_watering(WATER_ONLY, 5)
+        settle_on_thread(self.fleet.sent[0][1], CommandError("no acknowledgement"))
+        self.controller.handle_command_failed('dev1', 'LED1_ON', "no acknowledgement")
+        self.assertFalse(self.controller.is_running)
+        self.assertEqual(self.stopped, [True])
+
+    def test_failure_of_an_earlier_session_is_ignored(self):
+        self.controller.start_watering(WATER_ONLY, 5)
+        first = self.fleet.sent[0][1]
+        self.controller.stop_watering()
+        self.controller.start_watering(WATER_ONLY, 5)
+        settle_on_thread(first, CommandError("LED1_ON superseded by STOP"))
+        self.controller.check_completion()
+        self.assertTrue(self.controller.is_running)
+
+    def test_start_superseded_by_stop_is_not_an_error(self):
+        # Settled before the STOP's own session handling has run
+        self.controller.start_watering(WATER_ONLY, 5)
+        settle_on_thread(self.fleet.sent[0][1], CommandSuperseded("LED1_ON superseded by STOP"))
+        self.controller.check_completion()
+        self.controller.stop_watering()
+        self.assertEqual(self.stopped, [True])
+        self.assertNotIn("error", [level for _, level in self.logs])
+
+    def test_superseded_command_is_not_reported_as_failed(self):
+        failed = []
+        fleet = FleetManager(on_command_failed=lambda *args: failed.append(args))
+        device = ManagedDevice(fleet, 'dev1', {'type': 'serial', 'port': '/dev/null'})
+        superseded, lost = concurrent.futures.Future(), concurrent.futures.Future()
+        device._fail([('LED1_ON', [superseded])], CommandSuperseded("LED1_ON superseded by STOP"))
+        device._fail([('LED2_ON', [lost])], CommandError("no acknowledgement"))
+        self.assertIsInstance(superseded.exception(), CommandSuperseded)
+        self.assertEqual(failed, [('dev1', 'LED2_ON', "no acknowledgement")])
+
+
+if __name__ == '__main__':
+    unittest.main()
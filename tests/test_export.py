@@ -0,0 +1,67 @@
+# ทดสอบการ export ประวัติจากหน้าต่างหลัก (Qt แบบ offscreen)
+
+import csv
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtCore import QStandardPaths
+from PyQt6.QtWidgets import QApplication
+
+QStandardPaths.setTestModeEnabled(True)
+app = QApplication.instance() or QApplication(sys.argv[:1])
+
+import main
+
+
+class ExportHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.messages = []
+        for name in ('information', 'critical', 'warning'):
+            patcher = mock.patch.object(main.QMessageBox, name,
+                                        lambda *args, name=name: self.messages.append((name, args[2])))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.window = main.MainWindow()
+        self.window.controller.clear_history()
+
+    def tearDown(self):
+        self.window.close()
+        self.tmp.cleanup()
+
+    def export(self, filename, selected):
+        window = self.window
+        window.tab_widget.setCurrentIndex([name for name, _ in main.TABS].index('history'))
+        with mock.patch.object(main.QFileDialog, 'getSaveFileName', return_value=(filename, selected)):
+            window.export_history()
+        deadline = time.monotonic() + 10
+        while window.exporter is not None and time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.01)
+        self.assertIsNone(window.exporter, "export did not finish")
+
+    def test_export_csv(self):
+        for minutes in (5, 10, 15):
+            self.window.controller.add_to_history("Water Only", minutes, "Manual", "Started")
+        path = os.path.join(self.tmp.name, 'history.csv')
+        self.export(path, "CSV Files (*.csv)")
+
+        self.assertEqual(self.messages[-1][0], 'information', self.messages)
+        with open(path, newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 1 + 3)
+
+    def test_export_failure_is_reported(self):
+        path = os.path.join(self.tmp.name, 'missing-dir', 'history.csv')
+        self.export(path, "CSV Files (*.csv)")
+        self.assertEqual(self.messages[-1][0], 'critical', self.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
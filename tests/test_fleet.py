@@ -0,0 +1,79 @@
+# ทดสอบ FleetManager กับพอร์ตอนุกรมจำลอง
+
+import io
+import time
+import unittest
+from unittest import mock
+
+from smartwater import fleet as fleet_module
+from smartwater.fleet import CONNECTED, FleetManager
+
+
+class NoFilenoSerial:
+    # Like pyserial's Windows Serial: no fd for the event loop to watch
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.written = []
+        self.closed = False
+        self.replies = b''
+        NoFilenoSerial.instances.append(self)
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
+
+    @property
+    def in_waiting(self):
+        return len(self.replies)
+
+    def readinto(self, buffer):
+        n = min(len(buffer), len(self.replies))
+        buffer[:n] = self.replies[:n]
+        self.replies = self.replies[n:]
+        return n
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        for line in bytes(data).decode().splitlines():
+            self.replies += f"Executing command: {line}\r\n".encode()
+        return len(data)
+
+    def close(self):
+        self.closed = True
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class SerialPollingTest(unittest.TestCase):
+    def setUp(self):
+        NoFilenoSerial.instances.clear()
+        patcher = mock.patch.object(fleet_module.serial, 'Serial', NoFilenoSerial)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.lines = []
+        self.fleet = FleetManager(on_lines=lambda device_id, lines: self.lines.extend(lines),
+                                  heartbeat_interval=0)
+        self.fleet.start()
+        self.addCleanup(self.fleet.stop)
+
+    def test_connects_and_polls_without_fileno(self):
+        device_id = self.fleet.add_device({'type': 'serial', 'port': 'COM3', 'baudrate': 9600})
+        self.assertTrue(wait_for(lambda: self.fleet.is_connected(device_id)))
+        self.assertEqual(self.fleet.devices[device_id].state, CONNECTED)
+
+        rtt = self.fleet.send(device_id, "STATUS").result(5)
+        self.assertGreaterEqual(rtt, 0.0)
+        self.assertTrue(wait_for(lambda: "Executing command: STATUS" in self.lines))
+        self.assertEqual(NoFilenoSerial.instances[0].written, [b"STATUS\n"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# ทดสอบประวัติการรดน้ำ (ช่วงเวลาและ SQLite)
+
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from smartwater.history import SqliteHistory, WateringHistory, filter_range
+
+# A Wednesday
+NOW = datetime(2024, 1, 3, 15, 30)
+
+
+class FilterRangeTest(unittest.TestCase):
+    def test_this_week_is_bounded(self):
+        start, end = filter_range('This Week', NOW)
+        self.assertEqual(start, datetime(2024, 1, 1))
+        self.assertEqual(end, datetime(2024, 1, 8))
+
+    def test_this_week_leaves_out_next_week(self):
+        history = WateringHistory()
+        history.add("Water Only", 5, "Manual", "Started", when=datetime(2024, 1, 2, 7, 0))
+        history.add("Water Only", 5, "Manual", "Started", when=datetime(2024, 1, 9, 7, 0))
+        entries = list(history.filter('This Week', NOW))
+        self.assertEqual([e['datetime'] for e in entries], [datetime(2024, 1, 2, 7, 0)])
+
+
+class SqliteHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'history.db')
+        self.errors = []
+        self.history = SqliteHistory(self.path, flush_interval=0, on_error=self.errors.append)
+
+    def tearDown(self):
+        self.history.close()
+        self.directory.cleanup()
+
+    def test_view_taken_before_clear(self):
+        for day in (1, 2, 3):
+            self.history.add("Water Only", 5, "Manual", "Started", when=datetime(2024, 1, day, 7, 0))
+        self.history.flush()
+        view = self.history.between()
+        self.assertEqual(len(view), 3)
+
+        self.history.clear()
+        self.assertEqual(list(view), [])
+        with self.assertRaises(IndexError):
+            view[0]
+        self.assertEqual(len(self.history.between()), 0)
+
+    def test_reads_do_not_wait_for_the_writer(self):
+        # Another connection holds the write lock, so the writer is stuck
+        # in its INSERT until it is released
+        blocker = sqlite3.connect(self.path)
+        blocker.execute('BEGIN IMMEDIATE')
+        try:
+            self.history.add("Water Only", 5, "Manual", "Started", when=datetime(2024, 1, 1, 7, 0))
+            time.sleep(0.2)
+            started = time.monotonic()
+            self.assertEqual(len(self.history.between()), 1)
+            self.assertLess(time.monotonic() - started, 1.0)
+        finally:
+            blocker.rollback()
+            blocker.close()
+        self.history.flush()
+        self.assertEqual(len(self.history.between()), 1)
+        self.assertEqual(self.errors, [])
+
+    def test_write_error_is_reported(self):
+        with sqlite3.connect(self.path) as db:
+            db.execute('DROP TABLE history')
+        self.history.add("Water Only", 5, "Manual", "Started", when=datetime(2024, 1, 1, 7, 0))
+        self.history.flush()
+        self.assertEqual(len(self.errors), 1)
+        self.assertIn('History write error', self.errors[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
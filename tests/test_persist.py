@@ -0,0 +1,70 @@
+# ทดสอบไฟล์ตารางเวลาและการย้ายจาก JSON
+
+import json
+import os
+import tempfile
+import unittest
+
+from smartwater.persist import ScheduleStore, decode_schedules, encode_schedules
+from smartwater.scheduler import make_schedule
+from smartwater.settings import JsonSettingsStore, load_settings
+
+SCHEDULES = [
+    make_schedule('06:30', 10, ['Mon', 'Wed', 'Fri'], "Water Only"),
+    make_schedule('18:00', 5, ['Sun'], "Water + Fertilizer", repeat=False, active=False),
+]
+
+
+class ScheduleStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'schedules.bin')
+        self.errors = []
+        self.store = ScheduleStore(self.path, delay=0, on_error=self.errors.append)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def settings_store(self, values):
+        path = os.path.join(self.directory.name, 'settings.json')
+        with open(path, 'w') as f:
+            json.dump(values, f)
+        return JsonSettingsStore(path)
+
+    def test_round_trip(self):
+        schedules = SCHEDULES + [dict(make_schedule('07:15', 3, [], "Water Only"), zone='A', note='x')]
+        self.assertEqual(decode_schedules(encode_schedules(schedules)), schedules)
+        self.store.save(schedules)
+        self.store.flush()
+        self.assertEqual(self.store.load(), schedules)
+        self.assertEqual(self.errors, [])
+
+    def test_corrupt_file_is_reported(self):
+        data = bytearray(encode_schedules(SCHEDULES))
+        data[-8] ^= 0xFF
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        self.assertIsNone(self.store.load())
+        self.assertEqual(len(self.errors), 1)
+        self.assertIn('checksum', self.errors[0])
+
+    def test_migration_drops_the_json(self):
+        store = self.settings_store({'schedules': json.dumps(SCHEDULES)})
+        self.assertEqual(load_settings(store, self.store).schedules, SCHEDULES)
+        self.assertEqual(self.store.load(), SCHEDULES)
+        self.assertIsNone(store.value('schedules'))
+        self.assertIsNone(JsonSettingsStore(store.path).value('schedules'))
+
+    def test_corrupt_file_is_replaced(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a schedule file')
+        settings = load_settings(self.settings_store({}), self.store)
+        self.assertEqual(settings.schedules, [])
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.store.load(), [])
+        self.assertEqual(len(self.errors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
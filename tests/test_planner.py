@@ -0,0 +1,78 @@
+# ทดสอบการวางแผนรดน้ำหลายโซน (ทางลัดของ find_start)
+
+import unittest
+
+from smartwater.planner import Zone, ZonePlanner, random_zones
+
+MONDAY_MORNING = [(['Mon'], '05:00', '06:00')]
+
+
+class CheckedPlanner(ZonePlanner):
+    # Every answer find_start gives with its memos is compared with a search
+    # from scratch over the same sessions
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mismatches = []
+        self.checks = 0
+
+    def find_start(self, duration, flow, after=0):
+        found = super().find_start(duration, flow, after)
+        memos = self._hint, self._failed
+        self._hint, self._failed = {}, {}
+        try:
+            expected = super().find_start(duration, flow, after)
+        finally:
+            self._hint, self._failed = memos
+        self.checks += 1
+        if found != expected:
+            self.mismatches.append((duration, flow, after, found, expected))
+        return found
+
+
+class FindStartTest(unittest.TestCase):
+    def test_hint_skips_full_minutes(self):
+        planner = ZonePlanner(1.0)
+        planner.insert(Zone('a', 0), 0, 60)
+        self.assertEqual(planner.find_start(30, 1.0), 60)
+        self.assertEqual(planner._hint[1.0], 60)
+        # Half the pump fits alongside another half
+        planner.insert(Zone('b', 0), 60, 60, flow=0.5)
+        self.assertEqual(planner.find_start(30, 1.0), 120)
+        self.assertEqual(planner.find_start(30, 0.5), 60)
+
+    def test_failed_duration_is_remembered(self):
+        planner = ZonePlanner(1.0, MONDAY_MORNING)
+        self.assertIsNone(planner.find_start(90, 1.0))
+        self.assertEqual(planner._failed[1.0], 90)
+        self.assertIsNone(planner.find_start(120, 1.0))
+        # Shorter sessions still fit
+        self.assertEqual(planner.find_start(30, 1.0), 300)
+
+    def test_constrained_failure_is_not_remembered(self):
+        planner = ZonePlanner(1.0, MONDAY_MORNING)
+        planner.insert(Zone('a', 0), 300, 30)
+        # Nothing starts at or after 06:00 Monday, but 05:30 is free
+        self.assertIsNone(planner.find_start(30, 1.0, after=360))
+        self.assertNotIn(1.0, planner._failed)
+        self.assertEqual(planner.find_start(30, 1.0), 330)
+
+    def test_shortcuts_match_a_full_search(self):
+        windows = [(['Mon', 'Wed', 'Fri'], '05:00', '09:00'), (['Tue', 'Sat'], '17:00', '19:00')]
+        for pump_flow, count in ((10, 150), (40, 400)):
+            planner = CheckedPlanner(pump_flow, windows, max_session=45)
+            planner.insert(Zone('existing', 0), 5 * 60, 30, flow=pump_flow / 2)
+            plan = planner.plan(random_zones(count, pump_flow, seed=pump_flow))
+            self.assertGreaterEqual(planner.checks, count)
+            self.assertTrue(plan.unplaced, "the week should be full")
+            self.assertEqual(planner.mismatches, [])
+
+    def test_pump_is_never_overloaded(self):
+        planner = ZonePlanner(20, [(['Mon', 'Tue'], '05:00', '08:00')])
+        plan = planner.plan(random_zones(60, 20, seed=3))
+        for session in plan.sessions:
+            self.assertLessEqual(planner.peak_load(session.start, session.start + session.duration),
+                                 20 + 1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
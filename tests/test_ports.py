@@ -0,0 +1,69 @@
+# ทดสอบการเฝ้าดูและตรวจสอบ Serial port
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from smartwater import ports as ports_module
+from smartwater.ports import PortInfo, PortScanner, PortWatcher
+
+from .test_fleet import wait_for
+
+
+class SlowListing:
+    # A new port on every call, each listing taking a while
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [PortInfo(f"/dev/ttyUSB{i}", '', '') for i in range(self.calls)]
+
+
+class PortWatcherTest(unittest.TestCase):
+    def test_no_change_reported_after_stop(self):
+        changes = []
+        listing = SlowListing()
+        with mock.patch.object(ports_module, 'list_ports', listing):
+            watcher = PortWatcher(lambda added, removed: changes.append(added), interval=0.01)
+            watcher.start(initial=[])
+            self.assertTrue(wait_for(lambda: listing.calls >= 2))
+            watcher.stop()
+            self.assertFalse(watcher._thread.is_alive())
+            reported = len(changes)
+            time.sleep(0.3)
+        self.assertEqual(len(changes), reported)
+
+    def test_errors_go_to_callback(self):
+        errors = []
+        with mock.patch.object(ports_module, 'list_ports', side_effect=OSError("no sysfs")):
+            watcher = PortWatcher(lambda added, removed: None, on_error=errors.append)
+            watcher.start()
+            self.assertTrue(wait_for(lambda: errors))
+            watcher.stop()
+        self.assertEqual(errors[0], "Port watcher error: no sysfs")
+
+
+class PortScannerTest(unittest.TestCase):
+    def test_ports_in_use_are_not_opened(self):
+        results = {}
+        done = threading.Event()
+
+        def probed(device, available):
+            results[device] = available
+            if len(results) == 2:
+                done.set()
+
+        scanner = PortScanner()
+        with mock.patch.object(ports_module, 'probe_port', return_value=True) as probe_port:
+            scanner.probe(['/dev/ttyUSB0', '/dev/ttyUSB1'], probed, in_use={'/dev/ttyUSB0'})
+            self.assertTrue(done.wait(5))
+        probe_port.assert_called_once_with('/dev/ttyUSB1')
+        self.assertEqual(results, {'/dev/ttyUSB0': False, '/dev/ttyUSB1': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
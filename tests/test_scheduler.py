@@ -0,0 +1,35 @@
+# ทดสอบตัวจัดตารางรดน้ำ
+
+import unittest
+from datetime import datetime
+
+from smartwater.scheduler import Scheduler, make_schedule
+
+# A Monday
+MONDAY = datetime(2024, 1, 1, 6, 0)
+DUE = datetime(2024, 1, 1, 7, 0)
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_active_schedule_fires(self):
+        scheduler = Scheduler(now=MONDAY)
+        schedule = make_schedule('07:00', 5, ['Mon'], 'Auto')
+        scheduler.add(schedule, now=MONDAY)
+        self.assertEqual(scheduler.pop_due(DUE), [(DUE, schedule)])
+
+    def test_inactive_schedule_does_not_fire(self):
+        scheduler = Scheduler(now=MONDAY)
+        scheduler.add(make_schedule('07:00', 5, ['Mon'], 'Auto', active=False), now=MONDAY)
+        self.assertIsNone(scheduler.next_fire_time())
+        self.assertEqual(scheduler.pop_due(DUE), [])
+
+    def test_inactive_schedule_fires_once_toggled_on(self):
+        scheduler = Scheduler(now=MONDAY)
+        schedule = make_schedule('07:00', 5, ['Mon'], 'Auto', active=False)
+        scheduler.add(schedule, now=MONDAY)
+        scheduler.toggle(0, now=MONDAY)
+        self.assertEqual(scheduler.pop_due(DUE), [(DUE, schedule)])
+
+
+if __name__ == '__main__':
+    unittest.main()
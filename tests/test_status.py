@@ -0,0 +1,49 @@
+# ทดสอบการอ่านสถานะผ่าน HTTP กับอุปกรณ์จำลอง
+
+import time
+import unittest
+from unittest import mock
+
+from smartwater import status as status_module
+from smartwater.controller import IrrigationController
+from smartwater.emulator import Emulator
+from smartwater.fleet import FleetManager
+from smartwater.status import POLL_INTERVAL, StatusPoller
+
+from .test_fleet import wait_for
+
+
+class StatusPollerTest(unittest.TestCase):
+    def setUp(self):
+        self.emulator = Emulator(devices=1, tcp_port=0, http_port=0).start()
+        self.fleet = FleetManager(heartbeat_interval=0)
+        self.fleet.start()
+        # Poll only when asked, so the test decides when the "poll" happens
+        self.status = StatusPoller(self.fleet, interval=0)
+        self.status.start()
+        self.controller = IrrigationController(self.fleet, status=self.status, on_log=lambda *args: None)
+
+    def tearDown(self):
+        self.status.stop()
+        self.fleet.stop()
+        self.emulator.stop()
+
+    def test_default_ttl_covers_the_poll_interval(self):
+        poller = StatusPoller(self.fleet)
+        self.assertGreaterEqual(poller.ttl, poller.interval + poller.timeout)
+
+    def test_busy_seen_until_next_poll(self):
+        device_id = self.controller.connect_device(self.emulator.connection_infos()[0])
+        self.controller.active_device = device_id
+        self.assertTrue(wait_for(lambda: self.fleet.is_connected(device_id)))
+        self.fleet.send(device_id, 'LED1_ON').result(5)
+
+        polled_at = time.monotonic()
+        self.assertTrue(self.status.refresh().result(5)[device_id]['isWatering'])
+        with mock.patch.object(status_module.time, 'monotonic',
+                               return_value=polled_at + POLL_INTERVAL - 0.1):
+            self.assertTrue(self.controller.device_busy())
+
+
+if __name__ == '__main__':
+    unittest.main()